@@ -0,0 +1,173 @@
+"""Controle de admissão por classe de endpoint.
+
+Endpoints pesados (dossiês, plano de ação, fotos, análise de satélite, exportação,
+importação e pré-carga geográfica) e leves (fundos, documentos, formulários) têm pools
+de concorrência separados, cada um com fila de espera limitada. Uma rajada de dossiês ocupa só o pool pesado: health
+checks e consultas seguem rápidos. Fila cheia (ou espera além do limite) → 503 imediato com Retry-After.
+"""
+
+import asyncio
+import collections
+import json
+import math
+import os
+import re
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+from backend import logs
+from backend.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+ENABLED = os.getenv("ADMISSION_CONTROL", "true").lower() in {"1", "true", "yes"}
+QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "30"))
+
+# (pool, método, padrão do caminho); o primeiro que casar define a classe
+_ROUTES: List[Tuple[str, str, re.Pattern]] = [
+    ("exempt", "GET", re.compile(r"^/(metrics)?$")),
+    ("heavy", "POST", re.compile(r"^/processos/prevencao/\d+/(fotos|fotos/stream|gerar-documentos)$")),
+    ("heavy", "GET", re.compile(r"^/processos/prevencao/\d+/documentos/[^/]+/preview$")),
+    ("heavy", "POST", re.compile(r"^/acao/plano(/stream)?$")),
+    ("heavy", "POST", re.compile(r"^/api/gemini/analyze-residence$")),
+    # Exportação lê o banco inteiro por uma conexão durante todo o download
+    ("heavy", "GET", re.compile(r"^/processos/prevencao/exportar$")),
+    # Importação em lote: lê até IMPORT_MAX_MB e insere milhares de processos
+    ("heavy", "POST", re.compile(r"^/processos/prevencao/importar$")),
+    # Pré-carga do cache geográfico: várias fontes por cidade, Nominatim a 1 req/s
+    ("heavy", "POST", re.compile(r"^/geo/preload$")),
+]
+
+log = logs.get_logger("admission")
+
+
+class Pool:
+    """Semáforo com fila limitada (FIFO). Vive no event loop do servidor."""
+
+    def __init__(self, name: str, limit: int, max_queue: int) -> None:
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        # Média móvel do tempo de serviço, para estimar o Retry-After
+        self.avg_service_s = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _publish(self) -> None:
+        ADMISSION_ACTIVE.set(self.active, pool=self.name)
+        ADMISSION_QUEUE_DEPTH.set(self.waiting, pool=self.name)
+
+    async def acquire(self, timeout: float) -> Optional[str]:
+        """Ocupa uma vaga; retorna None em caso de sucesso ou o motivo da recusa."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._publish()
+            return None
+        if self.waiting >= self.max_queue:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga chegou junto com o timeout: devolve para o próximo
+                self.release(0.0)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if not waiter.done():
+                waiter.cancel()
+            self._publish()
+
+    def release(self, service_s: float) -> None:
+        if service_s > 0:
+            self.avg_service_s = 0.8 * self.avg_service_s + 0.2 * service_s
+        # Passa a vaga direto ao próximo da fila (active não muda)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+    def retry_after(self) -> int:
+        estimate = self.avg_service_s * (self.waiting + 1) / self.limit
+        return int(min(60, max(1, math.ceil(estimate))))
+
+
+_pools: Dict[str, Pool] = {
+    "heavy": Pool("heavy", _env_int("ADMISSION_HEAVY_CONCURRENCY", 4), _env_int("ADMISSION_HEAVY_QUEUE", 16)),
+    "light": Pool("light", _env_int("ADMISSION_LIGHT_CONCURRENCY", 32), _env_int("ADMISSION_LIGHT_QUEUE", 128)),
+}
+
+
+def classify(method: str, path: str) -> str:
+    for pool, route_method, pattern in _ROUTES:
+        if method == route_method and pattern.match(path):
+            return pool
+    return "light"
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return {
+        name: {"active": p.active, "waiting": p.waiting, "limit": p.limit, "max_queue": p.max_queue}
+        for name, p in _pools.items()
+    }
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: a vaga é mantida até o fim da resposta (inclusive streaming)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope.get("method", ""), scope.get("path", ""))
+        pool = _pools.get(name)
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await pool.acquire(QUEUE_TIMEOUT_S)
+        if reason is not None:
+            ADMISSION_REJECTED.inc(pool=name, reason=reason)
+            retry_after = pool.retry_after()
+            log.warning("Requisição recusada pelo controle de admissão", extra={"pool": name, "reason": reason, "path": scope.get("path")})
+            body = json.dumps({"detail": "Servidor ocupado, tente novamente em instantes", "reason": reason}).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                    (b"retry-after", str(retry_after).encode("ascii")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(time.perf_counter() - start)
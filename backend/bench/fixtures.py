@@ -0,0 +1,50 @@
+import json
+import random
+import struct
+import zlib
+
+
+def sample_png(seed: int, size: int = 96) -> bytes:
+    """PNG RGB válido e determinístico: grade de blocos de cores aleatórias por semente, então
+    sementes diferentes geram hashes perceptuais distantes (não são vistas como a mesma foto)."""
+    rng = random.Random(seed)
+    # 9x8 blocos: a mesma grade que o dHash compara (ver photo_dedup.compute_phash)
+    cells = [[bytes(rng.randrange(256) for _ in range(3)) for _ in range(9)] for _ in range(8)]
+    rows = []
+    for y in range(size):
+        cell_row = cells[y * 8 // size]
+        row = bytearray(b"\x00")
+        for x in range(size):
+            row += cell_row[x * 9 // size]
+        rows.append(bytes(row))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"".join(rows))) + chunk(b"IEND", b"")
+
+
+def sample_context(zone_id: int) -> str:
+    """Contexto de zona no formato enviado pelo frontend ao criar o processo."""
+    rng = random.Random(zone_id)
+    return json.dumps({
+        "zone": {
+            "id": zone_id,
+            "level": rng.choice(["Muito Alto", "Alto", "Médio"]),
+            "risk_score": round(rng.uniform(0.4, 0.95), 2),
+            "coordinates": {"lat": -23.5 + rng.uniform(-1, 1), "lon": -46.6 + rng.uniform(-1, 1)},
+            "uf": "SP",
+        },
+        "residences": {"count": rng.randint(5, 80)},
+        "financials": {"custo_prevencao_total": rng.randint(50, 900) * 1000},
+    }, ensure_ascii=False)
+
+
+def sample_form(index: int) -> dict:
+    return {
+        "responsavel": f"Inspetor {index}",
+        "data_vistoria": "2025-01-15",
+        "observacoes": "Trincas em muros de contenção e drenagem obstruída.",
+        "acao_imediata": "Interdição parcial e limpeza de canaletas.",
+    }
@@ -0,0 +1,289 @@
+"""Teste de carga concorrente: simula vistorias em massa após chuva forte.
+
+Vários inspetores virtuais executam ao mesmo tempo o fluxo completo (criar processo →
+enviar N fotos → formulário → gerar documentos) contra um servidor real. A carga sobe em
+degraus de usuários simultâneos; para cada degrau são medidos vazão, latência, erros e o
+tempo gasto no banco (inclui espera por lock no SQLite), a partir de /metrics.
+
+Uso (a partir da raiz do repositório):
+
+    # sobe o servidor com o stub do Gemini e banco temporário (SQLite)
+    python -m backend.bench.load --spawn --users 1,2,4,8,16 --duration 20
+
+    # mesmo cenário em Postgres (driver instalado no ambiente)
+    python -m backend.bench.load --spawn --database-url postgresql+psycopg://user:pw@localhost/clima
+
+    # contra um servidor já em execução, apontado para o stub HTTP do Gemini
+    # (python -m backend.bench.stub_llm --port 8089; GEMINI_API_ENDPOINT=http://127.0.0.1:8089)
+    python -m backend.bench.load --base-url http://localhost:8000
+"""
+
+import argparse
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from backend.bench import fixtures, report
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_METRIC_LINE = re.compile(r'^([a-zA-Z_:][\w:]*)(\{[^}]*\})?\s+([-+\d.eE]+|NaN|\+Inf)$')
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Teste de carga do pipeline de prevenção")
+    parser.add_argument("--base-url", help="Servidor já em execução (senão use --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Sobe um uvicorn local com o stub do Gemini")
+    parser.add_argument("--database-url", help="Com --spawn; padrão: SQLite temporário")
+    parser.add_argument("--workers", type=int, default=1, help="Workers do uvicorn com --spawn")
+    parser.add_argument("--stub", default="latency_ms=80,jitter_ms=30,failure_rate=0.02", help="Parâmetros do stub HTTP do Gemini com --spawn")
+    parser.add_argument("--users", default="1,2,4,8,16", help="Degraus de usuários simultâneos")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos por degrau")
+    parser.add_argument("--photos", type=int, default=4)
+    parser.add_argument("--fund", default="FNMC")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--error-threshold", type=float, default=0.05, help="Taxa de erro que caracteriza saturação")
+    parser.add_argument("--output", help="Grava o resultado completo em JSON")
+    return parser.parse_args(argv)
+
+
+def scrape_metrics(client: httpx.Client) -> Dict[Tuple[str, str], float]:
+    """Lê /metrics (formato texto do Prometheus) como {(nome, labels): valor}."""
+    values: Dict[Tuple[str, str], float] = {}
+    try:
+        text = client.get("/metrics").text
+    except httpx.HTTPError:
+        return values
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match:
+            values[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return values
+
+
+def _db_delta(before: Dict[Tuple[str, str], float], after: Dict[Tuple[str, str], float]) -> Dict[str, float]:
+    def total(name: str, label_filter: str = "") -> float:
+        return sum(v - before.get(k, 0.0) for k, v in after.items() if k[0] == name and label_filter in k[1])
+
+    writes_s = sum(total("climaseguro_db_query_duration_seconds_sum", f'statement="{verb}"') for verb in ("INSERT", "UPDATE", "DELETE"))
+    writes_n = sum(total("climaseguro_db_query_duration_seconds_count", f'statement="{verb}"') for verb in ("INSERT", "UPDATE", "DELETE"))
+    return {
+        "db_seconds": round(total("climaseguro_db_query_duration_seconds_sum"), 3),
+        "db_queries": int(total("climaseguro_db_query_duration_seconds_count")),
+        # Com SQLite a espera por lock acontece dentro da própria escrita (busy timeout)
+        "db_write_mean_ms": round(1000 * writes_s / writes_n, 2) if writes_n else 0.0,
+        "db_lock_errors": int(total("climaseguro_db_errors_total", 'kind="locked"')),
+    }
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_kinds: Dict[str, int] = defaultdict(int)
+        self.pipelines = 0
+
+    def record(self, step: str, elapsed: float, error: Optional[str]) -> None:
+        with self.lock:
+            if error is None:
+                self.latencies[step].append(elapsed)
+            else:
+                self.errors[step] += 1
+                self.error_kinds[error] += 1
+
+
+def _pipeline(client: httpx.Client, stats: _Stats, user: int, seq: int, args: argparse.Namespace) -> None:
+    def step(name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            stats.record(name, time.perf_counter() - start, type(e).__name__)
+            return None
+        error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+        stats.record(name, time.perf_counter() - start, error)
+        return response if error is None else None
+
+    zone_id = user * 100000 + seq
+    r = step("create_process", "POST", "/processos/prevencao", data={"zone_id": zone_id, "context": fixtures.sample_context(zone_id)})
+    if r is None:
+        return
+    pid = r.json()["processId"]
+    files = [("files", (f"foto_{k}.png", fixtures.sample_png(zone_id * 10 + k), "image/png")) for k in range(args.photos)]
+    if step("upload_photos", "POST", f"/processos/prevencao/{pid}/fotos", files=files) is None:
+        return
+    if step("submit_form", "POST", f"/processos/prevencao/{pid}/formulario", data=fixtures.sample_form(seq)) is None:
+        return
+    if step("generate_documents", "POST", f"/processos/prevencao/{pid}/gerar-documentos", data={"fundo": args.fund}) is None:
+        return
+    with stats.lock:
+        stats.pipelines += 1
+
+
+def _run_stage(base_url: str, users: int, args: argparse.Namespace) -> Dict[str, object]:
+    stats = _Stats()
+    stop_at = time.monotonic() + args.duration
+
+    def worker(user: int) -> None:
+        with httpx.Client(base_url=base_url, timeout=args.timeout) as client:
+            seq = 0
+            while time.monotonic() < stop_at:
+                _pipeline(client, stats, user, seq, args)
+                seq += 1
+
+    with httpx.Client(base_url=base_url, timeout=args.timeout) as probe:
+        before = scrape_metrics(probe)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(users * 1000 + u,), daemon=True) for u in range(users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+        after = scrape_metrics(probe)
+
+    steps = {
+        name: report.summarize(stats.latencies.get(name, []), stats.errors.get(name, 0), wall)
+        for name in ("create_process", "upload_photos", "submit_form", "generate_documents")
+    }
+    requests_ok = sum(s["count"] for s in steps.values())
+    requests_err = sum(s["errors"] for s in steps.values())
+    return {
+        "users": users,
+        "wall_seconds": round(wall, 2),
+        "pipelines": stats.pipelines,
+        "pipelines_per_s": round(stats.pipelines / wall, 3),
+        "error_rate": round(requests_err / (requests_ok + requests_err), 4) if requests_ok + requests_err else 0.0,
+        "error_kinds": dict(stats.error_kinds),
+        "steps": steps,
+        **_db_delta(before, after),
+    }
+
+
+def find_saturation(stages: List[Dict[str, object]], error_threshold: float) -> Optional[Dict[str, object]]:
+    """Primeiro degrau em que mais usuários não trazem ao menos 10% a mais de vazão, ou em que
+    a taxa de erro passa do limite. Retorna o degrau e o motivo."""
+    for previous, stage in zip(stages, stages[1:]):
+        if stage["error_rate"] > error_threshold:
+            return {"users": stage["users"], "reason": f"taxa de erro {stage['error_rate']:.1%}"}
+        if stage["pipelines_per_s"] < previous["pipelines_per_s"] * 1.10:
+            return {"users": previous["users"], "reason": f"vazão estagnou ({previous['pipelines_per_s']} → {stage['pipelines_per_s']} pipelines/s)"}
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _spawn_stub(args: argparse.Namespace, workdir: str) -> Tuple[subprocess.Popen, str]:
+    """Sobe o stub do Gemini como servidor HTTP separado; retorna (processo, endpoint)."""
+    port = _free_port()
+    cmd = [sys.executable, "-m", "backend.bench.stub_llm", "--port", str(port)]
+    for item in args.stub.split(","):
+        key, _, value = item.partition("=")
+        if key.strip() and value.strip():
+            cmd += ["--" + key.strip().replace("_", "-"), value.strip()]
+    log = open(os.path.join(workdir, "stub.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT)
+    endpoint = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Stub do Gemini encerrou na inicialização; ver {workdir}/stub.log")
+        try:
+            if httpx.get(endpoint + "/v1beta/models", timeout=1).status_code == 200:
+                return proc, endpoint
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Stub do Gemini não respondeu em 30s")
+
+
+def _spawn_server(args: argparse.Namespace, workdir: str, gemini_endpoint: str) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir}/load.db",
+        "STORAGE_DIR": os.path.join(workdir, "storage"),
+        "FUND_DATA_DIR": env.get("FUND_DATA_DIR", REPO_ROOT),
+        "GEMINI_API_ENDPOINT": gemini_endpoint,
+        "GEMINI_API_KEY": "stub",
+        "RESET_DB_ON_STARTUP": "true",
+    })
+    env.setdefault("GEMINI_RPM", "100000")
+    env.setdefault("GEMINI_BURST", "1000")
+    cmd = [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"]
+    log = open(os.path.join(workdir, "server.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou na inicialização; ver {workdir}/server.log")
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Servidor não respondeu em 60s")
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    if not args.base_url and not args.spawn:
+        print("Informe --base-url ou --spawn")
+        return 2
+    workdir = tempfile.mkdtemp(prefix="climaseguro-load-")
+    procs: List[subprocess.Popen] = []
+    try:
+        base_url = args.base_url
+        if args.spawn:
+            stub_proc, gemini_endpoint = _spawn_stub(args, workdir)
+            procs.append(stub_proc)
+            proc, base_url = _spawn_server(args, workdir, gemini_endpoint)
+            procs.append(proc)
+        stages = []
+        for users in [int(u) for u in args.users.split(",") if u.strip()]:
+            stage = _run_stage(base_url, users, args)
+            stages.append(stage)
+            print(
+                f"{users:>4} usuários: {stage['pipelines_per_s']:>7.2f} pipelines/s, "
+                f"p95 gerar-documentos {stage['steps']['generate_documents']['p95_ms']:>8.1f}ms, "
+                f"erros {stage['error_rate']:.1%}, banco {stage['db_seconds']}s "
+                f"(escrita média {stage['db_write_mean_ms']}ms, locks {stage['db_lock_errors']})"
+            )
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    saturation = find_saturation(stages, args.error_threshold)
+    if saturation:
+        print(f"\nSaturação em ~{saturation['users']} usuários simultâneos: {saturation['reason']}")
+    else:
+        print("\nSem saturação nos degraus testados")
+    for stage in stages:
+        if stage["error_kinds"]:
+            print(f"  erros com {stage['users']} usuários: {stage['error_kinds']}")
+    if args.output:
+        report.save_json(args.output, {"params": vars(args), "stages": stages, "saturation": saturation})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,73 @@
+import json
+import math
+import os
+from typing import Dict, List, Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Percentil pelo método nearest-rank (valores já ordenados)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, wall_seconds: float) -> Dict[str, float]:
+    values = sorted(latencies)
+    total = len(values) + errors
+    return {
+        "count": len(values),
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(len(values) / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        "mean_ms": round(1000 * sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 50), 2),
+        "p95_ms": round(1000 * percentile(values, 95), 2),
+        "p99_ms": round(1000 * percentile(values, 99), 2),
+    }
+
+
+def print_table(endpoints: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+    header = f"{'endpoint':<24}{'n':>6}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline is not None:
+        header += f"{'Δp95':>10}"
+    print(header)
+    for name, s in endpoints.items():
+        line = f"{name:<24}{s['count']:>6}{s['errors']:>6}{s['throughput_rps']:>10.2f}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+        if baseline is not None:
+            base = baseline.get(name)
+            line += f"{_delta(base['p95_ms'], s['p95_ms']) if base else 'novo':>10}"
+        print(line)
+
+
+def _delta(before: float, after: float) -> str:
+    if before <= 0:
+        return "-"
+    return f"{100.0 * (after - before) / before:+.1f}%"
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance_pct: float) -> List[str]:
+    """Lista as regressões: p95 acima da tolerância ou taxa de erro maior que a da baseline."""
+    regressions: List[str] = []
+    for name, s in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] > 0 and s["p95_ms"] > base["p95_ms"] * (1 + tolerance_pct / 100.0):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms → {s['p95_ms']:.1f}ms ({_delta(base['p95_ms'], s['p95_ms'])})")
+        if s["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{name}: taxa de erro {base['error_rate']:.2%} → {s['error_rate']:.2%}")
+    return regressions
+
+
+def load_json(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, payload: dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,177 @@
+"""Benchmark reprodutível do pipeline de prevenção, com a app FastAPI rodando no próprio processo.
+
+Cada iteração percorre: criar processo → enviar fotos → formulário → preflight →
+gerar-documentos → baixar cada documento. O Gemini é substituído por um stub local
+(ver `stub_llm`) com latência e taxa de falha configuráveis.
+
+Uso (a partir da raiz do repositório):
+
+    python -m backend.bench.run --iterations 30 --latency-ms 40 --failure-rate 0.02
+    python -m backend.bench.run --save-baseline          # grava a baseline
+    python -m backend.bench.run --compare                # compara com a baseline (exit 1 se regredir)
+"""
+
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from backend.bench import report
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "baseline.json")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de prevenção (stub do Gemini)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2, help="Iterações descartadas antes da medição")
+    parser.add_argument("--photos", type=int, default=3, help="Fotos enviadas por processo")
+    parser.add_argument("--fund", default="FNMC")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latência simulada de cada chamada ao modelo")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fração de chamadas ao modelo que falham (503)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="Padrão: SQLite em diretório temporário")
+    parser.add_argument("--output", help="Grava o resultado completo em JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=20.0, help="Aumento máximo de p95 (%%) antes de acusar regressão")
+    return parser.parse_args(argv)
+
+
+def _configure_env(args: argparse.Namespace, workdir: str) -> None:
+    # Precisa acontecer antes de importar backend.main (banco e storage leem o ambiente no import)
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{workdir}/bench.db"
+    os.environ["STORAGE_DIR"] = os.path.join(workdir, "storage")
+    os.environ.setdefault("FUND_DATA_DIR", REPO_ROOT)
+    os.environ["GEMINI_API_KEY"] = "stub"
+    # Sem limite de taxa do provedor: o benchmark mede o backend, não a cota
+    os.environ.setdefault("GEMINI_RPM", "100000")
+    os.environ.setdefault("GEMINI_BURST", "1000")
+    os.environ.setdefault("GEMINI_RETRY_BASE_DELAY_S", "0.05")
+
+
+def _check_fixtures(seeds: List[int], workdir: str) -> None:
+    """As fotos de teste precisam ser distintas para o dedup (photo_dedup): senão upload_photos
+    mede descrições reaproveitadas em vez de chamadas ao modelo."""
+    from backend.bench import fixtures
+    from backend.services import photo_dedup
+
+    hashes = {}
+    for seed in seeds:
+        path = os.path.join(workdir, f"fixture_{seed}.png")
+        with open(path, "wb") as f:
+            f.write(fixtures.sample_png(seed))
+        hashes[seed] = photo_dedup.compute_phash(path)
+    if None in hashes.values():
+        return  # sem Pillow não há dedup
+    for (a, hash_a), (b, hash_b) in itertools.combinations(hashes.items(), 2):
+        distance = photo_dedup.hamming(hash_a, hash_b)
+        if distance <= photo_dedup.MAX_DISTANCE:
+            raise RuntimeError(f"Fotos de teste {a} e {b} a {distance} bits: o dedup as trataria como a mesma foto")
+
+
+def _run(args: argparse.Namespace) -> Dict[str, object]:
+    from fastapi.testclient import TestClient
+
+    from backend.bench import fixtures
+    from backend.bench.stub_llm import StubGenAI, install
+    from backend.main import app
+
+    stub = install(StubGenAI(args.latency_ms, args.jitter_ms, args.failure_rate, args.seed))
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+
+    def measure(name: str, fn: Callable[[], object], record: bool):
+        start = time.perf_counter()
+        response = fn()
+        elapsed = time.perf_counter() - start
+        if record:
+            if response.status_code < 400:
+                latencies[name].append(elapsed)
+            else:
+                errors[name] += 1
+        return response
+
+    with TestClient(app) as client:
+        wall = 0.0
+        for i in range(args.warmup + args.iterations):
+            record = i >= args.warmup
+            start = time.perf_counter()
+            zone_id = 1000 + i
+            r = measure("create_process", lambda: client.post(
+                "/processos/prevencao", data={"zone_id": zone_id, "context": fixtures.sample_context(zone_id)}), record)
+            if r.status_code >= 400:
+                continue
+            pid = r.json()["processId"]
+            files = [("files", (f"foto_{k}.png", fixtures.sample_png(i * 100 + k), "image/png")) for k in range(args.photos)]
+            measure("upload_photos", lambda: client.post(f"/processos/prevencao/{pid}/fotos", files=files), record)
+            measure("submit_form", lambda: client.post(f"/processos/prevencao/{pid}/formulario", data=fixtures.sample_form(i)), record)
+            measure("preflight", lambda: client.post(f"/processos/prevencao/{pid}/preflight", json={"fund": args.fund}), record)
+            r = measure("generate_documents", lambda: client.post(
+                f"/processos/prevencao/{pid}/gerar-documentos", data={"fundo": args.fund}), record)
+            if r.status_code < 400:
+                for doc in r.json()["documents"]:
+                    measure("get_document", lambda: client.get(doc["url"]), record)
+            if record:
+                wall += time.perf_counter() - start
+
+    endpoints = {
+        name: report.summarize(latencies.get(name, []), errors.get(name, 0), sum(latencies.get(name, [])))
+        for name in ("create_process", "upload_photos", "submit_form", "preflight", "generate_documents", "get_document")
+    }
+    return {
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "save_baseline", "compare", "tolerance")},
+        "pipelines_per_s": round(args.iterations / wall, 3) if wall else 0.0,
+        "model_calls": stub.calls,
+        "model_failures": stub.failures,
+        "endpoints": endpoints,
+    }
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="climaseguro-bench-")
+    try:
+        _configure_env(args, workdir)
+        _check_fixtures([i * 100 + k for i in range(args.warmup + args.iterations) for k in range(args.photos)], workdir)
+        result = _run(args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = report.load_json(args.baseline) if args.compare else None
+    print(f"\n{args.iterations} pipelines, {result['pipelines_per_s']} pipelines/s, "
+          f"{result['model_calls']} chamadas ao modelo ({result['model_failures']} falhas simuladas)\n")
+    report.print_table(result["endpoints"], baseline["endpoints"] if baseline else None)
+
+    if args.output:
+        report.save_json(args.output, result)
+    if args.save_baseline:
+        report.save_json(args.baseline, result)
+        print(f"\nBaseline gravada em {args.baseline}")
+    if args.compare:
+        if baseline is None:
+            print(f"\nBaseline não encontrada em {args.baseline}; rode com --save-baseline primeiro")
+            return 2
+        if baseline.get("params") != result["params"]:
+            print("\nAviso: parâmetros diferentes da baseline; a comparação pode não ser válida")
+        regressions = report.compare(result["endpoints"], baseline["endpoints"], args.tolerance)
+        if regressions:
+            print("\nRegressões:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\nSem regressões em relação à baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
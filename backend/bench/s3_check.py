@@ -0,0 +1,146 @@
+"""Verificação do driver S3 (backend/storage_s3.py) contra um serviço compatível.
+
+Confere o caminho que o armazenamento local não exercita: upload em partes com a cópia
+local feita durante o envio (`put_stream`), tamanho, leituras parciais por Range, download
+pela URL assinada, nova leitura depois de limpar o cache do nó e objeto inexistente.
+
+Uso (a partir da raiz do repositório):
+
+    # MinIO local
+    docker run -d -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 minio/minio server /data
+    S3_ENDPOINT_URL=http://127.0.0.1:9000 S3_ACCESS_KEY_ID=minio S3_SECRET_ACCESS_KEY=minio123 \\
+        python -m backend.bench.s3_check --bucket climaseguro-check
+
+    # sem serviço externo: servidor S3 simulado do moto (pip install "moto[server]")
+    python -m backend.bench.s3_check --moto
+
+Os objetos são gravados sob um prefixo próprio (s3-check-<id>/) e removidos ao final.
+Retorna 1 se alguma verificação falhar.
+"""
+
+import argparse
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import uuid
+from typing import List, Tuple
+
+import httpx
+
+
+# O S3 exige partes de pelo menos 5 MB (exceto a última)
+PART_MB = 5
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Verificação do armazenamento S3")
+    parser.add_argument("--bucket", default=os.getenv("S3_BUCKET") or "climaseguro-check", help="Criado se não existir")
+    parser.add_argument("--moto", action="store_true", help="Usa um servidor S3 simulado (moto) no próprio processo")
+    parser.add_argument("--size-mb", type=float, default=13, help="Tamanho do objeto enviado em partes")
+    parser.add_argument("--keep", action="store_true", help="Não remove os objetos gravados")
+    return parser.parse_args(argv)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _configure_env(args: argparse.Namespace, workdir: str, prefix: str) -> None:
+    # Precisa acontecer antes de importar backend.storage (o ambiente é lido no import)
+    os.environ["STORAGE_DIR"] = os.path.join(workdir, "storage")
+    os.environ["STORAGE_BACKEND"] = "s3"
+    os.environ["S3_BUCKET"] = args.bucket
+    os.environ["S3_PREFIX"] = prefix
+    os.environ["S3_MULTIPART_THRESHOLD_MB"] = str(PART_MB)
+    os.environ["S3_MULTIPART_CHUNK_MB"] = str(PART_MB)
+
+
+def _run(args: argparse.Namespace, prefix: str) -> List[Tuple[str, bool, str]]:
+    from backend import storage
+    from backend.storage_s3 import S3Storage, _client
+
+    client = _client()
+    try:
+        client.head_bucket(Bucket=args.bucket)
+    except Exception:
+        client.create_bucket(Bucket=args.bucket)
+    backend = storage.get_backend()
+    assert isinstance(backend, S3Storage)
+
+    checks: List[Tuple[str, bool, str]] = []
+    data = os.urandom(int(args.size_mb * 1024 * 1024))
+    location, local = backend.put_stream(io.BytesIO(data), "images/check/original.bin", "application/octet-stream")
+    with open(local, "rb") as f:
+        checks.append(("put_stream: cópia local igual ao enviado", f.read() == data, local))
+    head = client.head_object(Bucket=args.bucket, Key=f"{prefix}images/check/original.bin")
+    multipart = len(data) > PART_MB * 1024 * 1024
+    checks.append(("put_stream: objeto no bucket", int(head["ContentLength"]) == len(data), location))
+    if multipart:
+        # ETag de upload em partes termina em -<número de partes>
+        checks.append(("put_stream: upload em partes", "-" in head["ETag"], head["ETag"]))
+    checks.append(("size", backend.size(location) == len(data), str(backend.size(location))))
+
+    middle = b"".join(backend.read(location, 1000, 1999))
+    checks.append(("read: intervalo fechado (Range)", middle == data[1000:2000], f"{len(middle)} bytes"))
+    tail = b"".join(backend.read(location, len(data) - 10))
+    checks.append(("read: até o fim", tail == data[-10:], f"{len(tail)} bytes"))
+
+    url = backend.presigned_url(location, "original.bin", "application/octet-stream")
+    response = httpx.get(url, timeout=60)
+    checks.append(("presigned_url: download direto", response.status_code == 200 and response.content == data, f"HTTP {response.status_code}"))
+    ranged = httpx.get(url, headers={"Range": "bytes=0-99"}, timeout=60)
+    checks.append(("presigned_url: Range", ranged.status_code == 206 and ranged.content == data[:100], f"HTTP {ranged.status_code}"))
+
+    shutil.rmtree(storage.CACHE_DIR)
+    cached = storage.local_path(location)
+    with open(cached or os.devnull, "rb") as f:
+        checks.append(("local_path: novo download após limpar o cache", cached is not None and f.read() == data, str(cached)))
+
+    missing = f"s3://{args.bucket}/{prefix}nao/existe.bin"
+    checks.append(("objeto inexistente", backend.size(missing) is None and backend.local_path(missing) is None, missing))
+
+    if not args.keep:
+        listed = client.list_objects_v2(Bucket=args.bucket, Prefix=prefix).get("Contents", [])
+        for obj in listed:
+            client.delete_object(Bucket=args.bucket, Key=obj["Key"])
+    return checks
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="climaseguro-s3-")
+    prefix = f"s3-check-{uuid.uuid4().hex[:8]}/"
+    server = None
+    try:
+        if args.moto:
+            from moto.server import ThreadedMotoServer
+
+            port = _free_port()
+            server = ThreadedMotoServer(port=port, verbose=False)
+            server.start()
+            os.environ["S3_ENDPOINT_URL"] = f"http://127.0.0.1:{port}"
+            os.environ.setdefault("S3_ACCESS_KEY_ID", "moto")
+            os.environ.setdefault("S3_SECRET_ACCESS_KEY", "moto")
+        _configure_env(args, workdir, prefix)
+        checks = _run(args, prefix)
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    target = "moto" if args.moto else (os.getenv("S3_ENDPOINT_URL") or "AWS")
+    print(f"S3 ({target}), bucket {args.bucket}, prefixo {prefix}")
+    for name, ok, detail in checks:
+        print(f"  {'ok    ' if ok else 'FALHOU'} {name} ({detail})")
+    failed = sum(1 for _, ok, _ in checks if not ok)
+    print(f"{len(checks) - failed}/{len(checks)} verificações ok")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
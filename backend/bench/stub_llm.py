@@ -0,0 +1,191 @@
+"""Substituto local e determinístico do `google.generativeai` para benchmarks.
+
+Latência e taxa de falha são configuráveis; as falhas são decididas por um gerador com
+semente fixa, então duas execuções com os mesmos parâmetros se comportam igual.
+
+Dois modos: `install()` troca o cliente dentro do processo (benchmark em processo único,
+ver bench/run.py); ou um servidor HTTP com a mesma API REST do Gemini, para um servidor
+real apontado para ele via GEMINI_API_ENDPOINT (ver bench/load.py):
+
+    python -m backend.bench.stub_llm --port 8089 --latency-ms 80 --jitter-ms 30 --failure-rate 0.02
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 GEMINI_API_KEY=stub uvicorn backend.main:app
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional
+
+
+class ServiceUnavailable(Exception):
+    """Mesmo nome da exceção transitória do google.api_core (tratada como retentável)."""
+
+
+def _reply_text(images: int) -> str:
+    """Resposta simulada: descrição/contagem para requisições com imagens, documento para texto."""
+    if images:
+        text = "Imagem simulada: edificações próximas a encosta, sem sinais visíveis de ruptura.\nTOTAL: 12 residências"
+        if images > 1:
+            # Descrição em lote: uma entrada por imagem, no formato pedido pelo prompt
+            text = json.dumps({"imagens": [{"indice": i, "descricao": text} for i in range(1, images + 1)]}, ensure_ascii=False)
+        return text
+    return (
+        "1. Introdução\nDocumento gerado pelo modelo simulado para benchmark.\n"
+        "2. Conteúdo\n" + ("Texto técnico de exemplo. " * 40) + "\n3. Conclusão\nSem pendências."
+    )
+
+
+class _Response:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class _Model:
+    def __init__(self, name: str, stub: "StubGenAI") -> None:
+        self.model_name = name
+        self._stub = stub
+
+    def generate_content(self, contents: Any, stream: bool = False, request_options: Optional[dict] = None, **kwargs):
+        self._stub._simulate()
+        images = sum(1 for part in contents if isinstance(part, dict)) if isinstance(contents, list) else 0
+        text = _reply_text(images)
+        if stream:
+            return iter([_Response(chunk) for chunk in text.split("\n")])
+        return _Response(text)
+
+
+class _ModelInfo:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.supported_generation_methods = ["generateContent"]
+
+
+class StubGenAI:
+    """Expõe a mesma superfície usada em `backend.services.gemini` (configure, list_models, GenerativeModel)."""
+
+    MODELS = ["models/gemini-1.5-flash", "models/gemini-1.5-pro"]
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 0.0, failure_rate: float = 0.0, seed: int = 42) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def configure(self, **kwargs) -> None:
+        pass
+
+    def list_models(self, **kwargs) -> List[_ModelInfo]:
+        return [_ModelInfo(name) for name in self.MODELS]
+
+    def GenerativeModel(self, name: str) -> _Model:
+        return _Model(name, self)
+
+    def _simulate(self) -> None:
+        with self._lock:
+            self.calls += 1
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000.0)
+        if fail:
+            raise ServiceUnavailable("503 modelo simulado indisponível")
+
+
+def install(stub: StubGenAI) -> StubGenAI:
+    """Substitui o cliente do Gemini usado pelo backend pelo stub."""
+    from backend.services import gemini
+
+    os.environ.setdefault("GEMINI_API_KEY", "stub")
+    gemini.genai = stub
+    return stub
+
+
+_GENERATE_PATH = re.compile(r"^/v1beta/(models/[^/:]+):(generateContent|streamGenerateContent)$")
+
+
+def _candidate(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}]}
+
+
+def make_server(stub: StubGenAI, host: str = "127.0.0.1", port: int = 8089) -> ThreadingHTTPServer:
+    """Servidor HTTP com os endpoints REST do Gemini usados pelo backend (v1beta):
+    GET /v1beta/models, POST .../{modelo}:generateContent e :streamGenerateContent."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: Any) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/v1beta/models":
+                self._send(404, {"error": {"code": 404, "message": self.path, "status": "NOT_FOUND"}})
+                return
+            models = [{"name": info.name, "supportedGenerationMethods": info.supported_generation_methods} for info in stub.list_models()]
+            self._send(200, {"models": models})
+
+        def do_POST(self) -> None:
+            match = _GENERATE_PATH.match(self.path.split("?")[0])
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if match is None:
+                self._send(404, {"error": {"code": 404, "message": self.path, "status": "NOT_FOUND"}})
+                return
+            try:
+                stub._simulate()
+            except ServiceUnavailable as e:
+                self._send(503, {"error": {"code": 503, "message": str(e), "status": "UNAVAILABLE"}})
+                return
+            request = json.loads(body or b"{}")
+            parts = [part for content in request.get("contents", []) for part in content.get("parts", [])]
+            text = _reply_text(sum(1 for part in parts if "inlineData" in part or "inline_data" in part))
+            if match.group(2) == "streamGenerateContent":
+                # Sem alt=sse, o cliente REST lê um array JSON de respostas parciais
+                self._send(200, [_candidate(chunk + "\n") for chunk in text.split("\n")])
+            else:
+                self._send(200, _candidate(text))
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Stub HTTP do Gemini para testes de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    stub = StubGenAI(args.latency_ms, args.jitter_ms, args.failure_rate, args.seed)
+    server = make_server(stub, args.host, args.port)
+    print(f"Stub do Gemini em http://{args.host}:{server.server_address[1]} (GEMINI_API_ENDPOINT)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"{stub.calls} chamadas, {stub.failures} falhas simuladas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,6 +2,8 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from backend.metrics import instrument_engine
+
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./climaseguro.db")
 
@@ -10,6 +12,8 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
 )
 
+instrument_engine(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -1,6 +1,14 @@
+import json
+from typing import List
+
 from sqlalchemy import text
-from .database import engine
-from .models import Base
+from .database import SessionLocal, engine
+from . import logs
+from .funds.matching import level_key
+from .models import Base, PreventionProcess
+
+
+log = logs.get_logger("dbtools")
 
 
 def reset_db() -> None:
@@ -9,3 +17,97 @@ def reset_db() -> None:
     Base.metadata.create_all(bind=engine)
 
 
+
+
+def upgrade_schema() -> List[str]:
+    """Complementa tabelas já existentes com colunas anuláveis e índices novos dos modelos.
+
+    `create_all` só cria tabelas ausentes; bancos criados por versões anteriores recebem aqui
+    as colunas adicionadas depois. Retorna as colunas criadas ("tabela.coluna").
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added: List[str] = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns or not column.nullable:
+                    continue
+                ddl = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}'))
+                log.info("Coluna adicionada", extra={"table": table.name, "column": column.name})
+                added.append(f"{table.name}.{column.name}")
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(bind=conn)
+    return added
+
+
+def backfill_risk_level(batch_size: int = 1000) -> int:
+    """Mantém prevention_process.risk_level coerente com o context_json.
+
+    Reescreve na forma canônica (level_key) os valores gravados por versões anteriores e
+    preenche as linhas com risk_level nulo e contexto presente (bancos anteriores à coluna,
+    gravações fora de set_context). Pensado para rodar a cada inicialização: sem pendências,
+    custa uma consulta pelos valores distintos e outra pelo índice de risk_level.
+    """
+    normalized = 0
+    updated = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        # Poucos valores distintos: a normalização é um UPDATE por grafia antiga
+        stored = [
+            row[0]
+            for row in db.query(PreventionProcess.risk_level).filter(PreventionProcess.risk_level.isnot(None)).distinct()
+        ]
+        for value in stored:
+            canonical = level_key(value)[:50] or None
+            if canonical != value:
+                result = db.execute(
+                    text("UPDATE prevention_process SET risk_level = :canonical WHERE risk_level = :value"),
+                    {"canonical": canonical, "value": value},
+                )
+                normalized += result.rowcount or 0
+        db.commit()
+        while True:
+            rows = (
+                db.query(PreventionProcess.id, PreventionProcess.context_json)
+                .filter(
+                    PreventionProcess.id > last_id,
+                    PreventionProcess.risk_level.is_(None),
+                    PreventionProcess.context_json.isnot(None),
+                )
+                .order_by(PreventionProcess.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            changes = []
+            for row in rows:
+                try:
+                    level = PreventionProcess.risk_level_of(json.loads(row.context_json or "{}"))
+                except ValueError:
+                    continue
+                if level:
+                    changes.append({"id": row.id, "risk_level": level})
+            if changes:
+                # Só a coluna derivada: updated_at e o contexto ficam intactos
+                db.execute(
+                    text("UPDATE prevention_process SET risk_level = :risk_level WHERE id = :id"), changes
+                )
+                updated += len(changes)
+            last_id = rows[-1].id
+            db.commit()
+    finally:
+        db.close()
+    if normalized or updated:
+        log.info("risk_level preenchido", extra={"processes": updated, "normalized": normalized})
+    return normalized + updated
@@ -1,12 +1,51 @@
+import hashlib
 import json
 import os
-from typing import Optional
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 
-from backend.funds.schemas import FundsOverview, DocumentTemplatesOutline
+from backend import logs
+from backend.funds.schemas import FundsOverview, DocumentTemplatesOutline, FundItem, DocumentTemplate
+from backend.funds.matching import MatchIndex, build_index
 
 
-_overview_cache: Optional[FundsOverview] = None
-_templates_cache: Optional[DocumentTemplatesOutline] = None
+# Intervalo mínimo entre verificações de mtime dos JSONs (segundos)
+RELOAD_CHECK_INTERVAL_S = float(os.getenv("FUND_RELOAD_CHECK_S", "2"))
+
+log = logs.get_logger("funds.loader")
+
+
+@dataclass(frozen=True)
+class _FileStamp:
+    mtime_ns: int
+    size: int
+
+
+@dataclass
+class CatalogSnapshot:
+    """Versão imutável do catálogo: modelos, índices e respostas pré-serializadas.
+
+    É substituída por inteiro a cada recarga, então leitores nunca veem um estado parcial.
+    """
+
+    overview: Optional[FundsOverview] = None
+    templates: Optional[DocumentTemplatesOutline] = None
+    funds_by_key: Dict[str, FundItem] = field(default_factory=dict)
+    templates_by_key: Dict[Tuple[str, str], DocumentTemplate] = field(default_factory=dict)
+    overview_body: bytes = b""
+    overview_etag: str = ""
+    templates_body: bytes = b""
+    templates_etag: str = ""
+    match_index: MatchIndex = field(default_factory=MatchIndex)
+    stamps: Tuple[Optional[_FileStamp], Optional[_FileStamp]] = (None, None)
+
+
+_catalog: CatalogSnapshot = CatalogSnapshot()
+_reload_lock = threading.Lock()
+_last_check = 0.0
 
 
 def _read_json(path: str) -> dict:
@@ -14,35 +53,196 @@ def _read_json(path: str) -> dict:
         return json.load(f)
 
 
+def _paths() -> Tuple[str, str]:
+    root = os.path.abspath(os.getenv("FUND_DATA_DIR", "./"))
+    return (
+        os.path.join(root, "funds_overview.json"),
+        os.path.join(root, "document_templates_outline.json"),
+    )
+
+
+def _stamp(path: str) -> Optional[_FileStamp]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return _FileStamp(mtime_ns=st.st_mtime_ns, size=st.st_size)
+
+
+def normalize_key(value: str) -> str:
+    """Chave de busca: sem acentos, minúscula e apenas alfanuméricos ("FNMC" == "fnmc")."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(ch for ch in decomposed if ch.isalnum()).lower()
+
+
+def _fund_keys(fund: FundItem) -> List[str]:
+    """Nomes pelos quais um fundo pode ser encontrado: nome, aliases, siglas e prefixo antes de ' - '."""
+    names = [fund.fund_name] + list(fund.alias or [])
+    name = fund.fund_name
+    if " - " in name:
+        names.append(name.split(" - ", 1)[0])
+    start = name.find("(")
+    while start != -1:
+        end = name.find(")", start)
+        if end == -1:
+            break
+        names.append(name[start + 1:end])
+        start = name.find("(", end)
+    return [k for k in (normalize_key(n) for n in names) if k]
+
+
+def _serialize(payload: dict) -> Tuple[bytes, str]:
+    # Mesmo formato compacto do JSONResponse do Starlette
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return body, etag
+
+
+def _resolve_fund_key(funds_by_key: Dict[str, FundItem], name: str) -> Optional[str]:
+    """Resolve um nome livre para a chave canônica do fundo, testando prefixos de palavras
+    do mais longo ao mais curto (ex.: 'Fundo Clima BNDES/MMA' → alias 'Fundo Clima')."""
+    candidates = [name]
+    if " - " in name:
+        candidates.append(name.split(" - ", 1)[0])
+    words = name.split()
+    candidates.extend(" ".join(words[:i]) for i in range(len(words) - 1, 0, -1))
+    for candidate in candidates:
+        fund = funds_by_key.get(normalize_key(candidate))
+        if fund is not None:
+            return normalize_key(fund.fund_name)
+    return None
+
+
+def _build_snapshot(
+    overview: Optional[FundsOverview],
+    templates: Optional[DocumentTemplatesOutline],
+    stamps: Tuple[Optional[_FileStamp], Optional[_FileStamp]],
+) -> CatalogSnapshot:
+    funds_by_key: Dict[str, FundItem] = {}
+    for fund in (overview.funds if overview else []):
+        for key in _fund_keys(fund):
+            # Primeiro fundo declarado vence em caso de alias repetido
+            funds_by_key.setdefault(key, fund)
+
+    templates_by_key: Dict[Tuple[str, str], DocumentTemplate] = {}
+    for tpl in (templates.document_templates if templates else []):
+        doc_key = normalize_key(tpl.doc_type)
+        templates_by_key.setdefault((normalize_key(tpl.fund_name), doc_key), tpl)
+        canonical = _resolve_fund_key(funds_by_key, tpl.fund_name)
+        if canonical:
+            templates_by_key.setdefault((canonical, doc_key), tpl)
+
+    overview_body, overview_etag = _serialize(overview.dict() if overview else {"funds": []})
+    templates_body, templates_etag = _serialize(templates.dict() if templates else {"document_templates": []})
+
+    return CatalogSnapshot(
+        overview=overview,
+        templates=templates,
+        funds_by_key=funds_by_key,
+        templates_by_key=templates_by_key,
+        overview_body=overview_body,
+        overview_etag=overview_etag,
+        templates_body=templates_body,
+        templates_etag=templates_etag,
+        match_index=build_index(overview),
+        stamps=stamps,
+    )
+
+
+def _load(previous: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+    """Lê os JSONs e monta um novo snapshot. Em recargas, um arquivo inválido mantém a
+    versão anterior daquele arquivo em vez de esvaziar o catálogo."""
+    overview_path, templates_path = _paths()
+    overview_stamp, templates_stamp = _stamp(overview_path), _stamp(templates_path)
+
+    overview = previous.overview if previous else None
+    if previous is None or overview_stamp != previous.stamps[0]:
+        try:
+            overview = FundsOverview(**_read_json(overview_path)) if overview_stamp else None
+        except Exception as e:
+            log.error("Falha ao carregar catálogo de fundos", extra={"file": "funds_overview.json", "error": str(e)})
+            overview = previous.overview if previous else None
+
+    templates = previous.templates if previous else None
+    if previous is None or templates_stamp != previous.stamps[1]:
+        try:
+            templates = DocumentTemplatesOutline(**_read_json(templates_path)) if templates_stamp else None
+        except Exception as e:
+            log.error("Falha ao carregar catálogo de fundos", extra={"file": "document_templates_outline.json", "error": str(e)})
+            templates = previous.templates if previous else None
+
+    return _build_snapshot(overview, templates, (overview_stamp, templates_stamp))
+
+
 def init() -> None:
     """Carrega os JSONs de overview/templates se existirem; valida e mantém em cache.
     Não levanta exceção fatal — se faltarem, seguimos com cache None para não quebrar o fluxo atual.
     """
-    global _overview_cache, _templates_cache
-    root = os.path.abspath(os.getenv("FUND_DATA_DIR", "./"))
-    overview_path = os.path.join(root, "funds_overview.json")
-    templates_path = os.path.join(root, "document_templates_outline.json")
+    global _catalog, _last_check
+    with _reload_lock:
+        _catalog = _load(None)
+        _last_check = time.monotonic()
 
-    try:
-        if os.path.exists(overview_path):
-            _overview_cache = FundsOverview(**_read_json(overview_path))
-    except Exception as e:
-        print(f"[funds.loader] Falha ao carregar funds_overview.json: {e}")
-        _overview_cache = None
 
-    try:
-        if os.path.exists(templates_path):
-            _templates_cache = DocumentTemplatesOutline(**_read_json(templates_path))
-    except Exception as e:
-        print(f"[funds.loader] Falha ao carregar document_templates_outline.json: {e}")
-        _templates_cache = None
+def _maybe_reload() -> CatalogSnapshot:
+    """Recarrega o catálogo se algum JSON mudou em disco (checagem limitada por intervalo)."""
+    global _catalog, _last_check
+    now = time.monotonic()
+    if now - _last_check < RELOAD_CHECK_INTERVAL_S:
+        return _catalog
+    with _reload_lock:
+        if now - _last_check < RELOAD_CHECK_INTERVAL_S:
+            return _catalog
+        _last_check = now
+        current = _catalog
+        overview_path, templates_path = _paths()
+        if (_stamp(overview_path), _stamp(templates_path)) != current.stamps:
+            log.info("Alteração detectada nos JSONs de fundos; recarregando catálogo")
+            _catalog = _load(current)
+    return _catalog
+
+
+def get_catalog() -> CatalogSnapshot:
+    return _maybe_reload()
 
 
 def get_overview() -> Optional[FundsOverview]:
-    return _overview_cache
+    return _maybe_reload().overview
 
 
 def get_templates() -> Optional[DocumentTemplatesOutline]:
-    return _templates_cache
+    return _maybe_reload().templates
+
+
+def get_overview_response() -> Tuple[bytes, str]:
+    """Corpo JSON pré-serializado de /fundos/overview e seu ETag."""
+    catalog = _maybe_reload()
+    return catalog.overview_body, catalog.overview_etag
+
+
+def get_templates_response() -> Tuple[bytes, str]:
+    """Corpo JSON pré-serializado de /fundos/templates e seu ETag."""
+    catalog = _maybe_reload()
+    return catalog.templates_body, catalog.templates_etag
+
+
+def get_match_index() -> MatchIndex:
+    """Índices invertidos de elegibilidade da versão atual do catálogo."""
+    return _maybe_reload().match_index
+
+
+def find_fund(name_or_alias: str) -> Optional[FundItem]:
+    """Busca O(1) de fundo por nome oficial, alias ou sigla."""
+    return _maybe_reload().funds_by_key.get(normalize_key(name_or_alias))
 
 
+def find_template(fund: str, doc_type: str) -> Optional[DocumentTemplate]:
+    """Busca O(1) do template (fundo, doc_type); aceita nome, alias ou sigla do fundo."""
+    catalog = _maybe_reload()
+    doc_key = normalize_key(doc_type)
+    fund_item = catalog.funds_by_key.get(normalize_key(fund))
+    if fund_item is not None:
+        tpl = catalog.templates_by_key.get((normalize_key(fund_item.fund_name), doc_key))
+        if tpl is not None:
+            return tpl
+    return catalog.templates_by_key.get((normalize_key(fund), doc_key))
@@ -0,0 +1,239 @@
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from backend.funds.schemas import FundsOverview, FundItem
+
+
+# Pesos dos componentes do score (somam 1.0)
+WEIGHTS = {
+    "projeto": 0.40,
+    "risco": 0.20,
+    "ticket": 0.25,
+    "beneficiario": 0.10,
+    "modalidade": 0.05,
+}
+
+# Focos de programa que atendem cada faixa de risco da zona
+_FOCUS_BY_LEVEL = {
+    "muitoalto": {"prevencao", "resposta", "resiliencia", "adaptacao"},
+    "alto": {"prevencao", "resiliencia", "adaptacao"},
+    "medio": {"adaptacao", "resiliencia", "mitigacao"},
+    "baixo": {"mitigacao", "adaptacao"},
+    "muitobaixo": {"mitigacao"},
+}
+
+# Outros nomes das faixas (o frontend usa MODERADO)
+_LEVEL_ALIASES = {"moderado": "medio"}
+
+_UFS = {
+    "ac", "al", "ap", "am", "ba", "ce", "df", "es", "go", "ma", "mt", "ms", "mg", "pa", "pb",
+    "pr", "pe", "pi", "rj", "rn", "rs", "ro", "rr", "sc", "sp", "se", "to",
+}
+
+_STOPWORDS = {"de", "da", "do", "das", "dos", "em", "e", "a", "o", "para", "com", "por", "conforme"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _plain(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def _tokens(text: str) -> Set[str]:
+    """Tokens normalizados (sem acento, minúsculos, plural simples removido)."""
+    out: Set[str] = set()
+    for tok in _TOKEN_RE.findall(_plain(text)):
+        if tok in _STOPWORDS:
+            continue
+        if len(tok) > 4 and tok.endswith("s"):
+            tok = tok[:-1]
+        if len(tok) >= 3 or tok in _UFS:
+            out.add(tok)
+    return out
+
+
+def _tokens_of(values: Optional[Iterable[str]]) -> Set[str]:
+    out: Set[str] = set()
+    for v in values or []:
+        out |= _tokens(v)
+    return out
+
+
+@dataclass
+class MatchIndex:
+    """Índices invertidos sobre os atributos dos fundos, montados na carga do catálogo."""
+
+    funds: List[FundItem] = field(default_factory=list)
+    project_index: Dict[str, Set[int]] = field(default_factory=dict)
+    focus_index: Dict[str, Set[int]] = field(default_factory=dict)
+    beneficiary_index: Dict[str, Set[int]] = field(default_factory=dict)
+    modality_index: Dict[str, Set[int]] = field(default_factory=dict)
+    # UFs às quais o fundo é restrito (vazio = sem restrição geográfica)
+    uf_restrictions: List[FrozenSet[str]] = field(default_factory=list)
+    ticket_ranges: List[Tuple[Optional[float], Optional[float]]] = field(default_factory=list)
+
+
+def _invert(index: Dict[str, Set[int]], idx: int, tokens: Set[str]) -> None:
+    for tok in tokens:
+        index.setdefault(tok, set()).add(idx)
+
+
+def build_index(overview: Optional[FundsOverview]) -> MatchIndex:
+    index = MatchIndex()
+    for idx, fund in enumerate(overview.funds if overview else []):
+        index.funds.append(fund)
+        _invert(index.project_index, idx, _tokens_of(fund.eligible_projects))
+        _invert(index.focus_index, idx, _tokens_of(fund.program_focus))
+        beneficiary_tokens = _tokens_of(fund.eligible_beneficiaries)
+        _invert(index.beneficiary_index, idx, beneficiary_tokens - _UFS)
+        index.uf_restrictions.append(frozenset(beneficiary_tokens & _UFS))
+        _invert(index.modality_index, idx, _tokens_of(fund.funding_modalities))
+        ticket = fund.typical_ticket_range_brl
+        index.ticket_ranges.append((ticket.min, ticket.max) if ticket else (None, None))
+    return index
+
+
+@dataclass(frozen=True)
+class MatchQuery:
+    """Atributos do processo relevantes para o ranking (hashable, usado no modo lote)."""
+
+    project_tokens: FrozenSet[str]
+    level: str
+    amount: Optional[float]
+    beneficiary_tokens: FrozenSet[str]
+    uf: Optional[str]
+    modality_tokens: FrozenSet[str]
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def level_key(text: Any) -> str:
+    """Faixa de risco normalizada: "Muito Alto", "MUITO_ALTO" e "Risco Muito Alto" → "muitoalto".
+    Os tokens são unidos na ordem do texto (um conjunto mudaria a ordem conforme o hash seed)."""
+    key = "".join(tok for tok in _TOKEN_RE.findall(_plain(str(text or ""))) if tok != "risco")
+    return _LEVEL_ALIASES.get(key, key)
+
+
+def _level_from_zone(zone: Dict[str, Any]) -> str:
+    level = level_key(zone.get("level") or zone.get("risk_level"))
+    if level in _FOCUS_BY_LEVEL:
+        return level
+    # Mesmo corte do frontend (riskClassification.ts): ≥75 muito alto, ≥50 alto
+    score = _as_float(zone.get("score", zone.get("risk_score")))
+    if score is None:
+        return ""
+    if score <= 1:
+        score *= 100
+    if score >= 75:
+        return "muitoalto"
+    if score >= 50:
+        return "alto"
+    if score >= 25:
+        return "medio"
+    return "baixo"
+
+
+def query_from_context(context: Dict[str, Any], project_type: Optional[str] = None) -> MatchQuery:
+    """Extrai nível da zona, valor pleiteado, tipo de projeto, beneficiário e UF do contexto."""
+    context = context or {}
+    zone = context.get("zone") or {}
+    financials = context.get("financials") or {}
+    form = context.get("form") or {}
+
+    project_text = project_type or context.get("project_type") or ""
+    project_tokens = _tokens(project_text)
+    if not project_tokens:
+        # Sem tipo declarado: usa a ação imediata/observações da vistoria como sinal mais fraco
+        project_tokens = _tokens(f"{form.get('acao_imediata') or ''} {form.get('observacoes') or ''}")
+
+    uf = str(zone.get("uf") or context.get("uf") or "").strip().lower() or None
+    return MatchQuery(
+        project_tokens=frozenset(project_tokens),
+        level=_level_from_zone(zone),
+        amount=_as_float(financials.get("valor_pleiteado", financials.get("custo_prevencao_total"))),
+        beneficiary_tokens=frozenset(_tokens(context.get("beneficiary") or "municípios") - _UFS),
+        uf=uf if uf in _UFS else None,
+        modality_tokens=frozenset(_tokens(context.get("funding_modality") or "")),
+    )
+
+
+def _ticket_fit(amount: Optional[float], ticket: Tuple[Optional[float], Optional[float]]) -> float:
+    low, high = ticket
+    if amount is None or amount <= 0:
+        return 0.5
+    if low is not None and amount < low:
+        return amount / low
+    if high is not None and amount > high:
+        return high / amount
+    return 1.0
+
+
+def _hits(index: Dict[str, Set[int]], tokens: Iterable[str]) -> Dict[int, int]:
+    """Conta quantos tokens da consulta cada fundo contém, via índice invertido."""
+    counts: Dict[int, int] = defaultdict(int)
+    for tok in tokens:
+        for idx in index.get(tok, ()):
+            counts[idx] += 1
+    return counts
+
+
+def rank(index: MatchIndex, query: MatchQuery, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Pontua e ordena todos os fundos do catálogo para uma consulta."""
+    project_hits = _hits(index.project_index, query.project_tokens)
+    focus_hits = _hits(index.focus_index, _FOCUS_BY_LEVEL.get(query.level, ()))
+    beneficiary_hits = _hits(index.beneficiary_index, query.beneficiary_tokens)
+    modality_hits = _hits(index.modality_index, query.modality_tokens)
+    wanted_focus = len(_FOCUS_BY_LEVEL.get(query.level, ()))
+
+    ranked: List[Dict[str, Any]] = []
+    for idx, fund in enumerate(index.funds):
+        components = {
+            "projeto": project_hits.get(idx, 0) / len(query.project_tokens) if query.project_tokens else 0.5,
+            "risco": min(1.0, focus_hits.get(idx, 0) / 2) if wanted_focus else 0.5,
+            "ticket": _ticket_fit(query.amount, index.ticket_ranges[idx]),
+            "beneficiario": 1.0 if beneficiary_hits.get(idx) else 0.0,
+            "modalidade": 1.0 if modality_hits.get(idx) else (0.5 if not query.modality_tokens else 0.0),
+        }
+        restricted = index.uf_restrictions[idx]
+        uf_ok = not restricted or query.uf is None or query.uf in restricted
+        if restricted and query.uf is None:
+            components["beneficiario"] *= 0.5
+        low = index.ticket_ranges[idx][0]
+        eligible = bool(beneficiary_hits.get(idx)) and uf_ok
+        score = sum(WEIGHTS[k] * v for k, v in components.items()) if eligible else 0.0
+        ranked.append({
+            "fund_name": fund.fund_name,
+            "alias": fund.alias or [],
+            "score": round(score, 4),
+            "eligible": eligible,
+            "below_min_ticket": bool(query.amount is not None and low is not None and query.amount < low),
+            "components": {k: round(v, 4) for k, v in components.items()},
+        })
+
+    ranked.sort(key=lambda r: (r["eligible"], r["score"]), reverse=True)
+    return ranked[:top_k] if top_k else ranked
+
+
+def rank_batch(
+    index: MatchIndex,
+    items: List[Tuple[Dict[str, Any], Optional[str]]],
+    top_k: Optional[int] = None,
+) -> List[List[Dict[str, Any]]]:
+    """Ranking de vários processos de uma vez; consultas idênticas são pontuadas uma única vez."""
+    memo: Dict[MatchQuery, List[Dict[str, Any]]] = {}
+    out: List[List[Dict[str, Any]]] = []
+    for context, project_type in items:
+        query = query_from_context(context, project_type)
+        if query not in memo:
+            memo[query] = rank(index, query, top_k)
+        out.append(memo[query])
+    return out
@@ -0,0 +1,176 @@
+"""Logging estruturado e não bloqueante.
+
+Os registros entram numa fila (QueueHandler) e são formatados e escritos por uma thread
+em segundo plano (QueueListener), então um stdout lento não trava as requisições. Cada
+linha carrega request_id, process_id e pid para correlacionar com /metrics e perfis.
+Payloads volumosos (texto do LLM etc.) só são registrados em DEBUG, por amostragem e
+truncados.
+
+    log = logs.get_logger("gemini")
+    log.info("Análise concluída", extra={"residences": 12})
+    log.debug("Resposta do modelo", extra={"payload": text})
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json (padrão) ou text (leitura humana no desenvolvimento)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Fração dos registros DEBUG com payload que é de fato emitida
+DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.05"))
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+process_id_var: ContextVar[Optional[int]] = ContextVar("process_id", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "process_id"}
+_PROCESS_PATH = re.compile(r"^/processos/prevencao/(\d+)")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"climaseguro.{name}")
+
+
+def bind_process(process_id: Optional[int]) -> None:
+    """Associa os próximos registros da requisição atual a um processo."""
+    process_id_var.set(process_id)
+
+
+class _ContextFilter(logging.Filter):
+    """Roda na thread que registra (onde as contextvars da requisição estão visíveis)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.process_id = process_id_var.get()
+        return True
+
+
+class _PayloadSampler(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        payload = getattr(record, "payload", None)
+        if payload is None:
+            return True
+        if record.levelno <= logging.DEBUG and random.random() >= DEBUG_SAMPLE_RATE:
+            return False
+        text = str(payload)
+        if len(text) > PAYLOAD_MAX_CHARS:
+            text = text[:PAYLOAD_MAX_CHARS] + f"… (+{len(text) - PAYLOAD_MAX_CHARS} caracteres)"
+        record.payload = text
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "process_id": getattr(record, "process_id", None),
+            "pid": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        extras = {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        line = f"{self.formatTime(record)} {record.levelname:<7} [{record.name}] {record.getMessage()}"
+        ids = f"req={getattr(record, 'request_id', None) or '-'} proc={getattr(record, 'process_id', None) or '-'}"
+        line = f"{line} ({ids})" + (f" {extras}" if extras else "")
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A formatação fica para a thread do listener; aqui só resolvemos msg % args
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup() -> None:
+    """Configura o logger 'climaseguro' (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+    handler.addFilter(_PayloadSampler())
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+    root = logging.getLogger("climaseguro")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Esvazia a fila e para a thread de escrita."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestContextMiddleware:
+    """Middleware ASGI que define request_id (X-Request-ID ou gerado) e o process_id da rota,
+    devolvendo o X-Request-ID na resposta."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        supplied = (headers.get(b"x-request-id") or b"").decode("latin-1")
+        request_id = "".join(ch for ch in supplied if ch.isalnum() or ch in "-_")[:64] or uuid.uuid4().hex
+        match = _PROCESS_PATH.match(scope.get("path", ""))
+        request_token = request_id_var.set(request_id)
+        process_token = process_id_var.set(int(match.group(1)) if match else None)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("ascii"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(request_token)
+            process_id_var.reset(process_token)
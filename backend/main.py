@@ -1,27 +1,38 @@
 import os
 import json
+import asyncio
 import base64
+import datetime
 from typing import List, Optional
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse, RedirectResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import func
 
-from backend.storage import init_storage, save_upload_files, open_document_stream
+from backend.storage import init_storage, save_upload_files, open_document_stream, file_size, presigned_url
 from backend.models import Base, PreventionProcess, ProcessPhoto, ProcessForm, GeneratedDocument
 from backend.database import engine, SessionLocal
-from backend.services.gemini import describe_images_with_gemini, analyze_image_base64
-from backend.services.doc_gen import generate_documents_for_fund, FundDefinition, list_funds
+from backend.dbtools import backfill_risk_level, upgrade_schema
+from backend import admission, logs, metrics, profiling, warmup
+from backend.services.gemini import describe_images_with_gemini, iter_image_descriptions, analyze_image_base64, analyze_image_tiled, is_model_description
+from backend.services.doc_gen import generate_documents_for_funds, FundDefinition, list_funds
 from backend.services.context_builder import build_context
+from backend.services import geo_proxy, idempotency, photo_dedup, process_export, process_import
 from backend.funds import loader as funds_loader
+from backend.funds import matching as funds_matching
 from backend.services.preflight_checks import preflight_for_fund
+from backend.services.resilience import deadline_scope
 from backend.pdf_renderer import build_pdf_bytes
-from backend.services.doc_gen import compose_action_plan_text
+from backend.services.doc_gen import compose_action_plan_text, compose_document_text_offline, get_fund, sections_for
 
 
 app = FastAPI(title="ClimaSeguro Backend", version="0.1.0")
 
+# Pools separados para endpoints pesados e leves (mais interno, para o 503 receber CORS e métricas)
+if admission.ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
 # CORS para o front local
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +41,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+# Perfil por requisição: só instalado com PROFILE_TOKEN ou PROFILE_ALL_REQUESTS (sem custo quando desligado)
+if profiling.enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+# Mais externo: request_id/process_id valem para os logs de todos os demais
+app.add_middleware(logs.RequestContextMiddleware)
+
+logs.setup()
+log = logs.get_logger("api")
+
+# Tamanho máximo de página da listagem de processos
+LIST_MAX_LIMIT = int(os.getenv("PROCESS_LIST_MAX_LIMIT", "200"))
+# Com storage S3, /documentos/{id} redireciona para uma URL assinada em vez de repassar os bytes
+PRESIGNED_DOWNLOADS = os.getenv("STORAGE_PRESIGNED_DOWNLOADS", "true").lower() in {"1", "true", "yes"}
 
 
 @app.on_event("startup")
@@ -38,8 +63,14 @@ def on_startup() -> None:
     if os.getenv("RESET_DB_ON_STARTUP", "false").lower() in {"1", "true", "yes"}:
         Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    backfill_risk_level()
     init_storage()
     funds_loader.init()
+    idempotency.purge_expired()
+    geo_proxy.external_cache.purge_expired()
+    # Pacotes pesados, templates e modelos carregados em segundo plano (não atrasa a prontidão)
+    warmup.start_background()
 
 
 def _load_context(process: PreventionProcess) -> dict:
@@ -50,7 +81,7 @@ def _load_context(process: PreventionProcess) -> dict:
 
 
 def _save_context(db, process: PreventionProcess, ctx: dict) -> None:
-    process.context_json = json.dumps(ctx, ensure_ascii=False)
+    process.set_context(ctx)
     db.add(process)
 
 
@@ -65,7 +96,8 @@ def create_prevention_process(zone_id: Optional[int] = Form(None), context: Opti
             except Exception:
                 initial_ctx = {"_warning": "invalid_context_payload"}
 
-        process = PreventionProcess(zone_id=zone_id, status="draft", context_json=json.dumps(initial_ctx))
+        process = PreventionProcess(zone_id=zone_id, status="draft")
+        process.set_context(initial_ctx)
         db.add(process)
         db.commit()
         db.refresh(process)
@@ -74,43 +106,284 @@ def create_prevention_process(zone_id: Optional[int] = Form(None), context: Opti
         db.close()
 
 
+@app.post("/processos/prevencao/importar")
+async def import_prevention_processes(request: Request):
+    """Cria processos em lote a partir de zonas em JSON lines (application/x-ndjson) ou CSV
+    (text/csv). Zonas com processo em aberto são ignoradas; retorna os ids criados."""
+    try:
+        process_import.check_declared_size(request.headers.get("content-length"))
+        body = await process_import.spool(request.stream())
+    except process_import.ImportTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        result = await asyncio.to_thread(process_import.import_zones, body, request.headers.get("content-type", ""))
+    except process_import.ImportTooManyRows as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except process_import.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Arquivo deve estar em UTF-8")
+    finally:
+        body.close()
+    return result.dict()
+
+
+@app.get("/processos/prevencao")
+def list_prevention_processes(
+    status: Optional[str] = None,
+    zone_id: Optional[int] = None,
+    risk_level: Optional[str] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+    cursor: Optional[int] = Query(None, description="nextCursor da página anterior"),
+    limit: int = Query(50, ge=1, le=LIST_MAX_LIMIT),
+    include_counts: bool = False,
+):
+    """Lista processos do mais recente ao mais antigo com paginação por chave (id), sem OFFSET
+    e sem ler o context_json: os filtros usam colunas indexadas."""
+    db = SessionLocal()
+    try:
+        query = db.query(
+            PreventionProcess.id, PreventionProcess.zone_id, PreventionProcess.status,
+            PreventionProcess.risk_level, PreventionProcess.created_at, PreventionProcess.updated_at,
+        )
+        if status is not None:
+            query = query.filter(PreventionProcess.status == status)
+        if zone_id is not None:
+            query = query.filter(PreventionProcess.zone_id == zone_id)
+        if risk_level is not None:
+            query = query.filter(PreventionProcess.risk_level == funds_matching.level_key(risk_level))
+        if created_from is not None:
+            query = query.filter(PreventionProcess.created_at >= created_from)
+        if created_to is not None:
+            query = query.filter(PreventionProcess.created_at < created_to)
+        if cursor is not None:
+            query = query.filter(PreventionProcess.id < cursor)
+        # Uma linha a mais indica se há próxima página
+        rows = query.order_by(PreventionProcess.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        items = [
+            {
+                "id": row.id,
+                "zoneId": row.zone_id,
+                "status": row.status,
+                "riskLevel": row.risk_level,
+                "createdAt": row.created_at.isoformat() if row.created_at else None,
+                "updatedAt": row.updated_at.isoformat() if row.updated_at else None,
+            }
+            for row in rows
+        ]
+        if include_counts and items:
+            ids = [item["id"] for item in items]
+            counts = {}
+            for key, model in (("photoCount", ProcessPhoto), ("documentCount", GeneratedDocument)):
+                grouped = db.query(model.process_id, func.count(model.id)).filter(model.process_id.in_(ids)).group_by(model.process_id)
+                counts[key] = dict(grouped.all())
+            for item in items:
+                for key, by_process in counts.items():
+                    item[key] = by_process.get(item["id"], 0)
+        return {"items": items, "nextCursor": items[-1]["id"] if has_more else None}
+    finally:
+        db.close()
+
+
+@app.get("/processos/prevencao/exportar")
+def export_prevention_processes(
+    formato: str = Query("csv", pattern="^(csv|parquet)$"),
+    status: Optional[str] = None,
+    zone_id: Optional[int] = None,
+    risk_level: Optional[str] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+):
+    """Exporta processos, fotos e documentos em uma tabela achatada (CSV ou Parquet), em
+    streaming. Mesmos filtros da listagem."""
+    filters = {"status": status, "zone_id": zone_id, "risk_level": risk_level, "created_from": created_from, "created_to": created_to}
+    try:
+        chunks, media_type, filename = process_export.export(formato, filters)
+    except process_export.ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return StreamingResponse(chunks, media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
+def _replayable(body, replayed: bool) -> JSONResponse:
+    return JSONResponse(body, headers={"Idempotent-Replayed": "true"} if replayed else None)
+
+
 @app.post("/processos/prevencao/{process_id}/fotos")
-async def upload_photos(process_id: int, files: List[UploadFile] = File(...)):
+async def upload_photos(
+    process_id: int,
+    files: List[UploadFile] = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """Com Idempotency-Key, retentativas devolvem a resposta original sem repetir o trabalho."""
+    req_hash = ""
+    if idempotency_key:
+        parts = []
+        for f in files:
+            parts.append((f.filename or "", await f.read()))
+            await f.seek(0)
+        req_hash = idempotency.request_hash(parts)
+    body, replayed = await idempotency.arun(
+        f"POST /processos/prevencao/{process_id}/fotos", idempotency_key, req_hash,
+        lambda: _upload_photos(process_id, files),
+    )
+    return _replayable(body, replayed)
+
+
+async def _upload_photos(process_id: int, files: List[UploadFile]) -> dict:
     db = SessionLocal()
     try:
         process = db.query(PreventionProcess).get(process_id)
         if not process:
             raise HTTPException(status_code=404, detail="Processo não encontrado")
 
-        # Salva arquivos e chama Gemini para descrever
-        saved_paths = save_upload_files(process_id, files)
-        descriptions = await describe_images_with_gemini([p.path for p in saved_paths])
-
+        # Salva arquivos; fotos quase idênticas reaproveitam a descrição, o resto vai ao Gemini
+        saved_paths = await asyncio.to_thread(save_upload_files, process_id, files)
+        paths = [p.path for p in saved_paths]
+        local_paths = [p.local_path for p in saved_paths]
+        matches = await asyncio.to_thread(photo_dedup.plan, process_id, process.zone_id, local_paths)
+        unique = [i for i, m in enumerate(matches) if m.needs_model]
+        descriptions: List[Optional[str]] = [m.existing_description for m in matches]
+        with deadline_scope():
+            unique_descriptions = await describe_images_with_gemini([local_paths[i] for i in unique])
+            retry: List[int] = []
+            for i, desc in zip(unique, unique_descriptions):
+                descriptions[i] = desc
+                if not is_model_description(desc):
+                    retry.extend(photo_dedup.detach(matches, i))
+            # Repetições de uma original sem descrição do modelo são descritas por conta própria
+            if retry:
+                for i, desc in zip(retry, await describe_images_with_gemini([local_paths[i] for i in retry])):
+                    descriptions[i] = desc
+                    if not is_model_description(desc):
+                        matches[i].phash = None
+        for i, m in enumerate(matches):
+            if m.batch_original is not None:
+                descriptions[i] = descriptions[m.batch_original]
+
+        # Em ordem: a original do envio é gravada antes das fotos que a repetem
         photos_out = []
-        for saved, desc in zip(saved_paths, descriptions):
-            photo = ProcessPhoto(process_id=process_id, file_path=saved.path, description_ai=desc)
+        photo_ids: List[int] = []
+        for path, desc, m in zip(paths, descriptions, matches):
+            duplicate_of = m.existing_id if m.batch_original is None else photo_ids[m.batch_original]
+            photo = ProcessPhoto(process_id=process_id, file_path=path, description_ai=desc, phash=m.phash, duplicate_of_id=duplicate_of)
             db.add(photo)
             db.flush()
+            photo_ids.append(photo.id)
             photos_out.append({
                 "id": photo.id,
                 "filePath": photo.file_path,
                 "description": photo.description_ai,
+                "duplicateOf": photo.duplicate_of_id,
             })
 
         # Atualiza contexto do processo
         ctx = _load_context(process)
         photos_ctx = ctx.get("photos", [])
-        for saved, desc in zip(saved_paths, descriptions):
-            photos_ctx.append({"path": saved.path, "description": desc})
+        for path, desc in zip(paths, descriptions):
+            photos_ctx.append({"path": path, "description": desc})
         ctx["photos"] = photos_ctx
 
         process.status = "photos_captured"
         _save_context(db, process, ctx)
         db.commit()
-        return {"photos": photos_out}
+        return {"photos": photos_out, "dedup": photo_dedup.summary(matches)}
+    finally:
+        db.close()
+
+
+def _commit_photo(process_id: int, path: str, description: str, phash: Optional[str] = None, duplicate_of_id: Optional[int] = None) -> dict:
+    """Grava uma foto e a inclui no contexto do processo em transação própria."""
+    db = SessionLocal()
+    try:
+        process = db.query(PreventionProcess).get(process_id)
+        photo = ProcessPhoto(process_id=process_id, file_path=path, description_ai=description, phash=phash, duplicate_of_id=duplicate_of_id)
+        db.add(photo)
+        db.flush()
+        ctx = _load_context(process)
+        ctx.setdefault("photos", []).append({"path": path, "description": description})
+        process.status = "photos_captured"
+        _save_context(db, process, ctx)
+        db.commit()
+        return {"id": photo.id, "filePath": photo.file_path, "description": photo.description_ai, "duplicateOf": photo.duplicate_of_id}
+    finally:
+        db.close()
+
+
+def _ndjson(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+@app.post("/processos/prevencao/{process_id}/fotos/stream")
+async def upload_photos_stream(process_id: int, files: List[UploadFile] = File(...)):
+    """Variante em streaming (NDJSON) de /fotos: 'saved' após gravar os arquivos, uma linha
+    'photo' por foto assim que descrita (já commitada no banco) e 'done' ao final. Se a
+    conexão cair, as fotos já concluídas permanecem no processo."""
+    db = SessionLocal()
+    try:
+        process = db.query(PreventionProcess).get(process_id)
+        if not process:
+            raise HTTPException(status_code=404, detail="Processo não encontrado")
+        zone_id = process.zone_id
     finally:
         db.close()
 
+    # Os arquivos são gravados antes da resposta: o UploadFile não sobrevive ao streaming
+    saved = await asyncio.to_thread(save_upload_files, process_id, files)
+    saved_paths = [p.path for p in saved]
+    local_paths = [p.local_path for p in saved]
+
+    async def events():
+        yield _ndjson({"event": "saved", "count": len(saved_paths)})
+        matches = await asyncio.to_thread(photo_dedup.plan, process_id, zone_id, local_paths)
+        unique = [i for i, m in enumerate(matches) if m.needs_model]
+        completed = 0
+
+        async def commit(index: int, description: str, duplicate_of_id: Optional[int]):
+            nonlocal completed
+            try:
+                photo = await asyncio.to_thread(
+                    _commit_photo, process_id, saved_paths[index], description, matches[index].phash, duplicate_of_id
+                )
+            except Exception as e:
+                log.error("Falha ao gravar foto", extra={"index": index, "error": str(e)})
+                return _ndjson({"event": "error", "index": index, "detail": "Falha ao gravar foto"}), None
+            completed += 1
+            return _ndjson({"event": "photo", "index": index, **photo}), photo["id"]
+
+        # Repetições de fotos já gravadas saem de imediato, sem chamada ao modelo
+        for index, m in enumerate(matches):
+            if m.existing_id is not None:
+                line, _ = await commit(index, m.existing_description, m.existing_id)
+                yield line
+        # Mesmo orçamento de tempo de /fotos para todas as chamadas ao modelo do envio
+        with deadline_scope():
+            retry: List[int] = []
+            async for position, description in iter_image_descriptions([local_paths[i] for i in unique]):
+                index = unique[position]
+                if not is_model_description(description):
+                    retry.extend(photo_dedup.detach(matches, index))
+                line, photo_id = await commit(index, description, None)
+                yield line
+                # Repetições dentro do envio seguem a original assim que ela é descrita
+                for follower in photo_dedup.followers(matches, index):
+                    line, _ = await commit(follower, description, photo_id)
+                    yield line
+            # Repetições de uma original sem descrição do modelo são descritas por conta própria
+            if retry:
+                async for position, description in iter_image_descriptions([local_paths[i] for i in retry]):
+                    index = retry[position]
+                    if not is_model_description(description):
+                        matches[index].phash = None
+                    line, _ = await commit(index, description, None)
+                    yield line
+        yield _ndjson({"event": "done", "completed": completed, "total": len(saved_paths), "dedup": photo_dedup.summary(matches)})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=_SSE_HEADERS)
+
 
 @app.post("/processos/prevencao/{process_id}/formulario")
 def submit_form(process_id: int, responsavel: str = Form(...), data_vistoria: str = Form(...), observacoes: str = Form(""), acao_imediata: str = Form("")):
@@ -150,20 +423,92 @@ def get_funds():
     return {"funds": [f.dict() for f in list_funds()]}
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def _cached_json_response(request: Request, body: bytes, etag: str) -> Response:
+    """Resposta JSON pré-serializada com ETag; devolve 304 se o cliente já tem a versão atual."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @app.get("/fundos/overview")
-def get_funds_overview():
-    overview = funds_loader.get_overview()
-    if not overview:
-        return {"funds": []}
-    return overview.dict()
+def get_funds_overview(request: Request):
+    body, etag = funds_loader.get_overview_response()
+    return _cached_json_response(request, body, etag)
 
 
 @app.get("/fundos/templates")
-def get_document_templates_outline():
-    templates = funds_loader.get_templates()
-    if not templates:
-        return {"document_templates": []}
-    return templates.dict()
+def get_document_templates_outline(request: Request):
+    body, etag = funds_loader.get_templates_response()
+    return _cached_json_response(request, body, etag)
+
+
+class FundRankingRequest(BaseModel):
+    process_id: Optional[int] = None
+    context: Optional[dict] = None
+    project_type: Optional[str] = None
+
+
+class FundRankingBatchRequest(BaseModel):
+    items: List[FundRankingRequest]
+    top_k: Optional[int] = None
+
+
+def _contexts_for_ranking(items: List[FundRankingRequest]) -> List[dict]:
+    """Resolve o contexto de cada item; processos são lidos numa única consulta."""
+    ids = {i.process_id for i in items if i.context is None and i.process_id is not None}
+    stored: dict = {}
+    if ids:
+        db = SessionLocal()
+        try:
+            rows = db.query(PreventionProcess.id, PreventionProcess.context_json).filter(PreventionProcess.id.in_(ids)).all()
+        finally:
+            db.close()
+        for pid, raw in rows:
+            try:
+                stored[pid] = json.loads(raw or "{}")
+            except Exception:
+                stored[pid] = {}
+    contexts = []
+    for item in items:
+        if item.context is not None:
+            contexts.append(item.context)
+        elif item.process_id in stored:
+            contexts.append(stored[item.process_id])
+        else:
+            raise HTTPException(status_code=404, detail=f"Processo não encontrado: {item.process_id}")
+    return contexts
+
+
+@app.post("/fundos/ranking")
+def rank_funds(payload: FundRankingRequest, top_k: Optional[int] = None):
+    context = _contexts_for_ranking([payload])[0]
+    query = funds_matching.query_from_context(context, payload.project_type)
+    return {"funds": funds_matching.rank(funds_loader.get_match_index(), query, top_k)}
+
+
+@app.post("/fundos/ranking/lote")
+def rank_funds_batch(payload: FundRankingBatchRequest):
+    contexts = _contexts_for_ranking(payload.items)
+    results = funds_matching.rank_batch(
+        funds_loader.get_match_index(),
+        [(ctx, item.project_type) for ctx, item in zip(contexts, payload.items)],
+        payload.top_k,
+    )
+    return {
+        "results": [
+            {"process_id": item.process_id, "funds": ranked}
+            for item, ranked in zip(payload.items, results)
+        ]
+    }
 
 
 class PreflightRequest(BaseModel):
@@ -186,25 +531,15 @@ def generate_action_plan(payload: ActionPlanRequest):
     title = "Plano de Ação Municipal"
     try:
         from backend.services.gemini import generate_legal_document_text
-        sections = [
-            "Objetivo",
-            "Contexto e Diagnóstico",
-            "Diretrizes",
-            "Ações Imediatas (0–90 dias)",
-            "Ações Estruturantes (6–24 meses)",
-            "Orçamento de Referência",
-            "Governança e Responsabilidades",
-            "Indicadores de Monitoramento",
-            "Riscos e Mitigações",
-            "Conclusão",
-        ]
-        llm_text = generate_legal_document_text("Prefeitura Municipal", "PlanoAcaoMunicipal", ctx, sections)
+        with deadline_scope():
+            llm_text = generate_legal_document_text("Prefeitura Municipal", "PlanoAcaoMunicipal", ctx, sections_for("PlanoAcaoMunicipal"))
         final_text = llm_text or compose_action_plan_text(ctx)
     except Exception as e:
-        print(f"[acao/plano] LLM indisponível, usando fallback: {e}")
+        log.warning("LLM indisponível para o plano de ação, usando fallback", extra={"error": str(e)})
         final_text = compose_action_plan_text(ctx)
 
-    pdf_bytes = build_pdf_bytes(title, [final_text])
+    with metrics.timed("pdf_render", doc_type="PlanoAcaoMunicipal"):
+        pdf_bytes = build_pdf_bytes(title, [final_text])
     return StreamingResponse(
         iter([pdf_bytes]),
         media_type="application/pdf",
@@ -212,8 +547,105 @@ def generate_action_plan(payload: ActionPlanRequest):
     )
 
 
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _stream_text_events(fund_name: str, doc_type: str, context: dict, fallback_text):
+    """Eventos SSE com o texto do LLM conforme é gerado; se o LLM falhar, envia 'reset' e
+    transmite o texto de fallback por parágrafos. Retorna (via StopIteration) o texto final."""
+    from backend.services.gemini import stream_legal_document_text
+
+    parts: List[str] = []
+    try:
+        for chunk in stream_legal_document_text(fund_name, doc_type, context, sections_for(doc_type)):
+            parts.append(chunk)
+            yield _sse("delta", {"text": chunk})
+    except Exception as e:
+        log.warning("LLM indisponível no streaming, usando fallback", extra={"doc_type": doc_type, "error": str(e)})
+        if parts:
+            yield _sse("reset", {"reason": "llm_error"})
+        parts = []
+
+    if not parts:
+        for paragraph in fallback_text().split("\n\n"):
+            parts.append(paragraph + "\n\n")
+            yield _sse("delta", {"text": paragraph + "\n\n", "fallback": True})
+    return "".join(parts)
+
+
+@app.post("/acao/plano/stream")
+def generate_action_plan_stream(payload: ActionPlanRequest):
+    """Mesmo plano de /acao/plano, transmitido como Server-Sent Events: 'start' imediato,
+    'delta' a cada trecho de texto e 'done' com o PDF final (base64) ao término."""
+    ctx = payload.context or {}
+    title = "Plano de Ação Municipal"
+
+    def events():
+        yield _sse("start", {"title": title})
+        final_text = yield from _stream_text_events(
+            "Prefeitura Municipal", "PlanoAcaoMunicipal", ctx, lambda: compose_action_plan_text(ctx)
+        )
+        try:
+            with metrics.timed("pdf_render", doc_type="PlanoAcaoMunicipal"):
+                pdf_bytes = build_pdf_bytes(title, [final_text])
+            yield _sse("done", {
+                "filename": "plano_acao_municipal.pdf",
+                "mime": "application/pdf",
+                "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii"),
+            })
+        except Exception as e:
+            log.error("Falha ao gerar PDF do plano (stream)", extra={"error": str(e)})
+            yield _sse("error", {"detail": "Falha ao gerar PDF"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+@app.get("/processos/prevencao/{process_id}/documentos/{doc_type}/preview")
+def preview_document_stream(process_id: int, doc_type: str, fundo: str):
+    """Pré-visualização em SSE do texto de um documento do fundo, sem gerar PDF nem persistir."""
+    fund = get_fund(fundo)
+    if not fund or doc_type not in fund.required_documents:
+        raise HTTPException(status_code=404, detail="Documento não previsto para o fundo")
+    try:
+        context = build_context(process_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Processo não encontrado")
+
+    def events():
+        yield _sse("start", {"title": f"{fund.name} - {doc_type}", "doc_type": doc_type})
+        final_text = yield from _stream_text_events(
+            fund.name, doc_type, context, lambda: compose_document_text_offline(fund, doc_type, context)
+        )
+        yield _sse("done", {"text": final_text})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
 @app.post("/processos/prevencao/{process_id}/gerar-documentos")
-def generate_documents(process_id: int, fundo: str = Form(...)):
+def generate_documents(
+    process_id: int,
+    fundo: str = Form(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """`fundo` aceita um código ou vários separados por vírgula (ex.: "FNMC,MDR"): o contexto
+    é montado uma vez e documentos exigidos por mais de um fundo são gerados uma só vez.
+    Com Idempotency-Key, retentativas devolvem os mesmos documentos sem gerá-los de novo."""
+    body, replayed = idempotency.run(
+        f"POST /processos/prevencao/{process_id}/gerar-documentos", idempotency_key,
+        idempotency.request_hash([("fundo", fundo.encode("utf-8"))]),
+        lambda: _generate_documents(process_id, fundo),
+    )
+    return _replayable(body, replayed)
+
+
+def _generate_documents(process_id: int, fundo: str) -> dict:
+    fund_codes = [code.strip() for code in fundo.split(",") if code.strip()]
+    if not fund_codes:
+        raise HTTPException(status_code=400, detail="Informe ao menos um fundo")
     db = SessionLocal()
     try:
         process = db.query(PreventionProcess).get(process_id)
@@ -229,40 +661,44 @@ def generate_documents(process_id: int, fundo: str = Form(...)):
 
         context_consolidado = build_context(process_id)
 
-        docs_payload = generate_documents_for_fund(
-            fund_code=fundo,
-            process_id=process_id,
-            zone_id=process.zone_id,
-            form_data={
-                "responsavel": form.inspector_name,
-                "data_vistoria": form.inspection_date,
-                "observacoes": form.technical_notes,
-                "acao_imediata": form.immediate_action,
-            },
-            photos=[{"path": p.file_path, "description": p.description_ai or ""} for p in photos],
-            context=context_consolidado,
-        )
-
-        out_docs = []
-        for doc in docs_payload:
-            gdoc = GeneratedDocument(
+        # Orçamento de tempo compartilhado pelos documentos; esgotado, os restantes usam template
+        with deadline_scope():
+            docs_by_fund = generate_documents_for_funds(
+                fund_codes=fund_codes,
                 process_id=process_id,
-                fund_code=fundo,
-                document_type=doc["type"],
-                file_path=doc["path"],
-                mime_type=doc["mime"],
-                size_bytes=os.path.getsize(doc["path"]) if os.path.exists(doc["path"]) else None,
-                prompt_version=doc.get("prompt_version"),
-                inputs_hash=doc.get("inputs_hash"),
+                zone_id=process.zone_id,
+                form_data={
+                    "responsavel": form.inspector_name,
+                    "data_vistoria": form.inspection_date,
+                    "observacoes": form.technical_notes,
+                    "acao_imediata": form.immediate_action,
+                },
+                photos=[{"path": p.file_path, "description": p.description_ai or ""} for p in photos],
+                context=context_consolidado,
             )
-            db.add(gdoc)
-            db.flush()
-            out_docs.append({
-                "id": gdoc.id,
-                "name": doc["name"],
-                "type": gdoc.document_type,
-                "url": f"/documentos/{gdoc.id}",
-            })
+
+        out_docs = []
+        for fund_code, docs_payload in docs_by_fund.items():
+            for doc in docs_payload:
+                gdoc = GeneratedDocument(
+                    process_id=process_id,
+                    fund_code=fund_code,
+                    document_type=doc["type"],
+                    file_path=doc["path"],
+                    mime_type=doc["mime"],
+                    size_bytes=file_size(doc["path"]),
+                    prompt_version=doc.get("prompt_version"),
+                    inputs_hash=doc.get("inputs_hash"),
+                )
+                db.add(gdoc)
+                db.flush()
+                out_docs.append({
+                    "id": gdoc.id,
+                    "name": doc["name"],
+                    "type": gdoc.document_type,
+                    "fund": fund_code,
+                    "url": f"/documentos/{gdoc.id}",
+                })
 
         process.status = "documents_generated"
         db.commit()
@@ -271,22 +707,128 @@ def generate_documents(process_id: int, fundo: str = Form(...)):
         db.close()
 
 
+def _byte_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """(início, fim) de um cabeçalho Range com um único intervalo; None para ignorá-lo."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start_s:
+            # Sufixo: os últimos N bytes
+            start, end = max(0, size - int(end_s)), size - 1
+        else:
+            start, end = int(start_s), min(int(end_s), size - 1) if end_s else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Intervalo inválido", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
 @app.get("/documentos/{document_id}")
-def get_document(document_id: int):
+def get_document(document_id: int, range_header: Optional[str] = Header(None, alias="Range")):
     db = SessionLocal()
     try:
         doc = db.query(GeneratedDocument).get(document_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Documento não encontrado")
-        stream, mime, filename = open_document_stream(doc.file_path)
-        return StreamingResponse(stream, media_type=mime, headers={"Content-Disposition": f"inline; filename={filename}"})
+        location = doc.file_path
     finally:
         db.close()
 
+    if PRESIGNED_DOWNLOADS:
+        url = presigned_url(location)
+        if url:
+            return RedirectResponse(url, status_code=307)
+    size = file_size(location)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Arquivo do documento não encontrado")
+    byte_range = _byte_range(range_header, size)
+    start, end = byte_range or (0, size - 1)
+    stream, mime, filename = open_document_stream(location, start, end if byte_range else None)
+    headers = {
+        "Content-Disposition": f"inline; filename={filename}",
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(stream, status_code=206 if byte_range else 200, media_type=mime, headers=headers)
+
+
+def _geo_response(lookup) -> JSONResponse:
+    """Resposta do proxy geográfico: X-Cache (HIT, STALE ou MISS) e idade da cópia."""
+    try:
+        cached = lookup()
+    except geo_proxy.external_cache.SourceUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    age = max(0, int((datetime.datetime.utcnow() - cached.fetched_at).total_seconds()))
+    return JSONResponse(cached.value, headers={"X-Cache": cached.status.upper(), "Age": str(age)})
+
+
+class ElevationPoint(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+
+class ElevationRequest(BaseModel):
+    locations: List[ElevationPoint] = Field(..., min_length=1, max_length=geo_proxy.ELEVATION_MAX_POINTS)
+
+
+class OverpassRequest(BaseModel):
+    query: str = Field(..., min_length=1, max_length=geo_proxy.OVERPASS_MAX_QUERY_CHARS)
+
+
+class PreloadRequest(BaseModel):
+    # [{"ibge": "3550308", "nome": "São Paulo", "uf": "SP"}, ...]
+    cities: List[dict] = Field(..., max_length=geo_proxy.PRELOAD_MAX_CITIES)
+
+
+@app.get("/geo/geocode")
+def geo_geocode(municipio: str, uf: str):
+    return _geo_response(lambda: geo_proxy.geocode(municipio, uf))
+
+
+@app.get("/geo/ibge/municipios/{codigo}")
+def geo_ibge_municipio(codigo: str):
+    return _geo_response(lambda: geo_proxy.ibge_municipio(codigo))
+
+
+@app.get("/geo/ibge/malhas/{codigo}")
+def geo_ibge_malha(codigo: str):
+    return _geo_response(lambda: geo_proxy.ibge_malha(codigo))
+
+
+@app.post("/geo/elevacao")
+def geo_elevation(payload: ElevationRequest):
+    locations = [{"latitude": p.latitude, "longitude": p.longitude} for p in payload.locations]
+    return _geo_response(lambda: geo_proxy.elevation(locations))
+
+
+@app.post("/geo/overpass")
+def geo_overpass(payload: OverpassRequest):
+    return _geo_response(lambda: geo_proxy.overpass(payload.query))
+
+
+@app.get("/geo/clima")
+def geo_forecast(request: Request, lat: float, lon: float):
+    return _geo_response(lambda: geo_proxy.forecast(lat, lon, dict(request.query_params)))
+
+
+@app.post("/geo/preload")
+def geo_preload(payload: PreloadRequest):
+    return {"results": geo_proxy.preload(payload.cities)}
+
 
 @app.get("/")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "warmup": warmup.status()["state"]}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas no formato de exposição do Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # ===== ANÁLISE AUTOMÁTICA DE SATÉLITE =====
@@ -295,6 +837,10 @@ class SatelliteAnalysisRequest(BaseModel):
     image_base64: str
     zone_id: int
     coordinates: dict
+    # Modo em blocos sobrepostos para capturas grandes; tamanho e paralelismo opcionais
+    tiled: bool = False
+    tile_size: Optional[int] = None
+    concurrency: Optional[int] = None
 
 
 @app.post("/api/gemini/analyze-residence")
@@ -305,18 +851,28 @@ async def analyze_residence_from_satellite(request: SatelliteAnalysisRequest):
     """
     try:
         # Decodificar base64
-        image_data = base64.b64decode(request.image_base64)
+        with metrics.timed("image_preprocess"):
+            image_data = base64.b64decode(request.image_base64)
         
         # Chamar Gemini para análise
-        result = await analyze_image_base64(image_data, request.coordinates)
+        with deadline_scope():
+            if request.tiled:
+                result = await analyze_image_tiled(image_data, request.coordinates, request.tile_size, request.concurrency)
+            else:
+                result = await analyze_image_base64(image_data, request.coordinates)
         
-        return {
+        response = {
             "zone_id": request.zone_id,
             "residence_count": result["residence_count"],
             "description": result["description"],
             "confidence": result["confidence"],
             "coordinates": request.coordinates
         }
+        if request.tiled:
+            response.update(tiles=result["tiles"], tiling=result["tiling"], coverage=result["coverage"], naive_sum=result["naive_sum"])
+        return response
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
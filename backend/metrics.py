@@ -0,0 +1,321 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Buckets pensados para o pipeline: de consultas de ms até dossiês de dezenas de segundos
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 45, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # chave → (contagens por bucket, soma, total)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', repr(float(bound))))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+STAGE_SECONDS = Histogram(
+    "climaseguro_stage_duration_seconds",
+    "Duração de cada etapa do pipeline de prevenção.",
+    ("stage", "fund", "doc_type", "outcome"),
+)
+LLM_CALL_SECONDS = Histogram(
+    "climaseguro_llm_call_duration_seconds",
+    "Duração de cada tentativa de chamada ao Gemini.",
+    ("model", "operation", "outcome"),
+)
+LLM_CALLS = Counter(
+    "climaseguro_llm_calls_total",
+    "Chamadas ao Gemini por modelo, operação e resultado (inclui circuito aberto e coalescidas).",
+    ("model", "operation", "outcome"),
+)
+DB_QUERY_SECONDS = Histogram(
+    "climaseguro_db_query_duration_seconds",
+    "Duração das consultas SQL por tipo de comando.",
+    ("statement",),
+)
+DB_ERRORS = Counter(
+    "climaseguro_db_errors_total",
+    "Erros do banco por tipo (ex.: locked para SQLite ocupado).",
+    ("kind",),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "climaseguro_http_request_duration_seconds",
+    "Duração das requisições HTTP por endpoint.",
+    ("method", "endpoint", "status"),
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "climaseguro_admission_queue_depth",
+    "Requisições aguardando vaga, por classe de endpoint.",
+    ("pool",),
+)
+ADMISSION_ACTIVE = Gauge(
+    "climaseguro_admission_active",
+    "Requisições em execução, por classe de endpoint.",
+    ("pool",),
+)
+ADMISSION_REJECTED = Counter(
+    "climaseguro_admission_rejected_total",
+    "Requisições recusadas com 503 por classe e motivo (queue_full, queue_timeout).",
+    ("pool", "reason"),
+)
+PHOTO_DEDUP_SAVED_CALLS = Counter(
+    "climaseguro_photo_dedup_saved_calls_total",
+    "Chamadas ao modelo evitadas por reaproveitar a descrição de foto quase idêntica.",
+    ("scope",),
+)
+EXTERNAL_CACHE_REQUESTS = Counter(
+    "climaseguro_external_cache_requests_total",
+    "Consultas a fontes externas (IBGE, Open-Meteo etc.) por resultado do cache (hit, stale, miss, error).",
+    ("source", "result"),
+)
+
+
+# Lista de etapas da requisição atual, ativa apenas quando a requisição está sendo perfilada
+_stage_log: ContextVar[Optional[List[Dict[str, object]]]] = ContextVar("stage_log", default=None)
+
+
+# Threads que estão trabalhando agora para a requisição perfilada (ident → etapas em aberto)
+_stage_threads: ContextVar[Optional[Dict[int, int]]] = ContextVar("stage_threads", default=None)
+_stage_threads_lock = threading.Lock()
+
+
+def start_stage_log() -> List[Dict[str, object]]:
+    log: List[Dict[str, object]] = []
+    _stage_log.set(log)
+    return log
+
+
+def start_stage_threads() -> Dict[int, int]:
+    threads: Dict[int, int] = {}
+    _stage_threads.set(threads)
+    return threads
+
+
+def enter_stage_thread() -> None:
+    """Marca a thread atual como trabalhando para a requisição perfilada (se houver)."""
+    threads = _stage_threads.get()
+    if threads is not None:
+        ident = threading.get_ident()
+        with _stage_threads_lock:
+            threads[ident] = threads.get(ident, 0) + 1
+
+
+def leave_stage_thread() -> None:
+    threads = _stage_threads.get()
+    if threads is not None:
+        ident = threading.get_ident()
+        with _stage_threads_lock:
+            if threads.get(ident, 0) > 1:
+                threads[ident] -= 1
+            else:
+                threads.pop(ident, None)
+
+
+@contextmanager
+def stage_thread() -> Iterator[None]:
+    enter_stage_thread()
+    try:
+        yield
+    finally:
+        leave_stage_thread()
+
+
+def record_stage(stage: str, seconds: float, **labels: object) -> None:
+    log = _stage_log.get()
+    if log is not None:
+        log.append({"stage": stage, "seconds": round(seconds, 6), **{k: str(v) for k, v in labels.items()}})
+
+
+@contextmanager
+def timed(stage: str, **labels: object) -> Iterator[None]:
+    """Mede a etapa e registra no histograma com outcome ok/error."""
+    start = time.perf_counter()
+    outcome = "ok"
+    enter_stage_thread()
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        leave_stage_thread()
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage, outcome=outcome, **labels)
+        record_stage(stage, elapsed, outcome=outcome, **labels)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def instrument_engine(engine) -> None:
+    """Registra duração de consultas e erros do banco via eventos do SQLAlchemy."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        enter_stage_thread()
+        conn.info.setdefault("_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_query_start")
+        if starts:
+            leave_stage_thread()
+            verb = (statement.lstrip().split(None, 1) or ["OTHER"])[0].upper()
+            elapsed = time.perf_counter() - starts.pop()
+            DB_QUERY_SECONDS.observe(elapsed, statement=verb)
+            record_stage("db_query", elapsed, statement=verb)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        starts = ctx.connection.info.get("_query_start") if ctx.connection is not None else None
+        if starts:
+            starts.pop()
+            leave_stage_thread()
+        message = str(ctx.original_exception).lower()
+        kind = "locked" if "locked" in message or "busy" in message else type(ctx.original_exception).__name__
+        DB_ERRORS.inc(kind=kind)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mede a duração de cada requisição HTTP."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""),
+                endpoint=getattr(endpoint, "__name__", "unmatched"),
+                status=status["code"],
+            )
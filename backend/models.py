@@ -1,34 +1,62 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+import json
+
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 
+from backend.funds.matching import level_key
+
 
 Base = declarative_base()
 
 
 class PreventionProcess(Base):
     __tablename__ = "prevention_process"
+    # Listagem paginada por id decrescente: filtro + id no mesmo índice
+    __table_args__ = (
+        Index("ix_prevention_process_status_id", "status", "id"),
+        Index("ix_prevention_process_zone_id_id", "zone_id", "id"),
+        Index("ix_prevention_process_risk_level_id", "risk_level", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     zone_id = Column(Integer, nullable=True)
     status = Column(String(50), default="draft")
     # Contexto consolidado do processo (JSON serializado)
     context_json = Column(Text, nullable=True)
-    created_at = Column(DateTime, server_default=func.now())
+    # Nível de risco da zona (context.zone.level) na forma de level_key ("muitoalto", "medio"...),
+    # copiado do contexto para filtrar sem ler o JSON
+    risk_level = Column(String(50), nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
     updated_at = Column(DateTime, onupdate=func.now())
 
     photos = relationship("ProcessPhoto", back_populates="process")
     forms = relationship("ProcessForm", back_populates="process")
     documents = relationship("GeneratedDocument", back_populates="process")
 
+    @staticmethod
+    def risk_level_of(ctx: dict):
+        zone = ctx.get("zone") if isinstance(ctx, dict) else None
+        level = level_key(zone.get("level")) if isinstance(zone, dict) else None
+        return level[:50] if level else None
+
+    def set_context(self, ctx: dict) -> None:
+        """Grava o contexto e atualiza as colunas derivadas dele."""
+        self.context_json = json.dumps(ctx, ensure_ascii=False)
+        self.risk_level = self.risk_level_of(ctx)
+
 
 class ProcessPhoto(Base):
     __tablename__ = "process_photo"
 
     id = Column(Integer, primary_key=True, index=True)
-    process_id = Column(Integer, ForeignKey("prevention_process.id"), nullable=False)
+    process_id = Column(Integer, ForeignKey("prevention_process.id"), nullable=False, index=True)
     file_path = Column(Text, nullable=False)
     description_ai = Column(Text, nullable=True)
+    # Hash perceptual (dHash de 64 bits em hex) para reconhecer fotos quase idênticas
+    phash = Column(String(16), nullable=True, index=True)
+    # Foto original cuja descrição foi reaproveitada
+    duplicate_of_id = Column(Integer, ForeignKey("process_photo.id"), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
     process = relationship("PreventionProcess", back_populates="photos")
@@ -53,7 +81,7 @@ class GeneratedDocument(Base):
     __tablename__ = "generated_document"
 
     id = Column(Integer, primary_key=True, index=True)
-    process_id = Column(Integer, ForeignKey("prevention_process.id"), nullable=False)
+    process_id = Column(Integer, ForeignKey("prevention_process.id"), nullable=False, index=True)
     fund_code = Column(String(50), nullable=False)
     document_type = Column(String(100), nullable=False)
     file_path = Column(Text, nullable=False)
@@ -67,3 +95,33 @@ class GeneratedDocument(Base):
     process = relationship("PreventionProcess", back_populates="documents")
 
 
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_record"
+    __table_args__ = (UniqueConstraint("scope", "key", name="uq_idempotency_scope_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Método + caminho da requisição (a mesma chave pode ser usada em endpoints diferentes)
+    scope = Column(String(255), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    # in_progress | completed
+    state = Column(String(20), nullable=False, default="in_progress")
+    status_code = Column(Integer, nullable=True)
+    response_json = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class ExternalCacheEntry(Base):
+    __tablename__ = "external_cache_entry"
+    __table_args__ = (UniqueConstraint("key", name="uq_external_cache_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    # fonte:hash dos parâmetros (ex.: "ibge_malha:3f2a...")
+    key = Column(String(255), nullable=False)
+    source = Column(String(50), nullable=False, index=True)
+    # Parâmetros originais, para revalidar/pré-carregar sem o chamador
+    params_json = Column(Text, nullable=True)
+    value_json = Column(Text, nullable=False)
+    fetched_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -1,37 +1,156 @@
-from typing import List
-from fpdf import FPDF
+import os
+from typing import List, Optional
 
 
-def create_pdf_from_text(path: str, title: str, paragraphs: List[str]) -> None:
-    """Gera PDF leve e compatível com Windows usando fpdf2 (sem binários nativos)."""
+# Equivalentes Latin-1 para caracteres comuns em textos do LLM (fontes core do fpdf são Latin-1)
+_LATIN1_REPLACEMENTS = str.maketrans({
+    "–": "-", "—": "-", "‑": "-", "‒": "-", "−": "-",
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "•": "-", "…": "...", "≥": ">=", "≤": "<=", "\u00a0": " ", "\u202f": " ",
+})
+
+
+def latin1_safe(text: str) -> str:
+    """Adapta o texto às fontes core (Latin-1), trocando o que não for representável."""
+    return (text or "").translate(_LATIN1_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+
+def _render(title: str, paragraphs: List[str]):
+    # fpdf é importado sob demanda para não pesar na inicialização do servidor
+    from fpdf import FPDF
+
     pdf = FPDF(format="A4")
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
     pdf.set_font("Helvetica", "B", 16)
-    pdf.multi_cell(0, 10, title)
+    pdf.multi_cell(0, 10, latin1_safe(title))
     pdf.ln(4)
     pdf.set_font("Helvetica", size=11)
     for p in paragraphs:
         for line in p.split("\n\n"):
-            pdf.multi_cell(0, 7, line)
+            pdf.multi_cell(0, 7, latin1_safe(line))
             pdf.ln(2)
-    pdf.output(path)
+    return pdf
+
+
+def create_pdf_from_text(path: str, title: str, paragraphs: List[str]) -> None:
+    """Gera PDF leve e compatível com Windows usando fpdf2 (sem binários nativos)."""
+    _render(title, paragraphs).output(path)
 
 
 def build_pdf_bytes(title: str, paragraphs: List[str]) -> bytes:
     """Retorna bytes de um PDF simples (fpdf2) para envio direto na resposta HTTP."""
-    pdf = FPDF(format="A4")
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    pdf.set_font("Helvetica", "B", 16)
-    pdf.multi_cell(0, 10, title)
-    pdf.ln(4)
-    pdf.set_font("Helvetica", size=11)
-    for p in paragraphs:
-        for line in p.split("\n\n"):
-            pdf.multi_cell(0, 7, line)
-            pdf.ln(2)
-    # fpdf2 retorna str Latin-1 quando dest='S'
-    return pdf.output(dest='S').encode('latin-1')
+    # fpdf2 recente retorna bytearray; versões antigas retornavam str Latin-1 quando dest='S'
+    out = _render(title, paragraphs).output(dest='S')
+    return bytes(out) if isinstance(out, (bytes, bytearray)) else out.encode('latin-1')
+
+
+# Níveis de redução das fotos do relatório, do melhor para o mais leve: (maior lado px, qualidade JPEG)
+PHOTO_VARIANT_LEVELS = [(1280, 75), (960, 70), (640, 65), (480, 55)]
+# Fotos por página aceitas pelo layout: (colunas, linhas)
+PHOTO_LAYOUTS = {2: (1, 2), 4: (2, 2), 6: (2, 3)}
+PHOTO_REPORT_PER_PAGE = int(os.getenv("PHOTO_REPORT_PER_PAGE", "4"))
+# Folga para texto, fontes e estrutura do PDF ao estimar o tamanho final
+_PDF_OVERHEAD_BYTES = 64 * 1024
+_PAGE_OVERHEAD_BYTES = 2 * 1024
+# Linhas de legenda reservadas por foto, conforme o layout
+_CAPTION_LINES = {2: 8, 4: 6, 6: 4}
+
 
+def _pick_variants(paths: List[str], max_bytes: Optional[int]) -> List[Optional[tuple]]:
+    """Variantes no nível mais alto cuja soma cabe em `max_bytes` (cada nível é gerado uma vez
+    por foto e fica em cache no storage)."""
+    from backend.storage import image_variant
 
+    chosen: List[Optional[tuple]] = []
+    for max_px, quality in PHOTO_VARIANT_LEVELS:
+        chosen = [image_variant(p, max_px, quality) for p in paths]
+        total = sum(os.path.getsize(v[0]) for v in chosen if v)
+        if max_bytes is None or total <= max_bytes:
+            break
+    return chosen
+
+
+def _photo_cell(pdf, x: float, y: float, w: float, h: float, variant: tuple, number: int, caption: str, caption_lines: int) -> None:
+    line_h = 3.0
+    caption_h = 5 + caption_lines * line_h
+    box_h = h - caption_h - 1
+    path, px_w, px_h = variant
+    scale = min(w / px_w, box_h / px_h)
+    img_w, img_h = px_w * scale, px_h * scale
+    pdf.image(path, x + (w - img_w) / 2, y + (box_h - img_h) / 2, img_w, img_h)
+    pdf.set_xy(x, y + box_h + 1)
+    pdf.set_font("Helvetica", "B", 8)
+    pdf.cell(w, 4, f"Foto {number}")
+    pdf.set_font("Helvetica", size=7)
+    # Legenda limitada às linhas reservadas para a célula
+    lines = pdf.multi_cell(w, line_h, latin1_safe(" ".join((caption or "").split())), dry_run=True, output="LINES")
+    if len(lines) > caption_lines:
+        lines = lines[:caption_lines]
+        lines[-1] = lines[-1][:-3].rstrip() + "..."
+    pdf.set_xy(x, y + box_h + 5)
+    pdf.multi_cell(w, line_h, "\n".join(lines))
+
+
+def create_photo_report_pdf(
+    path: str,
+    title: str,
+    paragraphs: List[str],
+    photos: List[dict],
+    max_size_mb: Optional[float] = None,
+    max_pages: Optional[int] = None,
+) -> dict:
+    """Relatório fotográfico: texto seguido de grade de fotos (2, 4 ou 6 por página) com as
+    descrições da IA como legenda. As fotos entram como JPEG reduzido (variante em cache),
+    no maior nível que respeite `max_size_mb`; fotos por página aumentam até caber em
+    `max_pages` e, se ainda assim não couberem, as excedentes são omitidas com aviso.
+    Custo linear no número de fotos. Retorna um resumo do que foi incluído."""
+    pdf = _render(title, paragraphs)
+    text_pages = pdf.page_no()
+
+    usable = [p for p in photos if p.get("path") and os.path.exists(p["path"])]
+    per_page = PHOTO_REPORT_PER_PAGE if PHOTO_REPORT_PER_PAGE in PHOTO_LAYOUTS else 4
+    if max_pages:
+        remaining = max(0, max_pages - text_pages)
+        while per_page < max(PHOTO_LAYOUTS) and -(-len(usable) // per_page) > remaining:
+            per_page = min(k for k in PHOTO_LAYOUTS if k > per_page)
+        usable = usable[: remaining * per_page]
+    page_count = -(-len(usable) // per_page)
+
+    max_bytes = None
+    if max_size_mb:
+        max_bytes = int(max_size_mb * 1024 * 1024) - _PDF_OVERHEAD_BYTES - (text_pages + page_count) * _PAGE_OVERHEAD_BYTES
+    variants = _pick_variants([p["path"] for p in usable], max_bytes)
+    if max_bytes is not None:
+        # Mesmo no nível mais leve: mantém as primeiras fotos que couberem
+        total, kept = 0, 0
+        for variant in variants:
+            size = os.path.getsize(variant[0]) if variant else 0
+            if total + size > max_bytes:
+                break
+            total, kept = total + size, kept + 1
+        usable, variants = usable[:kept], variants[:kept]
+    included = [(p, v) for p, v in zip(usable, variants) if v]
+    omitted = len(photos) - len(included)
+
+    cols, rows = PHOTO_LAYOUTS[per_page]
+    margin, gap = 15.0, 5.0
+    header_h = 12.0
+    cell_w = (pdf.w - 2 * margin - (cols - 1) * gap) / cols
+    cell_h = (pdf.h - 2 * margin - header_h - (rows - 1) * gap) / rows
+    pdf.set_auto_page_break(auto=False)
+    for start in range(0, len(included), per_page):
+        pdf.add_page()
+        pdf.set_xy(margin, margin)
+        pdf.set_font("Helvetica", "B", 12)
+        heading = "Registro fotográfico"
+        if omitted and start == 0:
+            heading += f" ({len(included)} de {len(photos)} fotos; as demais constam do processo)"
+        pdf.cell(0, 8, latin1_safe(heading))
+        for slot, (photo, variant) in enumerate(included[start:start + per_page]):
+            col, row = slot % cols, slot // cols
+            x = margin + col * (cell_w + gap)
+            y = margin + header_h + row * (cell_h + gap)
+            _photo_cell(pdf, x, y, cell_w, cell_h, variant, start + slot + 1, photo.get("description", ""), _CAPTION_LINES[per_page])
+    pdf.output(path)
+    return {"photos": len(included), "omitted": omitted, "per_page": per_page, "pages": pdf.page_no()}
@@ -0,0 +1,201 @@
+import asyncio
+import datetime as dt
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _Counter
+from types import FrameType
+from typing import Dict, List, Optional
+
+from backend import logs, metrics
+from backend.storage import STORAGE_DIR
+
+
+# Perfila todas as requisições (apenas para diagnóstico pontual)
+PROFILE_ALL = os.getenv("PROFILE_ALL_REQUESTS", "false").lower() in {"1", "true", "yes"}
+# Segredo exigido no cabeçalho X-Debug-Profile para perfilar uma requisição específica
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+SAMPLE_INTERVAL_S = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000.0
+PROFILES_DIR = os.path.join(STORAGE_DIR, "profiles")
+
+log = logs.get_logger("profiling")
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_MAX_STACK_DEPTH = 64
+
+
+def enabled() -> bool:
+    """O middleware só é instalado se o modo de perfil estiver configurado (custo zero caso contrário)."""
+    return PROFILE_ALL or bool(PROFILE_TOKEN)
+
+
+class StackSampler:
+    """Profiler por amostragem: captura periodicamente as pilhas das threads que servem a
+    requisição, para não misturar requisições concorrentes.
+
+    - event loop (`loop_thread`): só quando a corrotina da requisição está em execução, ou
+      seja, quando `marker` (o frame do middleware) faz parte da pilha;
+    - threads do threadpool: só enquanto executam uma etapa da requisição (consulta ao banco,
+      chamada ao modelo ou trecho medido por `metrics.timed`), conforme `threads`.
+
+    Mantém apenas pilhas que passam por código do backend.
+    """
+
+    def __init__(
+        self,
+        interval_s: float = SAMPLE_INTERVAL_S,
+        loop_thread: Optional[int] = None,
+        marker: Optional[FrameType] = None,
+        threads: Optional[Dict[int, int]] = None,
+    ) -> None:
+        self.interval_s = interval_s
+        self.loop_thread = loop_thread
+        self.marker = marker
+        self.threads = threads if threads is not None else {}
+        self.stacks: _Counter = _Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                on_loop = ident == self.loop_thread
+                if ident == own or not (on_loop or ident in self.threads):
+                    continue
+                stack: List[str] = []
+                in_backend = False
+                in_request = not on_loop
+                while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    if code.co_filename.startswith(_BACKEND_DIR):
+                        in_backend = True
+                    if frame is self.marker:
+                        in_request = True
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                # O frame do middleware fica na base da pilha: procura além do limite de profundidade
+                while not in_request and frame is not None:
+                    in_request = frame is self.marker
+                    frame = frame.f_back
+                if in_backend and in_request:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Formato 'folded' (flamegraph.pl / speedscope)."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 40) -> List[Dict[str, object]]:
+        self_counts: _Counter = _Counter()
+        total_counts: _Counter = _Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for name in set(frames):
+                total_counts[name] += count
+        return [
+            {"function": name, "total_samples": total, "self_samples": self_counts.get(name, 0)}
+            for name, total in total_counts.most_common(limit)
+        ]
+
+
+def _stage_breakdown(log: List[Dict[str, object]]) -> Dict[str, Dict[str, float]]:
+    summary: Dict[str, Dict[str, float]] = {}
+    for entry in log:
+        item = summary.setdefault(str(entry["stage"]), {"count": 0, "seconds": 0.0})
+        item["count"] += 1
+        item["seconds"] = round(item["seconds"] + float(entry["seconds"]), 6)
+    return summary
+
+
+def _write_profile(request_id: str, info: Dict[str, object], sampler: StackSampler, log: List[Dict[str, object]]) -> None:
+    out_dir = os.path.join(PROFILES_DIR, request_id)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "profile.folded"), "w", encoding="utf-8") as f:
+        f.write(sampler.folded())
+    timings = {
+        **info,
+        "samples": sampler.samples,
+        "sample_interval_ms": sampler.interval_s * 1000,
+        "stages": _stage_breakdown(log),
+        "stage_events": log,
+        "top_functions": sampler.top_functions(),
+    }
+    with open(os.path.join(out_dir, "timings.json"), "w", encoding="utf-8") as f:
+        json.dump(timings, f, ensure_ascii=False, indent=2)
+    # Índice por request id (uma linha por perfil)
+    with open(os.path.join(PROFILES_DIR, "index.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({k: info[k] for k in ("request_id", "method", "path", "status", "total_seconds", "created_at")}, ensure_ascii=False) + "\n")
+
+
+def _authorized(headers: Dict[bytes, bytes]) -> bool:
+    if PROFILE_ALL:
+        return True
+    supplied = headers.get(b"x-debug-profile")
+    return bool(PROFILE_TOKEN) and supplied is not None and hmac.compare_digest(supplied.decode("latin-1"), PROFILE_TOKEN)
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila requisições autorizadas e grava o resultado em
+    STORAGE_DIR/profiles/<request_id>/ (profile.folded + timings.json)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        if not _authorized(headers):
+            await self.app(scope, receive, send)
+            return
+
+        # Mesmo id dos logs (definido pelo RequestContextMiddleware)
+        request_id = logs.request_id_var.get() or uuid.uuid4().hex
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", request_id.encode("ascii"))]
+            await send(message)
+
+        stage_log = metrics.start_stage_log()
+        sampler = StackSampler(
+            loop_thread=threading.get_ident(), marker=sys._getframe(), threads=metrics.start_stage_threads()
+        )
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            total = time.perf_counter() - start
+            sampler.stop()
+            info = {
+                "request_id": request_id,
+                "method": scope.get("method", ""),
+                "path": scope.get("path", ""),
+                "status": status["code"],
+                "total_seconds": round(total, 6),
+                "created_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+            }
+            try:
+                # Gravação em disco fora do event loop
+                await asyncio.to_thread(_write_profile, request_id, info, sampler, stage_log)
+            except Exception as e:
+                log.error("Falha ao gravar perfil", extra={"profile_id": request_id, "error": str(e)})
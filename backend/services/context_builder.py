@@ -2,6 +2,7 @@ import json
 from typing import Any, Dict
 
 from backend.database import SessionLocal
+from backend.metrics import timed
 from backend.models import PreventionProcess, ProcessForm, ProcessPhoto
 
 
@@ -10,6 +11,11 @@ def build_context(process_id: int) -> Dict[str, Any]:
     Consolida o contexto do processo a partir de 'context_json' + tabelas relacionadas.
     Garante chaves padrão e normalização mínima de tipos.
     """
+    with timed("context_build"):
+        return _build_context(process_id)
+
+
+def _build_context(process_id: int) -> Dict[str, Any]:
     db = SessionLocal()
     try:
         process = db.query(PreventionProcess).get(process_id)
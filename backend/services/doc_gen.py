@@ -1,14 +1,23 @@
 from dataclasses import dataclass, asdict
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+import collections
+import contextvars
 import datetime as dt
 import hashlib
 import json
 import os
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from backend.pdf_renderer import create_pdf_from_text
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from backend import logs
+from backend.funds import loader as funds_loader
+from backend.metrics import timed
+from backend.pdf_renderer import create_pdf_from_text, create_photo_report_pdf
 from backend.services.gemini import generate_legal_document_text
 
-from backend.storage import save_document
+from backend.storage import document_path, local_path, publish_document, save_document
+
+
+log = logs.get_logger("doc_gen")
 
 
 @dataclass
@@ -50,6 +59,73 @@ FUNDS: List[FundDefinition] = [
 ]
 
 
+# Seções mínimas por tipo de documento (estrutura pedida ao LLM)
+DOCUMENT_SECTIONS: Dict[str, List[str]] = {
+    "OficioNotificacao": [
+        "Introdução e finalidade do ofício",
+        "Contextualização da área e risco",
+        "Orientações aos moradores",
+        "Disposições finais e assinatura",
+    ],
+    "RelatorioTecnicoRisco": [
+        "Sumário executivo",
+        "Base legal e competência administrativa",
+        "Metodologia e diagnóstico técnico",
+        "Análise de risco e impactos",
+        "Medidas propostas e priorização",
+        "Conclusão e encaminhamentos",
+    ],
+    "PlanoAcaoEmergencial": [
+        "Objetivo e escopo do plano",
+        "Cenários e níveis de acionamento",
+        "Protocolos operacionais e responsabilidades",
+        "Recursos, logística e comunicação",
+        "Cronograma e monitoramento",
+    ],
+    "OrcamentoIntervencoes": [
+        "Premissas e critérios de estimativa",
+        "Composição de custos e BDI (visão narrativa)",
+        "Benefícios esperados e custo-efetividade",
+        "Riscos orçamentários e mitigação",
+    ],
+    "PlanoTrabalhoPrevencao": [
+        "Identificação do ente e objeto",
+        "Justificativa técnica e jurídica",
+        "Descrição detalhada das ações com localização",
+        "Orçamento e cronograma físico-financeiro (narrativo)",
+        "Metas, indicadores e governança",
+    ],
+    "RelatorioFotografico": [
+        "Contexto e metodologia",
+        "Descrição das evidências fotográficas",
+        "Conclusões técnicas",
+    ],
+    "TermoResponsabilidadeTecnica": [
+        "Identificação do responsável",
+        "Declaração de responsabilidade",
+        "Limitações e observâncias normativas",
+    ],
+    "PlanoAcaoMunicipal": [
+        "Objetivo",
+        "Contexto e Diagnóstico",
+        "Diretrizes",
+        "Ações Imediatas (0–90 dias)",
+        "Ações Estruturantes (6–24 meses)",
+        "Orçamento de Referência",
+        "Governança e Responsabilidades",
+        "Indicadores de Monitoramento",
+        "Riscos e Mitigações",
+        "Conclusão",
+    ],
+}
+
+DEFAULT_SECTIONS = ["Introdução", "Contexto", "Análise", "Conclusão"]
+
+
+def sections_for(doc_type: str) -> List[str]:
+    return DOCUMENT_SECTIONS.get(doc_type, DEFAULT_SECTIONS)
+
+
 def list_funds() -> List[FundDefinition]:
     return FUNDS
 
@@ -143,19 +219,203 @@ def compose_action_plan_text(context: Dict[str, Any]) -> str:
     return "\n\n".join(parts)
 
 
-def generate_documents_for_fund(
-    fund_code: str,
+def get_fund(fund_code: str) -> FundDefinition | None:
+    return next((f for f in FUNDS if f.code == fund_code), None)
+
+
+_TEMPLATE_DIRS = {"FNMC": "fnmc", "MDR": "mdr", "FEP-EXEMPLO": "fep-exemplo"}
+TEMPLATES_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "templates"))
+
+
+@lru_cache(maxsize=1)
+def template_env():
+    """Ambiente Jinja único (jinja2 importado sob demanda); templates compilados ficam em cache."""
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    return Environment(loader=FileSystemLoader(TEMPLATES_ROOT), autoescape=select_autoescape(enabled_extensions=("html", "xml")))
+
+
+def _template_name(fund: FundDefinition, doc_type: str) -> Optional[str]:
+    """Template Jinja do fundo para o tipo de documento (relativo a TEMPLATES_ROOT), se existir."""
+    tpl_dir = _TEMPLATE_DIRS.get(fund.code)
+    if tpl_dir and os.path.exists(os.path.join(TEMPLATES_ROOT, tpl_dir, f"{doc_type}.txt.j2")):
+        # Jinja funciona melhor com separador '/'
+        return f"{tpl_dir}/{doc_type}.txt.j2"
+    return None
+
+
+def compose_document_text_offline(fund: FundDefinition, doc_type: str, context: Dict[str, Any]) -> str:
+    """Texto do documento sem IA: template Jinja do fundo, se existir; senão o fallback jurídico."""
+    template_name = _template_name(fund, doc_type)
+    if template_name:
+        try:
+            return template_env().get_template(template_name).render(context=context or {}, fund_name=fund.name)
+        except Exception as e:
+            log.error("Falha ao renderizar template", extra={"template": template_name, "error": str(e)})
+    return _compose_fallback_legal_text(fund.name, doc_type, context or {}, (context or {}).get("form") or {})
+
+
+# Documentos gerados em paralelo num pedido (o gateway ainda limita as chamadas ao LLM)
+DOC_GEN_CONCURRENCY = int(os.getenv("DOC_GEN_CONCURRENCY", "4"))
+
+# Tipos de documento renderizados com as fotos do processo embutidas
+PHOTO_REPORT_TYPES = {"RelatorioFotografico"}
+# Limites usados quando o catálogo de fundos não define file_constraints para o documento
+PHOTO_REPORT_MAX_SIZE_MB = float(os.getenv("PHOTO_REPORT_MAX_SIZE_MB", "20"))
+PHOTO_REPORT_MAX_PAGES = int(os.getenv("PHOTO_REPORT_MAX_PAGES", "0")) or None
+
+
+def _file_limits(fund: FundDefinition, doc_type: str) -> Tuple[Optional[float], Optional[int]]:
+    """(max_size_mb, max_pages) do documento segundo funds_overview.json (file_constraints) ou,
+    na falta, formatting_rules do outline de templates; depois os padrões PHOTO_REPORT_*."""
+    max_size_mb, max_pages = None, None
+    try:
+        item = funds_loader.find_fund(fund.code) or funds_loader.find_fund(fund.name)
+        doc_key = funds_loader.normalize_key(doc_type)
+        for required in (item.required_documents or []) if item else []:
+            if funds_loader.normalize_key(required.doc_type) == doc_key and required.file_constraints:
+                max_size_mb = required.file_constraints.max_size_mb
+                max_pages = required.file_constraints.max_pages
+        if max_pages is None:
+            template = funds_loader.find_template(fund.code, doc_type)
+            if template and template.formatting_rules:
+                max_pages = template.formatting_rules.max_pages
+    except Exception as e:
+        log.warning("Falha ao consultar limites do documento no catálogo", extra={"fund": fund.code, "doc_type": doc_type, "error": str(e)})
+    return max_size_mb or PHOTO_REPORT_MAX_SIZE_MB, max_pages or PHOTO_REPORT_MAX_PAGES
+
+
+def _generate_document(
+    funds: List[FundDefinition],
+    doc_type: str,
+    process_id: int,
+    base_payload: Dict[str, Any],
+    inputs_hash: str,
+    context: Dict[str, Any] | None,
+    form_data: Dict[str, Any],
+    qualify: bool = False,
+) -> Dict[str, Any]:
+    """Gera um documento (LLM → template do fundo → texto de fallback). Quando vários fundos
+    pedem o mesmo tipo de documento, o texto é um só e cita todos eles. `qualify` põe os
+    códigos dos fundos no nome do arquivo (o mesmo tipo gerado em mais de uma versão)."""
+    fund = funds[0]
+    photos = base_payload.get("photos") or []
+
+    def render_pdf(out_path: str, title: str, text: str) -> None:
+        if doc_type in PHOTO_REPORT_TYPES and photos:
+            max_size_mb, max_pages = _file_limits(fund, doc_type)
+            # Com storage remoto, as fotos vêm do cache local do nó
+            local_photos = [{**p, "path": local_path(p.get("path") or "") or p.get("path")} for p in photos]
+            summary = create_photo_report_pdf(out_path, title, [text], local_photos, max_size_mb, max_pages)
+            log.info("Relatório fotográfico renderizado", extra={"fund": fund.code, **summary})
+        else:
+            create_pdf_from_text(out_path, title, [text])
+
+    fund_name = " / ".join(f.name for f in funds)
+    fund_label = "_".join(f.code for f in funds) if len(funds) > 1 or qualify else None
+    title = f"{fund_name} - {doc_type}"
+    filename_stem = f"{doc_type}_{process_id}" + (f"_{fund_label}" if fund_label else "")
+    # 0) Tentar geração via LLM (texto jurídico extenso)
+    llm_text = None
+    try:
+        doc_sections = sections_for(doc_type)
+        with timed("document_llm", fund=fund.code, doc_type=doc_type):
+            llm_text = generate_legal_document_text(fund_name, doc_type, context or base_payload, doc_sections)
+    except Exception as e:
+        log.warning("LLM indisponível, usando template", extra={"fund": fund.code, "doc_type": doc_type, "error": str(e)})
+
+    # 1) Se LLM gerou, produzir PDF com texto jurídico
+    if llm_text:
+        out_path = document_path(process_id, f"{filename_stem}.pdf")
+        try:
+            with timed("pdf_render", fund=fund.code, doc_type=doc_type):
+                render_pdf(out_path, title, llm_text)
+            return {
+                "name": title,
+                "type": doc_type,
+                "path": publish_document(process_id, out_path),
+                "mime": "application/pdf",
+                "prompt_version": "v2-llm-legal",
+                "inputs_hash": inputs_hash,
+            }
+        except Exception as e:
+            log.error("Falha ao renderizar PDF do LLM", extra={"fund": fund.code, "doc_type": doc_type, "error": str(e)})
+
+    # 2) Tenta carregar template TXT/Jinja e gerar PDF simples
+    template_name = _template_name(fund, doc_type)
+
+    pdf_generated = False
+    out_path = None
+    try:
+        if template_name:
+            template = template_env().get_template(template_name)
+            with timed("template_render", fund=fund.code, doc_type=doc_type):
+                rendered_text = template.render(context=context or {}, fund_name=fund_name)
+            out_path = document_path(process_id, f"{filename_stem}.pdf")
+            # Renderizar PDF simples
+            with timed("pdf_render", fund=fund.code, doc_type=doc_type):
+                render_pdf(out_path, title, rendered_text)
+            pdf_generated = True
+    except Exception as e:
+        log.error("Falha ao gerar PDF com template", extra={"template": template_name, "error": str(e)})
+
+    if not pdf_generated:
+        # Fallback: texto jurídico composto localmente, sem JSON
+        content_text = _compose_fallback_legal_text(fund_name, doc_type, context or {}, form_data or {})
+        out_path = document_path(process_id, f"{filename_stem}.pdf")
+        try:
+            with timed("pdf_render", fund=fund.code, doc_type=doc_type):
+                render_pdf(out_path, title, content_text)
+            pdf_generated = True
+        except Exception as e:
+            log.error("Falha ao renderizar PDF fallback", extra={"fund": fund.code, "doc_type": doc_type, "error": str(e)})
+            # como último recurso, salva TXT
+            out_path = save_document(process_id, f"{filename_stem}.txt", content_text.encode("utf-8"))
+
+    if pdf_generated:
+        out_path = publish_document(process_id, out_path)
+
+    return {
+        "name": title,
+        "type": doc_type,
+        "path": out_path,
+        "mime": "application/pdf" if pdf_generated else "text/plain",
+        "prompt_version": "v1",
+        "inputs_hash": inputs_hash,
+    }
+
+
+def _unit_key(fund: FundDefinition, doc_type: str) -> tuple:
+    """Chave de compartilhamento: os insumos do pedido são os mesmos para todos os fundos, então
+    o documento só muda com o que é do fundo: o template e, no relatório fotográfico, os
+    limites de tamanho e páginas. Fundos com a mesma chave recebem o mesmo arquivo."""
+    limits = _file_limits(fund, doc_type) if doc_type in PHOTO_REPORT_TYPES else None
+    return (doc_type, _template_name(fund, doc_type), limits)
+
+
+def generate_documents_for_funds(
+    fund_codes: List[str],
     process_id: int,
     zone_id: int | None,
     form_data: Dict[str, Any],
     photos: List[Dict[str, Any]],
     context: Dict[str, Any] | None = None,
-):
-    fund = next((f for f in FUNDS if f.code == fund_code), None)
-    if not fund:
-        raise ValueError("Fundo não suportado")
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Gera os documentos de vários fundos numa só passada: payload e hash de insumos são
+    calculados uma vez, cada documento é gerado uma única vez mesmo que mais de um fundo o
+    exija (ver `_unit_key`), e a união dos documentos é gerada em paralelo.
+
+    Retorna {código do fundo: [documentos]}; um documento compartilhado aparece em todos os
+    fundos que o exigem (mesmo arquivo).
+    """
+    funds: List[FundDefinition] = []
+    for code in fund_codes:
+        fund = get_fund(code)
+        if not fund:
+            raise ValueError("Fundo não suportado")
+        if fund not in funds:
+            funds.append(fund)
 
-    documents = []
     base_payload = {
         "process_id": process_id,
         "zone_id": zone_id,
@@ -164,143 +424,41 @@ def generate_documents_for_fund(
     }
     if context is not None:
         base_payload["context"] = context
+    inputs_hash = hashlib.sha256(json.dumps(base_payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
 
-    # Ambiente de templates
-    templates_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "templates"))
-    env = Environment(loader=FileSystemLoader(templates_root), autoescape=select_autoescape(enabled_extensions=("html", "xml")))
+    # Unidades de trabalho por documento distinto, na ordem dos fundos pedidos
+    units: Dict[tuple, List[FundDefinition]] = {}
+    for fund in funds:
+        for doc_type in fund.required_documents:
+            units.setdefault(_unit_key(fund, doc_type), []).append(fund)
+    shared = sum(1 for owners in units.values() if len(owners) > 1)
+    if shared:
+        log.info("Documentos compartilhados entre fundos", extra={"funds": [f.code for f in funds], "shared": shared})
 
-    for doc_type in fund.required_documents:
-        title = f"{fund.name} - {doc_type}"
-        # 0) Tentar geração via LLM (texto jurídico extenso)
-        llm_text = None
-        try:
-            sections_map = {
-                "OficioNotificacao": [
-                    "Introdução e finalidade do ofício",
-                    "Contextualização da área e risco",
-                    "Orientações aos moradores",
-                    "Disposições finais e assinatura",
-                ],
-                "RelatorioTecnicoRisco": [
-                    "Sumário executivo",
-                    "Base legal e competência administrativa",
-                    "Metodologia e diagnóstico técnico",
-                    "Análise de risco e impactos",
-                    "Medidas propostas e priorização",
-                    "Conclusão e encaminhamentos",
-                ],
-                "PlanoAcaoEmergencial": [
-                    "Objetivo e escopo do plano",
-                    "Cenários e níveis de acionamento",
-                    "Protocolos operacionais e responsabilidades",
-                    "Recursos, logística e comunicação",
-                    "Cronograma e monitoramento",
-                ],
-                "OrcamentoIntervencoes": [
-                    "Premissas e critérios de estimativa",
-                    "Composição de custos e BDI (visão narrativa)",
-                    "Benefícios esperados e custo-efetividade",
-                    "Riscos orçamentários e mitigação",
-                ],
-                "PlanoTrabalhoPrevencao": [
-                    "Identificação do ente e objeto",
-                    "Justificativa técnica e jurídica",
-                    "Descrição detalhada das ações com localização",
-                    "Orçamento e cronograma físico-financeiro (narrativo)",
-                    "Metas, indicadores e governança",
-                ],
-                "RelatorioFotografico": [
-                    "Contexto e metodologia",
-                    "Descrição das evidências fotográficas",
-                    "Conclusões técnicas",
-                ],
-                "TermoResponsabilidadeTecnica": [
-                    "Identificação do responsável",
-                    "Declaração de responsabilidade",
-                    "Limitações e observâncias normativas",
-                ],
-            }
-            doc_sections = sections_map.get(doc_type, [
-                "Introdução",
-                "Contexto",
-                "Análise",
-                "Conclusão",
-            ])
-            llm_text = generate_legal_document_text(fund.name, doc_type, context or base_payload, doc_sections)
-        except Exception as e:
-            print(f"[doc_gen] LLM indisponível, usando template: {e}")
-
-        # 1) Se LLM gerou, produzir PDF com texto jurídico
-        if llm_text:
-            filename_pdf = f"{doc_type}_{process_id}.pdf"
-            out_path = save_document(process_id, filename_pdf, b"")
-            try:
-                create_pdf_from_text(out_path, title, [llm_text])
-                documents.append({
-                    "name": title,
-                    "type": doc_type,
-                    "path": out_path,
-                    "mime": "application/pdf",
-                    "prompt_version": "v2-llm-legal",
-                    "inputs_hash": hashlib.sha256(json.dumps(base_payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest(),
-                })
-                continue
-            except Exception as e:
-                print(f"[doc_gen] Falha ao renderizar PDF do LLM: {e}")
-
-        # 2) Tenta carregar template TXT/Jinja e gerar PDF simples
-        template_rel_path = None
-        if fund.code == "FNMC":
-            template_rel_path = os.path.join("fnmc", f"{doc_type}.txt.j2")
-            template_rel_url = f"fnmc/{doc_type}.txt.j2"
-        elif fund.code == "MDR":
-            template_rel_path = os.path.join("mdr", f"{doc_type}.txt.j2")
-            template_rel_url = f"mdr/{doc_type}.txt.j2"
-        elif fund.code == "FEP-EXEMPLO":
-            template_rel_path = os.path.join("fep-exemplo", f"{doc_type}.txt.j2")
-            template_rel_url = f"fep-exemplo/{doc_type}.txt.j2"
-        else:
-            template_rel_url = None
+    # Tipos gerados em mais de uma versão (templates diferentes) precisam de nomes distintos
+    versions = collections.Counter(key[0] for key in units)
 
-        pdf_generated = False
-        out_path = None
-        try:
-            if template_rel_path and os.path.exists(os.path.join(templates_root, template_rel_path)):
-                # Jinja funciona melhor com separador '/'
-                tpl_name = template_rel_url or template_rel_path.replace(os.sep, "/")
-                template = env.get_template(tpl_name)
-                rendered_text = template.render(context=context or {}, fund_name=fund.name)
-                filename_pdf = f"{doc_type}_{process_id}.pdf"
-                out_path = save_document(process_id, filename_pdf, b"")  # criar caminho
-                # Renderizar PDF simples
-                create_pdf_from_text(out_path, title, [rendered_text])
-                pdf_generated = True
-        except Exception as e:
-            print(f"[doc_gen] Falha ao gerar PDF com template {template_rel_path}: {e}")
-
-        if not pdf_generated:
-            # Fallback: texto jurídico composto localmente, sem JSON
-            content_text = _compose_fallback_legal_text(fund.name, doc_type, context or {}, form_data or {})
-            filename_pdf = f"{doc_type}_{process_id}.pdf"
-            out_path = save_document(process_id, filename_pdf, b"")
-            try:
-                create_pdf_from_text(out_path, title, [content_text])
-                pdf_generated = True
-            except Exception as e:
-                print(f"[doc_gen] Falha ao renderizar PDF fallback: {e}")
-                # como último recurso, salva TXT
-                filename = f"{doc_type}_{process_id}.txt"
-                out_path = save_document(process_id, filename, content_text.encode("utf-8"))
-
-        documents.append({
-            "name": title,
-            "type": doc_type,
-            "path": out_path,
-            "mime": "application/pdf" if pdf_generated else "text/plain",
-            "prompt_version": "v1",
-            "inputs_hash": hashlib.sha256(json.dumps(base_payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest(),
-        })
-
-    return documents
+    def run(key: tuple) -> Dict[str, Any]:
+        return _generate_document(units[key], key[0], process_id, base_payload, inputs_hash, context, form_data, versions[key[0]] > 1)
+
+    # Cada tarefa roda numa cópia do contexto: prazo (deadline_scope), request_id e métricas seguem junto
+    with ThreadPoolExecutor(max_workers=max(1, min(DOC_GEN_CONCURRENCY, len(units)))) as pool:
+        futures = {key: pool.submit(contextvars.copy_context().run, run, key) for key in units}
+        results = {key: future.result() for key, future in futures.items()}
+
+    by_fund: Dict[str, List[Dict[str, Any]]] = {f.code: [] for f in funds}
+    for key, owners in units.items():
+        for fund in owners:
+            by_fund[fund.code].append(results[key])
+    return by_fund
 
 
+def generate_documents_for_fund(
+    fund_code: str,
+    process_id: int,
+    zone_id: int | None,
+    form_data: Dict[str, Any],
+    photos: List[Dict[str, Any]],
+    context: Dict[str, Any] | None = None,
+):
+    return generate_documents_for_funds([fund_code], process_id, zone_id, form_data, photos, context)[fund_code]
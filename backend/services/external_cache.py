@@ -0,0 +1,167 @@
+"""Cache persistente (tabela external_cache_entry) para respostas de APIs externas.
+
+- Dentro do TTL: resposta do banco, sem rede (hit).
+- Vencida há menos de EXTERNAL_CACHE_MAX_STALE_S: devolve a cópia antiga e revalida em
+  segundo plano (stale-while-revalidate).
+- Sem cópia ou cópia antiga demais: busca na hora; se a fonte falhar e houver qualquer
+  cópia, ela é devolvida (stale-if-error), então consultas repetidas funcionam offline.
+
+Consultas simultâneas à mesma chave no processo compartilham uma única busca.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from backend import logs
+from backend.database import SessionLocal
+from backend.metrics import EXTERNAL_CACHE_REQUESTS
+from backend.models import ExternalCacheEntry
+
+
+MAX_STALE_S = float(os.getenv("EXTERNAL_CACHE_MAX_STALE_S", str(7 * 86400)))
+# Espera máxima de quem aguarda a busca de outra requisição para a mesma chave
+COALESCE_WAIT_S = float(os.getenv("EXTERNAL_CACHE_COALESCE_WAIT_S", "60"))
+REVALIDATE_WORKERS = int(os.getenv("EXTERNAL_CACHE_REVALIDATE_WORKERS", "4"))
+
+log = logs.get_logger("external_cache")
+
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+_revalidator = ThreadPoolExecutor(max_workers=max(1, REVALIDATE_WORKERS), thread_name_prefix="cache-revalidate")
+
+
+class SourceUnavailable(Exception):
+    """A fonte falhou e não há cópia em cache."""
+
+
+@dataclass
+class CachedValue:
+    value: Any
+    # hit | stale | miss
+    status: str
+    fetched_at: dt.datetime
+
+
+def _now() -> dt.datetime:
+    return dt.datetime.utcnow()
+
+
+def cache_key(source: str, params: Dict[str, Any]) -> str:
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{source}:{digest}"
+
+
+def _load(key: str) -> Optional[ExternalCacheEntry]:
+    db = SessionLocal()
+    try:
+        entry = db.query(ExternalCacheEntry).filter_by(key=key).first()
+        if entry is not None:
+            db.expunge(entry)
+        return entry
+    finally:
+        db.close()
+
+
+def _store(key: str, source: str, params: Dict[str, Any], value: Any, ttl_s: float) -> dt.datetime:
+    now = _now()
+    fields = {
+        "params_json": json.dumps(params, ensure_ascii=False),
+        "value_json": json.dumps(value, ensure_ascii=False),
+        "fetched_at": now,
+        "expires_at": now + dt.timedelta(seconds=ttl_s),
+    }
+    db = SessionLocal()
+    try:
+        updated = db.query(ExternalCacheEntry).filter_by(key=key).update(fields)
+        if not updated:
+            db.add(ExternalCacheEntry(key=key, source=source, **fields))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Outro worker inseriu a mesma chave entre o update e o insert
+            db.rollback()
+            db.query(ExternalCacheEntry).filter_by(key=key).update(fields)
+            db.commit()
+    finally:
+        db.close()
+    return now
+
+
+def _fetch_coalesced(key: str, source: str, params: Dict[str, Any], fetch: Callable[[], Any], ttl_s: float) -> CachedValue:
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+    if not leader:
+        return future.result(timeout=COALESCE_WAIT_S)
+    try:
+        value = fetch()
+        fetched_at = _store(key, source, params, value, ttl_s)
+        result = CachedValue(value, "miss", fetched_at)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _revalidate(key: str, source: str, params: Dict[str, Any], fetch: Callable[[], Any], ttl_s: float) -> None:
+    try:
+        _fetch_coalesced(key, source, params, fetch, ttl_s)
+    except Exception as e:
+        log.warning("Falha ao revalidar cache", extra={"source": source, "error": str(e)})
+
+
+def purge_expired() -> int:
+    """Remove entradas vencidas há mais de MAX_STALE_S (não servem nem como cópia antiga)."""
+    db = SessionLocal()
+    try:
+        cutoff = _now() - dt.timedelta(seconds=MAX_STALE_S)
+        removed = db.query(ExternalCacheEntry).filter(ExternalCacheEntry.expires_at < cutoff).delete()
+        db.commit()
+        return removed
+    finally:
+        db.close()
+
+
+def get(source: str, params: Dict[str, Any], fetch: Callable[[], Any], ttl_s: float) -> CachedValue:
+    """Valor de `fetch()` para (source, params), segundo a política descrita no módulo."""
+    key = cache_key(source, params)
+    entry = _load(key)
+    now = _now()
+    if entry is not None:
+        value = json.loads(entry.value_json)
+        if entry.expires_at > now:
+            EXTERNAL_CACHE_REQUESTS.inc(source=source, result="hit")
+            return CachedValue(value, "hit", entry.fetched_at)
+        if entry.expires_at + dt.timedelta(seconds=MAX_STALE_S) > now:
+            EXTERNAL_CACHE_REQUESTS.inc(source=source, result="stale")
+            with _inflight_lock:
+                refreshing = key in _inflight
+            if not refreshing:
+                _revalidator.submit(_revalidate, key, source, params, fetch, ttl_s)
+            return CachedValue(value, "stale", entry.fetched_at)
+    try:
+        result = _fetch_coalesced(key, source, params, fetch, ttl_s)
+    except Exception as e:
+        if entry is not None:
+            EXTERNAL_CACHE_REQUESTS.inc(source=source, result="stale")
+            log.warning("Fonte indisponível; usando cópia antiga do cache", extra={"source": source, "error": str(e)})
+            return CachedValue(json.loads(entry.value_json), "stale", entry.fetched_at)
+        EXTERNAL_CACHE_REQUESTS.inc(source=source, result="error")
+        raise SourceUnavailable(f"{source} indisponível: {e}") from e
+    EXTERNAL_CACHE_REQUESTS.inc(source=source, result="miss")
+    return result
@@ -1,7 +1,208 @@
+import asyncio
+import json
 import os
 import re
-from typing import List, Dict
-import google.generativeai as genai
+from typing import AsyncIterator, List, Dict, Iterator, Optional, Tuple
+
+from backend import logs
+from backend.metrics import timed
+from backend.services import llm_gateway, satellite_tiles
+from backend.services.resilience import CircuitOpenError, DeadlineExceeded
+from backend.services.prompt_context import PromptStats, compact_context, render_context, estimate_tokens
+
+
+# Cliente do Gemini, importado no primeiro uso (o pacote é pesado e atrasa a inicialização)
+genai = None
+
+
+def _genai():
+    global genai
+    if genai is None:
+        import google.generativeai as module
+        # Um substituto (stub de benchmark) pode ter sido instalado durante o import
+        if genai is None:
+            genai = module
+    return genai
+
+
+# Base da API do Gemini (ex.: http://127.0.0.1:8089 para o stub de benchmark); vazio = endpoint oficial
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "").strip()
+
+
+def _configure(api_key: str) -> None:
+    if GEMINI_API_ENDPOINT:
+        _genai().configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
+        _genai().configure(api_key=api_key)
+
+
+log = logs.get_logger("gemini")
+
+
+_DESCRIBE_PROMPT = (
+    "Analise a imagem com foco em: número de moradias visíveis, tipologia, "
+    "estado aparente, indícios de risco (encosta/drenagem), e referências geográficas. "
+    "Responda tecnicamente e objetivamente."
+)
+
+
+# Lote de fotos numa única requisição multimodal (1 desliga o modo em lote)
+BATCH_MAX_IMAGES = int(os.getenv("GEMINI_DESCRIBE_BATCH_MAX_IMAGES", "4"))
+# Limite da soma dos bytes das imagens de um lote (a API aceita ~20 MB inline por requisição)
+BATCH_MAX_BYTES = int(float(os.getenv("GEMINI_DESCRIBE_BATCH_MAX_MB", "8")) * 1024 * 1024)
+
+_BATCH_INSTRUCTIONS = (
+    "Você receberá {count} imagens, cada uma precedida do rótulo 'Imagem N'. Analise cada imagem "
+    "separadamente. Responda SOMENTE com JSON, sem texto fora dele, no formato: "
+    '{{"imagens": [{{"indice": 1, "descricao": "..."}}, ...]}} '
+    "com exatamente {count} itens, um por imagem, na mesma numeração."
+)
+
+
+# Início dos textos gravados quando o modelo não descreveu a foto (offline, falha, resposta vazia)
+_NON_MODEL_PREFIXES = ("[FALLBACK]", "[MODO OFFLINE]", "[ERRO]", "Erro ao processar imagem:", "Análise não disponível")
+
+
+def is_model_description(text: Optional[str]) -> bool:
+    """True se `text` foi produzido pelo modelo (e pode ser reaproveitado em outras fotos)."""
+    return bool(text) and not text.startswith(_NON_MODEL_PREFIXES)
+
+
+def _fallback_description(path: str) -> str:
+    return f"[FALLBACK] Descrição automática (sem IA ativa) – arquivo '{os.path.basename(path)}'."
+
+
+async def _describe_one(model, model_name: str, path: str) -> str:
+    try:
+        with timed("image_preprocess"):
+            with open(path, "rb") as f:
+                img_bytes = f.read()
+        contents = [_DESCRIBE_PROMPT, {"mime_type": "image/jpeg", "data": img_bytes}]
+        response = await llm_gateway.acall(
+            model_name,
+            lambda timeout: model.generate_content(contents, request_options={"timeout": timeout}),
+            key=llm_gateway.fingerprint(model_name, contents),
+            operation="describe_image",
+        )
+        return getattr(response, "text", None) or "Análise não disponível"
+    except (CircuitOpenError, DeadlineExceeded) as unavailable:
+        log.warning("Gemini indisponível; usando descrição offline", extra={"photo": os.path.basename(path), "error": str(unavailable)})
+        return _fallback_description(path)
+    except Exception as img_error:
+        log.error("Erro processando imagem", extra={"photo": os.path.basename(path), "model": model_name, "error": str(img_error)})
+        return f"Erro ao processar imagem: {os.path.basename(path)}"
+
+
+def plan_batches(paths: List[str], max_images: Optional[int] = None, max_bytes: Optional[int] = None) -> List[List[int]]:
+    """Agrupa índices consecutivos em lotes respeitando o número de imagens e o total de bytes.
+    Uma imagem maior que o limite vai sozinha."""
+    max_images = max(1, max_images or BATCH_MAX_IMAGES)
+    max_bytes = max_bytes or BATCH_MAX_BYTES
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_bytes = 0
+    for index, path in enumerate(paths):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if current and (len(current) >= max_images or current_bytes + size > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(index)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_response(text: str, count: int) -> Optional[List[str]]:
+    """Extrai as descrições de uma resposta em lote; None se faltar, sobrar ou repetir item."""
+    if not text:
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    items = data.get("imagens") if isinstance(data, dict) else None
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    descriptions: Dict[int, str] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        index, description = item.get("indice"), item.get("descricao")
+        if not isinstance(index, int) or not 1 <= index <= count or index in descriptions:
+            return None
+        if not isinstance(description, str) or not description.strip():
+            return None
+        descriptions[index] = description.strip()
+    return [descriptions[i] for i in range(1, count + 1)]
+
+
+async def _describe_batch(model, model_name: str, paths: List[str]) -> List[str]:
+    """Descreve várias fotos numa única requisição (prompt enviado uma vez). Se a resposta
+    não puder ser separada por foto, refaz as fotos do lote individualmente."""
+    if len(paths) == 1:
+        return [await _describe_one(model, model_name, paths[0])]
+    try:
+        with timed("image_preprocess"):
+            contents: list = [_DESCRIBE_PROMPT, _BATCH_INSTRUCTIONS.format(count=len(paths))]
+            for number, path in enumerate(paths, start=1):
+                with open(path, "rb") as f:
+                    contents += [f"Imagem {number}", {"mime_type": "image/jpeg", "data": f.read()}]
+        response = await llm_gateway.acall(
+            model_name,
+            lambda timeout: model.generate_content(contents, request_options={"timeout": timeout}),
+            key=llm_gateway.fingerprint(model_name, contents),
+            operation="describe_image_batch",
+        )
+        descriptions = parse_batch_response(getattr(response, "text", None) or "", len(paths))
+        if descriptions is not None:
+            return descriptions
+        log.warning("Resposta em lote fora do formato; descrevendo fotos individualmente", extra={"photos": len(paths), "model": model_name})
+    except (CircuitOpenError, DeadlineExceeded) as unavailable:
+        log.warning("Gemini indisponível; usando descrição offline", extra={"photos": len(paths), "error": str(unavailable)})
+        return [_fallback_description(p) for p in paths]
+    except Exception as batch_error:
+        log.warning("Falha na requisição em lote; descrevendo fotos individualmente", extra={"photos": len(paths), "model": model_name, "error": str(batch_error)})
+    return list(await asyncio.gather(*(_describe_one(model, model_name, p) for p in paths)))
+
+
+def _offline_description(path: str) -> str:
+    return (
+        f"[MODO OFFLINE] Análise automática: arquivo '{os.path.basename(path)}'. "
+        f"Estimativa: aproximadamente 3-5 residências visíveis na área. "
+        f"Para análise precisa, configure GEMINI_API_KEY."
+    )
+
+
+def _describe_model_names() -> List[str]:
+    """Modelos candidatos para descrever imagens, em ordem de preferência: 1.5 flash > 1.5 pro > demais."""
+    try:
+        available = llm_gateway.list_models(lambda timeout: _genai().list_models(request_options={"timeout": timeout}))
+        gc_models = [m for m in available if "generateContent" in getattr(m, "supported_generation_methods", [])]
+        def score(m):
+            name = getattr(m, "name", "").lower()
+            s = 0
+            if "1.5" in name:
+                s += 2
+            if "flash" in name:
+                s += 2
+            if "pro" in name:
+                s += 1
+            return s
+        candidates = sorted(gc_models, key=score, reverse=True)
+        candidate_names = [getattr(m, "name", "") for m in candidates]
+        if candidate_names:
+            return candidate_names
+        return ["models/gemini-2.5-flash", "models/gemini-2.5-pro"]  # fallback leve
+    except Exception as e_list:
+        log.warning("Falha ao listar modelos", extra={"error": str(e_list)})
+        return ["models/gemini-2.5-flash", "models/gemini-2.5-pro"]
 
 
 async def describe_images_with_gemini(paths: List[str]) -> List[str]:
@@ -11,110 +212,78 @@ async def describe_images_with_gemini(paths: List[str]) -> List[str]:
     de preferência: um modelo 1.5 "flash" com generateContent; depois um 1.5 "pro"; por fim,
     qualquer modelo com generateContent. Em caso de falha, retornamos fallback determinístico.
     """
+    descriptions: List[str] = [""] * len(paths)
+    async for index, description in iter_image_descriptions(paths):
+        descriptions[index] = description
+    return descriptions
+
+
+async def iter_image_descriptions(paths: List[str]) -> AsyncIterator[Tuple[int, str]]:
+    """Produz (índice, descrição) de cada imagem assim que fica pronta (ordem de término)."""
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         # Fallback determinístico para desenvolvimento offline.
-        return [
-            f"[MODO OFFLINE] Análise automática: arquivo '{os.path.basename(p)}'. "
-            f"Estimativa: aproximadamente 3-5 residências visíveis na área. "
-            f"Para análise precisa, configure GEMINI_API_KEY."
-            for p in paths
-        ]
+        for index, p in enumerate(paths):
+            yield index, _offline_description(p)
+        return
 
     try:
-        genai.configure(api_key=api_key)
+        _configure(api_key)
+        candidate_names = _describe_model_names()
 
-        # 1) Listar modelos com generateContent
-        try:
-            available = list(genai.list_models())
-            gc_models = [m for m in available if "generateContent" in getattr(m, "supported_generation_methods", [])]
-            # Ordenar por preferência: 1.5 flash > 1.5 pro > demais
-            def score(m):
-                name = getattr(m, "name", "").lower()
-                s = 0
-                if "1.5" in name:
-                    s += 2
-                if "flash" in name:
-                    s += 2
-                if "pro" in name:
-                    s += 1
-                return s
-            candidates = sorted(gc_models, key=score, reverse=True)
-            candidate_names = [getattr(m, "name", "") for m in candidates]
-            if not candidate_names:
-                candidate_names = ["models/gemini-2.5-flash", "models/gemini-2.5-pro"]  # fallback leve
-        except Exception as e_list:
-            print(f"Falha ao listar modelos: {e_list}")
-            candidate_names = ["models/gemini-2.5-flash", "models/gemini-2.5-pro"]
-
-        # 2) Tentar modelos até funcionar ao menos um
+        # Primeiro modelo que puder ser instanciado; erros por foto viram fallback em _describe_one
+        model = model_name = None
         last_error = None
-        for model_name in candidate_names:
+        for name in candidate_names:
             try:
-                model = genai.GenerativeModel(model_name)
-                results = []
-                for path in paths:
-                    try:
-                        with open(path, "rb") as f:
-                            img_bytes = f.read()
-                        prompt = (
-                            "Analise a imagem com foco em: número de moradias visíveis, tipologia, "
-                            "estado aparente, indícios de risco (encosta/drenagem), e referências geográficas. "
-                            "Responda tecnicamente e objetivamente."
-                        )
-                        response = model.generate_content([
-                            prompt,
-                            {"mime_type": "image/jpeg", "data": img_bytes},
-                        ])
-                        description = getattr(response, "text", None) or "Análise não disponível"
-                        results.append(description)
-                    except Exception as img_error:
-                        print(f"Erro processando imagem {path} com {model_name}: {img_error}")
-                        results.append(f"Erro ao processar imagem: {os.path.basename(path)}")
-                return results
+                model, model_name = _genai().GenerativeModel(name), name
+                break
             except Exception as model_error:
                 last_error = model_error
-                print(f"Modelo indisponível ({model_name}): {model_error}")
-                continue
-
-        # 3) Se nenhum modelo funcionou → fallback determinístico
-        print(f"Nenhum modelo Gemini funcionou: {last_error}")
-        return [
-            f"[FALLBACK] Descrição automática (sem IA ativa) – arquivo '{os.path.basename(p)}'."
-            for p in paths
-        ]
-    except Exception as e:
-        print(f"Erro geral na integração com Gemini: {e}")
-        return [
-            f"[ERRO] Não foi possível analisar '{os.path.basename(p)}'. Verifique GEMINI_API_KEY."
-            for p in paths
-        ]
-
-
-async def analyze_image_base64(image_data: bytes, coordinates: dict) -> Dict:
-    """
-    Analisa imagem de satélite (bytes) e retorna contagem de residências.
-    Usado para análise automática ao clicar em zona de risco.
-    """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        # Fallback offline: retorna valor mockado baseado em coordenadas
-        import random
-        random.seed(hash(str(coordinates)))
-        count = random.randint(15, 50)
-        return {
-            "residence_count": count,
-            "description": f"[MODO OFFLINE] Estimativa automática: {count} residências na área. Configure GEMINI_API_KEY para análise real.",
-            "confidence": 0.5
-        }
-
+                log.warning("Modelo indisponível", extra={"model": name, "error": str(model_error)})
+    except Exception:
+        log.exception("Erro geral na integração com Gemini")
+        for index, p in enumerate(paths):
+            yield index, f"[ERRO] Não foi possível analisar '{os.path.basename(p)}'. Verifique GEMINI_API_KEY."
+        return
+
+    if model is None:
+        log.error("Nenhum modelo Gemini funcionou", extra={"error": str(last_error)})
+        for index, p in enumerate(paths):
+            yield index, _fallback_description(p)
+        return
+
+    # Lotes em paralelo; o gateway limita a concorrência e o ritmo por modelo
+    batches = plan_batches(paths)
+    tasks = {
+        asyncio.ensure_future(_describe_batch(model, model_name, [paths[i] for i in batch])): batch
+        for batch in batches
+    }
     try:
-        # Configurar Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        
-        # Prompt focado em contagem precisa
-        prompt = """Analise esta imagem de satélite e conte EXATAMENTE quantas residências/moradias estão visíveis.
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: tasks[t][0]):
+                for index, description in zip(tasks[task], task.result()):
+                    yield index, description
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _offline_residence_estimate(coordinates: dict, note: str) -> Dict:
+    """Fallback offline: valor determinístico baseado nas coordenadas."""
+    import random
+    rng = random.Random(str(coordinates))
+    count = rng.randint(15, 50)
+    return {
+        "residence_count": count,
+        "description": f"[MODO OFFLINE] Estimativa automática: {count} residências na área. {note}",
+        "confidence": 0.5
+    }
+
+
+_SATELLITE_PROMPT = """Analise esta imagem de satélite e conte EXATAMENTE quantas residências/moradias estão visíveis.
 
 INSTRUÇÕES IMPORTANTES:
 - Conte APENAS estruturas que sejam claramente residências
@@ -130,35 +299,64 @@ Exemplo:
 TOTAL: 23 residências
 Área residencial de média densidade com casas predominantemente térreas. Construções em bom estado, algumas próximas a encostas. Vegetação esparsa ao redor.
 """
-        
-        # Gerar análise
-        response = model.generate_content([
-            prompt,
-            {"mime_type": "image/png", "data": image_data}
-        ])
-        
-        text = response.text or ""
-        
-        # Extrair número de residências
-        count = extract_residence_count(text)
-        
-        # Limpar a descrição (remover a linha TOTAL)
-        description_lines = [line for line in text.split('\n') if not line.startswith('TOTAL:')]
-        description = '\n'.join(description_lines).strip()
-        
-        # Confiança baseada na presença de número claro
-        confidence = 0.85 if count > 0 else 0.5
-        
-        print(f"🤖 Gemini analisou coordenadas {coordinates}: {count} residências")
-        
-        return {
-            "residence_count": count,
-            "description": description or "Análise não disponível",
-            "confidence": confidence
-        }
-        
+
+_TILE_NOTE = (
+    "\nEsta imagem é o bloco {number} de {total} de uma captura maior. Conte também as "
+    "residências cortadas na borda do bloco, se ao menos metade da construção estiver visível."
+)
+
+
+async def _count_residences(model, model_name: str, image_data: bytes, prompt: str, operation: str) -> Dict:
+    contents = [prompt, {"mime_type": "image/png", "data": image_data}]
+    response = await llm_gateway.acall(
+        model_name,
+        lambda timeout: model.generate_content(contents, request_options={"timeout": timeout}),
+        key=llm_gateway.fingerprint(model_name, contents),
+        operation=operation,
+    )
+
+    text = response.text or ""
+
+    # Extrair número de residências
+    count = extract_residence_count(text)
+
+    # Limpar a descrição (remover a linha TOTAL)
+    description_lines = [line for line in text.split('\n') if not line.startswith('TOTAL:')]
+    description = '\n'.join(description_lines).strip()
+
+    # Confiança baseada na presença de número claro
+    confidence = 0.85 if count > 0 else 0.5
+    return {
+        "residence_count": count,
+        "description": description or "Análise não disponível",
+        "confidence": confidence
+    }
+
+
+async def analyze_image_base64(image_data: bytes, coordinates: dict) -> Dict:
+    """
+    Analisa imagem de satélite (bytes) e retorna contagem de residências.
+    Usado para análise automática ao clicar em zona de risco.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return _offline_residence_estimate(coordinates, "Configure GEMINI_API_KEY para análise real.")
+
+    try:
+        # Configurar Gemini
+        _configure(api_key)
+        model_name = "gemini-1.5-flash"
+        model = _genai().GenerativeModel(model_name)
+
+        result = await _count_residences(model, model_name, image_data, _SATELLITE_PROMPT, "analyze_satellite")
+        log.info("Imagem de satélite analisada", extra={"coordinates": coordinates, "residences": result["residence_count"]})
+        return result
+
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        log.warning("Gemini indisponível; usando estimativa offline", extra={"error": str(e)})
+        return _offline_residence_estimate(coordinates, "Serviço de IA indisponível no momento.")
     except Exception as e:
-        print(f"❌ Erro na análise Gemini: {e}")
+        log.error("Erro na análise Gemini", extra={"error": str(e)})
         return {
             "residence_count": 0,
             "description": f"Erro ao analisar imagem: {str(e)}",
@@ -166,25 +364,103 @@ TOTAL: 23 residências
         }
 
 
+async def analyze_image_tiled(
+    image_data: bytes,
+    coordinates: dict,
+    tile_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+) -> Dict:
+    """Variante de analyze_image_base64 para capturas grandes: divide a imagem em blocos
+    sobrepostos, conta cada bloco em paralelo e combina as contagens descontando a
+    sobreposição (ver satellite_tiles). Retorna também a contagem por bloco.
+
+    ValueError se a imagem não abrir ou gerar blocos demais."""
+    tiles, crops, (width, height) = await asyncio.to_thread(satellite_tiles.split_image, image_data, tile_size)
+    concurrency = max(1, min(concurrency or satellite_tiles.TILE_CONCURRENCY, satellite_tiles.MAX_CONCURRENCY))
+    api_key = os.getenv("GEMINI_API_KEY")
+    offline_note = "Configure GEMINI_API_KEY para análise real."
+    results: List[Optional[Dict]] = [None] * len(tiles)
+
+    if api_key:
+        try:
+            _configure(api_key)
+            model_name = "gemini-1.5-flash"
+            model = _genai().GenerativeModel(model_name)
+        except Exception as e:
+            log.error("Erro na análise Gemini", extra={"error": str(e)})
+            model = None
+
+        if model is not None:
+            # O gateway ainda aplica o limite global por modelo; este limita o pedido
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def analyze_tile(index: int) -> None:
+                prompt = _SATELLITE_PROMPT + _TILE_NOTE.format(number=index + 1, total=len(tiles))
+                async with semaphore:
+                    try:
+                        results[index] = await _count_residences(model, model_name, crops[index], prompt, "analyze_satellite_tile")
+                    except Exception as e:
+                        log.warning("Falha ao analisar bloco da imagem", extra={"tile": index, "error": str(e)})
+
+            with timed("satellite_tiles"):
+                await asyncio.gather(*(analyze_tile(i) for i in range(len(tiles))))
+            offline_note = "Serviço de IA indisponível no momento."
+
+    rows = max(t.row for t in tiles) + 1
+    cols = max(t.col for t in tiles) + 1
+    size = satellite_tiles.tile_size_px(tile_size)
+    tiling = {
+        "tile_size": size,
+        "overlap": satellite_tiles.overlap_px(size),
+        "rows": rows,
+        "cols": cols,
+        "concurrency": concurrency,
+    }
+    merged = satellite_tiles.merge_counts(tiles, results)
+    merged["tiling"] = tiling
+    for item, result in zip(merged["tiles"], results):
+        item["description"] = result["description"] if result else None
+
+    if not any(results):
+        # Nenhum bloco analisado: a estimativa offline vale para a captura inteira (a mesma do
+        # modo sem blocos), sem passar pela combinação por área
+        merged.update(_offline_residence_estimate(coordinates, offline_note))
+        log.info("Imagem de satélite sem análise por blocos; estimativa offline", extra={"coordinates": coordinates, "tiles": len(tiles)})
+        return merged
+
+    densest = max((item for item in merged["tiles"] if item["residence_count"] is not None), key=lambda item: item["residence_count"])
+    merged["description"] = (
+        f"Análise em {len(tiles)} blocos sobrepostos ({rows}x{cols}) de uma imagem {width}x{height}: "
+        f"{merged['residence_count']} residências após descontar a sobreposição "
+        f"(soma simples dos blocos: {merged['naive_sum']}).\n"
+        f"Bloco mais denso (linha {densest['row'] + 1}, coluna {densest['col'] + 1}): {densest['description']}"
+    )
+    log.info(
+        "Imagem de satélite analisada em blocos",
+        extra={"coordinates": coordinates, "residences": merged["residence_count"], "tiles": len(tiles), "coverage": merged["coverage"]},
+    )
+    return merged
+
+
 def extract_residence_count(text: str) -> int:
     """
     Extrai o número de residências do texto do Gemini.
     Tenta múltiplos padrões para máxima compatibilidade.
     """
-    print(f"📄 Texto do Gemini para extração:\n{text}\n")
+    log.debug("Texto do Gemini para extração", extra={"payload": text})
     
     # Padrão 1: "TOTAL: X residências"
     match = re.search(r'TOTAL:\s*(\d+)', text, re.IGNORECASE)
     if match:
         count = int(match.group(1))
-        print(f"✅ Extraído via padrão TOTAL: {count}")
+        log.debug("Residências extraídas", extra={"pattern": "TOTAL", "residences": count})
         return count
     
     # Padrão 2: "X residências identificadas"
     match = re.search(r'(\d+)\s+residência', text, re.IGNORECASE)
     if match:
         count = int(match.group(1))
-        print(f"✅ Extraído via padrão 'X residências': {count}")
+        log.debug("Residências extraídas", extra={"pattern": "X residências", "residences": count})
         return count
     
     # Padrão 3: Outros padrões comuns
@@ -204,7 +480,7 @@ def extract_residence_count(text: str) -> int:
         match = re.search(pattern, text, re.IGNORECASE)
         if match:
             count = int(match.group(1))
-            print(f"✅ Extraído via padrão '{pattern}': {count}")
+            log.debug("Residências extraídas", extra={"pattern": pattern, "residences": count})
             return count
     
     # Fallback: pegar o primeiro número >= 1
@@ -212,10 +488,10 @@ def extract_residence_count(text: str) -> int:
     for num_str in numbers:
         num = int(num_str)
         if num >= 1 and num < 1000:  # Filtro razoável
-            print(f"⚠️ Usando primeiro número razoável encontrado: {num}")
+            log.info("Usando primeiro número razoável do texto", extra={"residences": num})
             return num
     
-    print(f"❌ Nenhum número de residências encontrado, retornando 0")
+    log.warning("Nenhum número de residências encontrado; retornando 0")
     return 0
 
 
@@ -227,9 +503,9 @@ def _pick_text_model() -> str:
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise RuntimeError("GEMINI_API_KEY ausente")
-    genai.configure(api_key=api_key)
+    _configure(api_key)
     try:
-        available = list(genai.list_models())
+        available = llm_gateway.list_models(lambda timeout: _genai().list_models(request_options={"timeout": timeout}))
         gc_models = [m for m in available if "generateContent" in getattr(m, "supported_generation_methods", [])]
         def score(m):
             name = getattr(m, "name", "").lower()
@@ -245,27 +521,22 @@ def _pick_text_model() -> str:
         if best:
             return getattr(best[0], "name", "models/gemini-2.0-pro")
     except Exception as e:
-        print(f"Falha ao listar modelos de texto: {e}")
+        log.warning("Falha ao listar modelos de texto", extra={"error": str(e)})
     return "models/gemini-2.0-pro"
 
 
-def generate_legal_document_text(fund_name: str, doc_type: str, context: dict, sections: List[str]) -> str:
-    """Gera texto longo, formal e jurídico em PT-BR para o documento solicitado.
-
-    O output NÃO deve conter JSON; apenas o texto final formatado em seções, com
-    títulos, parágrafos e linguagem administrativa.
-    """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY ausente")
-
-    model_name = _pick_text_model()
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name)
-
+def build_legal_prompt(
+    fund_name: str,
+    doc_type: str,
+    context: dict,
+    sections: List[str],
+    token_budget: Optional[int] = None,
+) -> Tuple[str, PromptStats]:
+    """Monta o prompt jurídico com o contexto compactado para o tipo de documento."""
+    compact, stats = compact_context(doc_type, context, token_budget)
     context_hint = (
         "Este é o contexto resumido do processo (NÃO reproduzir como JSON no resultado, use apenas como fonte de dados):\n"
-        + str(context)
+        + render_context(compact)
     )
 
     estrutura = "\n".join([f"- {s}" for s in sections])
@@ -292,7 +563,65 @@ Diretrizes adicionais:
 
 Produza o documento completo agora. O resultado deve ser apenas o texto final com seções e parágrafos.
 """
+    stats.prompt_tokens = estimate_tokens(prompt)
+    return prompt, stats
+
 
-    resp = model.generate_content(prompt)
+def generate_legal_document_text(
+    fund_name: str,
+    doc_type: str,
+    context: dict,
+    sections: List[str],
+    token_budget: Optional[int] = None,
+) -> str:
+    """Gera texto longo, formal e jurídico em PT-BR para o documento solicitado.
+
+    O output NÃO deve conter JSON; apenas o texto final formatado em seções, com
+    títulos, parágrafos e linguagem administrativa.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY ausente")
+
+    model_name = _pick_text_model()
+    _configure(api_key)
+    model = _genai().GenerativeModel(model_name)
+
+    prompt, stats = build_legal_prompt(fund_name, doc_type, context, sections, token_budget)
+    log.info("Prompt montado", extra=stats.dict())
+
+    resp = llm_gateway.call(
+        model_name,
+        lambda timeout: model.generate_content(prompt, request_options={"timeout": timeout}),
+        key=llm_gateway.fingerprint(model_name, prompt),
+        operation="legal_text",
+    )
     return getattr(resp, "text", "")
 
+
+def stream_legal_document_text(
+    fund_name: str,
+    doc_type: str,
+    context: dict,
+    sections: List[str],
+    token_budget: Optional[int] = None,
+) -> Iterator[str]:
+    """Versão em streaming de `generate_legal_document_text`: produz os trechos de texto
+    conforme o modelo os gera, para pré-visualização incremental."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY ausente")
+
+    model_name = _pick_text_model()
+    _configure(api_key)
+    model = _genai().GenerativeModel(model_name)
+
+    prompt, stats = build_legal_prompt(fund_name, doc_type, context, sections, token_budget)
+    log.info("Prompt montado (stream)", extra=stats.dict())
+
+    for chunk in llm_gateway.stream(
+        model_name, lambda timeout: model.generate_content(prompt, stream=True, request_options={"timeout": timeout})
+    ):
+        text = getattr(chunk, "text", "")
+        if text:
+            yield text
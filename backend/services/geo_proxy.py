@@ -0,0 +1,214 @@
+"""Proxy com cache para as fontes públicas usadas pelo mapa de risco.
+
+Mesmas fontes de src/services/geocoding.ts, elevation.ts e infrastructure.ts (Nominatim,
+malha municipal do IBGE, Open-Elevation, Overpass), mais a previsão do Open-Meteo. TTLs
+seguem memory_bank/constraints.txt (IBGE 24 h, Open-Meteo 1–3 h) e podem ser ajustados
+por GEO_TTL_<FONTE>_S. Requisições ao Nominatim são feitas uma por vez, a no máximo 1 por
+segundo (política de uso do serviço público), inclusive durante a pré-carga.
+
+    python -m backend.services.geo_proxy cidades.csv   # pré-carrega (colunas ibge,nome,uf)
+"""
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from backend import logs
+from backend.services import external_cache
+
+
+USER_AGENT = "ClimaSeguro/1.0 (Risk Assessment Platform)"
+
+NOMINATIM_URL = os.getenv("GEO_NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+IBGE_MALHA_URL = os.getenv("GEO_IBGE_MALHA_URL", "https://servicodados.ibge.gov.br/api/v3/malhas/municipios")
+IBGE_MUNICIPIOS_URL = os.getenv("GEO_IBGE_MUNICIPIOS_URL", "https://servicodados.ibge.gov.br/api/v1/localidades/municipios")
+OPEN_ELEVATION_URL = os.getenv("GEO_OPEN_ELEVATION_URL", "https://api.open-elevation.com/api/v1/lookup")
+OVERPASS_URL = os.getenv("GEO_OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+OPEN_METEO_URL = os.getenv("GEO_OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+
+
+def _ttl(source: str, default_s: float) -> float:
+    return float(os.getenv(f"GEO_TTL_{source.upper()}_S", str(default_s)))
+
+
+# (TTL, timeout da requisição) por fonte; timeouts iguais aos de src/constants/apiEndpoints.ts
+SOURCES: Dict[str, Dict[str, float]] = {
+    "nominatim": {"ttl": _ttl("nominatim", 7 * 86400), "timeout": 10},
+    "ibge_malha": {"ttl": _ttl("ibge_malha", 86400), "timeout": 15},
+    "ibge_municipio": {"ttl": _ttl("ibge_municipio", 86400), "timeout": 15},
+    "open_elevation": {"ttl": _ttl("open_elevation", 30 * 86400), "timeout": 20},
+    "overpass": {"ttl": _ttl("overpass", 86400), "timeout": 30},
+    "open_meteo": {"ttl": _ttl("open_meteo", 2 * 3600), "timeout": 10},
+}
+
+# Parâmetros do Open-Meteo repassados pelo proxy
+OPEN_METEO_PARAMS = ("hourly", "daily", "current", "past_days", "forecast_days", "timezone")
+PRELOAD_CONCURRENCY = int(os.getenv("GEO_PRELOAD_CONCURRENCY", "4"))
+# Cidades por chamada a /geo/preload (o Nominatim limita o ritmo: ~1 s por cidade nova)
+PRELOAD_MAX_CITIES = int(os.getenv("GEO_PRELOAD_MAX_CITIES", "50"))
+# Intervalo mínimo entre requisições por fonte; a política de uso do Nominatim público
+# permite no máximo 1 requisição por segundo
+MIN_INTERVAL_S: Dict[str, float] = {
+    "nominatim": float(os.getenv("GEO_NOMINATIM_MIN_INTERVAL_S", "1.0")),
+}
+# Limites das consultas vindas do cliente (cada variação vira uma entrada no cache)
+ELEVATION_MAX_POINTS = int(os.getenv("GEO_ELEVATION_MAX_POINTS", "100"))
+OVERPASS_MAX_QUERY_CHARS = int(os.getenv("GEO_OVERPASS_MAX_QUERY_CHARS", "10000"))
+
+log = logs.get_logger("geo_proxy")
+
+
+class _Throttle:
+    """Uma requisição por vez à fonte, com ao menos `interval_s` entre o início de cada uma
+    (compartilhado por todas as threads do processo)."""
+
+    def __init__(self, interval_s: float) -> None:
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._last = float("-inf")
+
+    def __enter__(self) -> None:
+        self._lock.acquire()
+        wait = self._last + self.interval_s - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last = time.monotonic()
+
+    def __exit__(self, *exc) -> None:
+        self._lock.release()
+
+
+_throttles = {source: _Throttle(interval) for source, interval in MIN_INTERVAL_S.items() if interval > 0}
+
+
+def _request_json(source: str, url: str, data: Optional[bytes] = None, content_type: Optional[str] = None) -> Any:
+    headers = {"Accept": "application/json", "User-Agent": USER_AGENT}
+    if content_type:
+        headers["Content-Type"] = content_type
+    request = urllib.request.Request(url, data=data, headers=headers, method="POST" if data is not None else "GET")
+    throttle = _throttles.get(source)
+    if throttle is None:
+        with urllib.request.urlopen(request, timeout=SOURCES[source]["timeout"]) as response:
+            return json.loads(response.read().decode("utf-8"))
+    with throttle:
+        with urllib.request.urlopen(request, timeout=SOURCES[source]["timeout"]) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+
+def _cached(source: str, params: Dict[str, Any], fetch) -> external_cache.CachedValue:
+    return external_cache.get(source, params, fetch, SOURCES[source]["ttl"])
+
+
+def geocode(municipio: str, uf: str) -> external_cache.CachedValue:
+    params = {"municipio": municipio.strip().lower(), "uf": uf.strip().upper()}
+    query = urllib.parse.urlencode({
+        "format": "json", "q": f"{municipio}, {uf}, Brasil", "limit": 1, "addressdetails": 1,
+    })
+    return _cached("nominatim", params, lambda: _request_json("nominatim", f"{NOMINATIM_URL}?{query}"))
+
+
+def ibge_malha(codigo: str) -> external_cache.CachedValue:
+    url = f"{IBGE_MALHA_URL}/{urllib.parse.quote(codigo)}?formato=application/vnd.geo+json"
+    return _cached("ibge_malha", {"codigo": codigo}, lambda: _request_json("ibge_malha", url))
+
+
+def ibge_municipio(codigo: str) -> external_cache.CachedValue:
+    url = f"{IBGE_MUNICIPIOS_URL}/{urllib.parse.quote(codigo)}"
+    return _cached("ibge_municipio", {"codigo": codigo}, lambda: _request_json("ibge_municipio", url))
+
+
+def elevation(locations: List[Dict[str, float]]) -> external_cache.CachedValue:
+    # ~1 m de precisão: pontos praticamente iguais compartilham a entrada do cache
+    points = [{"latitude": round(float(p["latitude"]), 5), "longitude": round(float(p["longitude"]), 5)} for p in locations]
+    body = json.dumps({"locations": points}).encode("utf-8")
+    return _cached(
+        "open_elevation", {"locations": points},
+        lambda: _request_json("open_elevation", OPEN_ELEVATION_URL, body, "application/json"),
+    )
+
+
+def overpass(query: str) -> external_cache.CachedValue:
+    body = urllib.parse.urlencode({"data": query}).encode("utf-8")
+    return _cached(
+        "overpass", {"query": query},
+        lambda: _request_json("overpass", OVERPASS_URL, body, "application/x-www-form-urlencoded"),
+    )
+
+
+def forecast(lat: float, lon: float, options: Optional[Dict[str, str]] = None) -> external_cache.CachedValue:
+    params: Dict[str, Any] = {"latitude": round(lat, 3), "longitude": round(lon, 3)}
+    params.update({k: v for k, v in (options or {}).items() if k in OPEN_METEO_PARAMS and v})
+    params.setdefault("daily", "precipitation_sum")
+    params.setdefault("timezone", "America/Sao_Paulo")
+    url = f"{OPEN_METEO_URL}?{urllib.parse.urlencode(params)}"
+    return _cached("open_meteo", params, lambda: _request_json("open_meteo", url))
+
+
+def _bbox_center(geocoded: Any) -> Optional[Dict[str, float]]:
+    if isinstance(geocoded, list) and geocoded:
+        try:
+            return {"lat": float(geocoded[0]["lat"]), "lon": float(geocoded[0]["lon"])}
+        except (KeyError, TypeError, ValueError):
+            return None
+    return None
+
+
+def _preload_city(city: Dict[str, str]) -> Dict[str, Any]:
+    """Aquece as entradas usadas ao abrir uma cidade no mapa: município e malha do IBGE,
+    geocodificação e previsão no centro do município."""
+    outcome: Dict[str, Any] = {"city": city, "sources": {}}
+
+    def attempt(name: str, fn):
+        try:
+            cached = fn()
+            outcome["sources"][name] = cached.status
+            return cached.value
+        except Exception as e:
+            outcome["sources"][name] = f"error: {e}"
+            return None
+
+    codigo = (city.get("ibge") or "").strip()
+    if codigo:
+        attempt("ibge_municipio", lambda: ibge_municipio(codigo))
+        attempt("ibge_malha", lambda: ibge_malha(codigo))
+    center = None
+    if city.get("nome") and city.get("uf"):
+        center = _bbox_center(attempt("nominatim", lambda: geocode(city["nome"], city["uf"])))
+    if center:
+        attempt("open_meteo", lambda: forecast(center["lat"], center["lon"]))
+    return outcome
+
+
+def preload(cities: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    with ThreadPoolExecutor(max_workers=max(1, PRELOAD_CONCURRENCY)) as pool:
+        results = list(pool.map(_preload_city, cities))
+    log.info("Cache geográfico pré-carregado", extra={"cities": len(cities)})
+    return results
+
+
+def main(argv: List[str]) -> int:
+    if not argv:
+        print(__doc__)
+        return 2
+    from backend.database import engine
+    from backend.models import Base
+
+    Base.metadata.create_all(bind=engine)
+    with open(argv[0], newline="", encoding="utf-8") as f:
+        cities = [{k: (v or "").strip() for k, v in row.items() if k} for row in csv.DictReader(f)]
+    for result in preload(cities):
+        city = result["city"]
+        print(f"{city.get('ibge') or '-':>8} {city.get('nome', ''):<30} " + " ".join(f"{k}={v}" for k, v in result["sources"].items()))
+    return 0
+
+
+if __name__ == "__main__":
+    logs.setup()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,184 @@
+"""Suporte a `Idempotency-Key` para POSTs caros (fotos e geração de documentos).
+
+A primeira requisição com uma chave reserva o registro (estado in_progress) e executa o
+trabalho; a resposta de sucesso fica gravada por IDEMPOTENCY_TTL_S. Retentativas com a
+mesma chave recebem a resposta gravada ou, se a original ainda estiver em andamento,
+aguardam o término em vez de repetir Gemini, PDFs e inserções no banco.
+"""
+
+import asyncio
+import datetime as dt
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+from backend import logs
+from backend.database import SessionLocal
+from backend.models import IdempotencyRecord
+
+
+TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+# Tempo máximo que uma retentativa espera pela requisição original em andamento
+WAIT_S = float(os.getenv("IDEMPOTENCY_WAIT_S", "120"))
+POLL_S = float(os.getenv("IDEMPOTENCY_POLL_S", "0.25"))
+# Reserva in_progress mais antiga que isso é considerada abandonada (ex.: servidor reiniciado)
+STALE_S = float(os.getenv("IDEMPOTENCY_STALE_S", "600"))
+MAX_KEY_LENGTH = 255
+
+log = logs.get_logger("idempotency")
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    body: Any
+
+
+def _now() -> dt.datetime:
+    return dt.datetime.utcnow()
+
+
+def request_hash(parts: Iterable[Tuple[str, bytes]]) -> str:
+    """Hash do conteúdo relevante da requisição, para detectar reuso da chave com outro payload."""
+    h = hashlib.sha256()
+    for name, data in parts:
+        h.update(name.encode("utf-8"))
+        h.update(hashlib.sha256(data).digest())
+    return h.hexdigest()
+
+
+def _validate_key(key: str) -> None:
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key deve ter entre 1 e {MAX_KEY_LENGTH} caracteres")
+
+
+def _insert(db, scope: str, key: str, req_hash: str) -> bool:
+    now = _now()
+    db.add(IdempotencyRecord(
+        scope=scope, key=key, request_hash=req_hash, state="in_progress",
+        created_at=now, expires_at=now + dt.timedelta(seconds=TTL_S),
+    ))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+def _try_claim(scope: str, key: str, req_hash: str) -> Tuple[bool, Optional[IdempotencyRecord]]:
+    """Tenta reservar a chave: (True, None) se a reserva foi nossa; (False, registro) se já
+    existe; (False, None) se o registro sumiu ou venceu e vale tentar de novo."""
+    db = SessionLocal()
+    try:
+        if _insert(db, scope, key, req_hash):
+            return True, None
+        existing = db.query(IdempotencyRecord).filter_by(scope=scope, key=key).first()
+        if existing is None:
+            return False, None
+        now = _now()
+        expired = existing.expires_at < now
+        stale = existing.state == "in_progress" and existing.created_at < now - dt.timedelta(seconds=STALE_S)
+        if expired or stale:
+            db.delete(existing)
+            db.commit()
+            return False, None
+        db.expunge(existing)
+        return False, existing
+    finally:
+        db.close()
+
+
+def begin(scope: str, key: str, req_hash: str) -> Optional[StoredResponse]:
+    """Reserva a chave para esta requisição (retorna None) ou devolve a resposta gravada.
+    Se a original estiver em andamento, aguarda até IDEMPOTENCY_WAIT_S (bloqueante)."""
+    _validate_key(key)
+    deadline = time.monotonic() + WAIT_S
+    waited = False
+    while True:
+        claimed, existing = _try_claim(scope, key, req_hash)
+        if claimed:
+            return None
+        if existing is not None:
+            if existing.request_hash != req_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key já usada com outro conteúdo de requisição")
+            if existing.state == "completed":
+                log.info("Resposta idempotente reaproveitada", extra={"scope": scope, "waited": waited})
+                return StoredResponse(existing.status_code or 200, json.loads(existing.response_json or "null"))
+        # Em andamento, ou o registro sumiu entre o insert e a leitura: mesma espera e prazo
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="Requisição com esta Idempotency-Key ainda em andamento")
+        waited = True
+        time.sleep(POLL_S)
+
+
+def complete(scope: str, key: str, status_code: int, body: Any) -> None:
+    db = SessionLocal()
+    try:
+        record = db.query(IdempotencyRecord).filter_by(scope=scope, key=key).first()
+        if record is not None:
+            record.state = "completed"
+            record.status_code = status_code
+            record.response_json = json.dumps(body, ensure_ascii=False)
+            record.expires_at = _now() + dt.timedelta(seconds=TTL_S)
+            db.commit()
+    finally:
+        db.close()
+
+
+def abandon(scope: str, key: str) -> None:
+    """Libera a chave após falha, para que a retentativa execute o trabalho de novo."""
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyRecord).filter_by(scope=scope, key=key, state="in_progress").delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def purge_expired() -> int:
+    db = SessionLocal()
+    try:
+        removed = db.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at < _now()).delete()
+        db.commit()
+        return removed
+    finally:
+        db.close()
+
+
+def run(scope: str, key: Optional[str], req_hash: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+    """Executa `fn` sob a chave (versão síncrona). Retorna (corpo, reaproveitado)."""
+    if not key:
+        return fn(), False
+    stored = begin(scope, key, req_hash)
+    if stored is not None:
+        return stored.body, True
+    try:
+        body = fn()
+    except BaseException:
+        abandon(scope, key)
+        raise
+    complete(scope, key, 200, body)
+    return body, False
+
+
+async def arun(scope: str, key: Optional[str], req_hash: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """Como `run`, para endpoints assíncronos: a espera e o acesso ao banco saem do event loop."""
+    if not key:
+        return await fn(), False
+    stored = await asyncio.to_thread(begin, scope, key, req_hash)
+    if stored is not None:
+        return stored.body, True
+    try:
+        body = await fn()
+    except BaseException:
+        await asyncio.to_thread(abandon, scope, key)
+        raise
+    await asyncio.to_thread(complete, scope, key, 200, body)
+    return body, False
@@ -0,0 +1,323 @@
+"""Gateway único para chamadas de saída ao Gemini.
+
+- Single-flight: requisições idênticas em andamento viram uma única chamada; as demais
+  aguardam e recebem o mesmo resultado (ou a mesma exceção).
+- Limite por modelo: token bucket (RPM) + teto de concorrência. Quem excede entra na fila
+  e espera a vez, em vez de falhar com 429 do provedor.
+- Resiliência: cada chamada respeita o prazo da requisição, com retentativas e circuit
+  breaker por modelo (ver `resilience`).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from backend import logs
+from backend.metrics import LLM_CALLS, LLM_CALL_SECONDS, record_stage, stage_thread
+from backend.services import resilience
+from backend.services.resilience import Deadline, DeadlineExceeded
+
+T = TypeVar("T")
+
+
+DEFAULT_RPM = float(os.getenv("GEMINI_RPM", "60"))
+DEFAULT_BURST = float(os.getenv("GEMINI_BURST", "10"))
+DEFAULT_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+MODEL_LIST_TTL_S = float(os.getenv("GEMINI_MODEL_LIST_TTL_S", "600"))
+
+log = logs.get_logger("llm_gateway")
+
+
+def _model_overrides() -> Dict[str, Dict[str, float]]:
+    """Limites específicos por modelo, ex.: GEMINI_MODEL_LIMITS='{"models/gemini-2.5-pro": {"rpm": 5, "concurrency": 2}}'."""
+    raw = os.getenv("GEMINI_MODEL_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except Exception as e:
+        log.warning("GEMINI_MODEL_LIMITS inválido, ignorando", extra={"error": str(e)})
+        return {}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, capacity: float) -> None:
+        self.rate = rate_per_s
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Bloqueia até haver um token disponível; False se `timeout` acabar antes."""
+        limit = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if limit is not None:
+                if now + wait > limit:
+                    return False
+            time.sleep(wait)
+
+
+class _ModelLimiter:
+    def __init__(self, rpm: float, burst: float, concurrency: int) -> None:
+        self.bucket = TokenBucket(rpm / 60.0, burst)
+        self.semaphore = threading.BoundedSemaphore(max(1, concurrency))
+        self.waiting = 0
+        self.active = 0
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Coalesce chamadas concorrentes com a mesma chave numa única execução."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+                self.coalesced += 1
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise DeadlineExceeded(f"Prazo esgotado aguardando chamada idêntica em andamento ({key})")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+
+_limiters: Dict[str, _ModelLimiter] = {}
+_limiters_lock = threading.Lock()
+_flight = SingleFlight()
+
+_model_list: Optional[List[Any]] = None
+_model_list_at = 0.0
+
+
+def _limiter(model: str) -> _ModelLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            cfg = _model_overrides().get(model, {})
+            rpm = float(cfg.get("rpm", DEFAULT_RPM))
+            limiter = _ModelLimiter(
+                rpm=rpm,
+                burst=float(cfg.get("burst", min(DEFAULT_BURST, rpm))),
+                concurrency=int(cfg.get("concurrency", DEFAULT_CONCURRENCY)),
+            )
+            _limiters[model] = limiter
+        return limiter
+
+
+@contextmanager
+def slot(model: str, deadline: Optional[Deadline] = None) -> Iterator[None]:
+    """Reserva uma vaga do modelo (token + concorrência), aguardando na fila se preciso.
+    Com `deadline`, desiste com DeadlineExceeded se a vez não chegar a tempo."""
+    limiter = _limiter(model)
+    with _limiters_lock:
+        limiter.waiting += 1
+    try:
+        if not limiter.bucket.acquire(deadline.remaining() if deadline else None):
+            raise DeadlineExceeded(f"Prazo esgotado na fila de '{model}' (limite de taxa)")
+        if not limiter.semaphore.acquire(timeout=deadline.remaining() if deadline else None):
+            raise DeadlineExceeded(f"Prazo esgotado na fila de '{model}' (concorrência)")
+    finally:
+        with _limiters_lock:
+            limiter.waiting -= 1
+    with _limiters_lock:
+        limiter.active += 1
+    try:
+        yield
+    finally:
+        with _limiters_lock:
+            limiter.active -= 1
+        limiter.semaphore.release()
+
+
+def fingerprint(*parts: Any) -> str:
+    """Chave estável de uma requisição; bytes (imagens) entram pelo hash do conteúdo."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray)):
+            h.update(hashlib.sha256(part).digest())
+        elif isinstance(part, dict):
+            for k in sorted(part):
+                h.update(str(k).encode("utf-8"))
+                h.update(fingerprint(part[k]).encode("ascii"))
+        elif isinstance(part, (list, tuple)):
+            for p in part:
+                h.update(fingerprint(p).encode("ascii"))
+        else:
+            h.update(repr(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _outcome(error: Optional[BaseException]) -> str:
+    if error is None:
+        return "ok"
+    if isinstance(error, resilience.CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, DeadlineExceeded):
+        return "deadline"
+    if isinstance(error, TimeoutError) or type(error).__name__ == "DeadlineExceeded":
+        return "timeout"
+    return "error"
+
+
+def _timed_attempt(model: str, operation: str, fn: Callable[[], T]) -> T:
+    start = time.perf_counter()
+    error: Optional[BaseException] = None
+    try:
+        return fn()
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        outcome = _outcome(error)
+        # Espera na fila local não é chamada ao provedor
+        if outcome != "deadline":
+            elapsed = time.perf_counter() - start
+            LLM_CALL_SECONDS.observe(elapsed, model=model, operation=operation, outcome=outcome)
+            LLM_CALLS.inc(model=model, operation=operation, outcome=outcome)
+            record_stage("llm_call", elapsed, model=model, operation=operation, outcome=outcome)
+
+
+def call(model: str, fn: Callable[[float], T], key: Optional[str] = None, operation: str = "generate") -> T:
+    """Executa `fn(timeout)` (a chamada ao modelo) sob o limite do modelo, com prazo,
+    retentativas e circuit breaker; com `key`, chamadas idênticas em andamento são coalescidas."""
+    deadline = resilience.current_deadline()
+    circuit = resilience.breaker(f"gemini:{model}")
+    led = False
+
+    def attempt(timeout: float) -> T:
+        with slot(model, deadline):
+            return _timed_attempt(model, operation, lambda: fn(min(timeout, deadline.remaining())))
+
+    def run() -> T:
+        nonlocal led
+        led = True
+        with stage_thread():
+            return resilience.call_with_retries(attempt, circuit, deadline)
+
+    try:
+        if key is None:
+            return run()
+        result = _flight.do(f"{model}:{key}", run, timeout=deadline.remaining())
+        if not led:
+            LLM_CALLS.inc(model=model, operation=operation, outcome="coalesced")
+        return result
+    except (resilience.CircuitOpenError, DeadlineExceeded) as e:
+        LLM_CALLS.inc(model=model, operation=operation, outcome=_outcome(e))
+        raise
+
+
+async def acall(model: str, fn: Callable[[float], T], key: Optional[str] = None, operation: str = "generate") -> T:
+    """Versão assíncrona de `call`: a espera e a chamada bloqueante rodam fora do event loop."""
+    return await asyncio.to_thread(call, model, fn, key, operation)
+
+
+def stream(model: str, fn: Callable[[float], Iterator[T]]) -> Iterator[T]:
+    """Itera uma resposta em streaming mantendo a vaga do modelo até o fim (sem coalescer nem
+    repetir: trechos já entregues não podem ser refeitos)."""
+    deadline = resilience.current_deadline()
+    circuit = resilience.breaker(f"gemini:{model}")
+    if not circuit.allow():
+        LLM_CALLS.inc(model=model, operation="stream", outcome="circuit_open")
+        raise resilience.CircuitOpenError(f"Circuito 'gemini:{model}' aberto")
+    start = time.perf_counter()
+    try:
+        with slot(model, deadline):
+            start = time.perf_counter()
+            yield from fn(deadline.remaining())
+    except (DeadlineExceeded, resilience.CircuitOpenError) as e:
+        circuit.release_probe()
+        LLM_CALLS.inc(model=model, operation="stream", outcome=_outcome(e))
+        raise
+    except BaseException as e:
+        if resilience.is_retryable(e):
+            circuit.record_failure()
+        elif resilience.is_provider_rejection(e):
+            circuit.record_success()
+        else:
+            circuit.release_probe()
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, model=model, operation="stream", outcome=_outcome(e))
+        LLM_CALLS.inc(model=model, operation="stream", outcome=_outcome(e))
+        raise
+    circuit.record_success()
+    LLM_CALL_SECONDS.observe(time.perf_counter() - start, model=model, operation="stream", outcome="ok")
+    LLM_CALLS.inc(model=model, operation="stream", outcome="ok")
+
+
+def list_models(fetch: Callable[[float], List[Any]]) -> List[Any]:
+    """Lista de modelos com cache por GEMINI_MODEL_LIST_TTL_S; listagens simultâneas viram uma só.
+    `fetch(timeout)` é chamado sem retentativas, sob o circuit breaker da listagem."""
+    global _model_list, _model_list_at
+    if _model_list is not None and time.monotonic() - _model_list_at < MODEL_LIST_TTL_S:
+        return _model_list
+
+    deadline = resilience.current_deadline()
+
+    def refresh() -> List[Any]:
+        global _model_list, _model_list_at
+        models = resilience.call_with_retries(
+            lambda timeout: list(fetch(timeout)),
+            resilience.breaker("gemini:list_models"),
+            deadline,
+            max_retries=0,
+        )
+        _model_list, _model_list_at = models, time.monotonic()
+        return models
+
+    return _flight.do("__list_models__", refresh, timeout=deadline.remaining())
+
+
+def stats() -> Dict[str, Any]:
+    with _limiters_lock:
+        return {
+            "coalesced": _flight.coalesced,
+            "models": {
+                name: {
+                    "waiting": lim.waiting,
+                    "active": lim.active,
+                    "circuit": resilience.breaker(f"gemini:{name}").state,
+                }
+                for name, lim in _limiters.items()
+            },
+        }
@@ -0,0 +1,159 @@
+"""Detecção de fotos quase idênticas no upload (hash perceptual).
+
+Vistorias costumam ter várias fotos praticamente iguais do mesmo talude ou bueiro. Cada
+foto recebe um dHash de 64 bits; se estiver a até PHOTO_DEDUP_MAX_DISTANCE bits de uma
+foto já descrita do mesmo processo (ou da mesma zona, com PHOTO_DEDUP_SCOPE=zone) ou de
+outra foto do mesmo envio, a descrição é reaproveitada e as fotos ficam ligadas por
+`duplicate_of_id`, sem nova chamada ao modelo.
+
+Só descrições produzidas pelo modelo são reaproveitadas: textos de fallback (offline, erro)
+não entram no índice, e as repetições de uma original que o modelo não descreveu voltam a
+ser enviadas ao modelo.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from backend import logs
+from backend.database import SessionLocal
+from backend.metrics import PHOTO_DEDUP_SAVED_CALLS
+from backend.models import PreventionProcess, ProcessPhoto
+from backend.services.gemini import is_model_description
+
+
+ENABLED = os.getenv("PHOTO_DEDUP", "true").lower() in {"1", "true", "yes"}
+# Distância de Hamming máxima (0-64) para considerar duas fotos a mesma cena
+MAX_DISTANCE = int(os.getenv("PHOTO_DEDUP_MAX_DISTANCE", "6"))
+# process | zone
+SCOPE = os.getenv("PHOTO_DEDUP_SCOPE", "process").lower()
+
+log = logs.get_logger("photo_dedup")
+
+
+@dataclass
+class PhotoMatch:
+    phash: Optional[str] = None
+    # Foto já gravada com descrição reaproveitável
+    existing_id: Optional[int] = None
+    existing_description: Optional[str] = None
+    # Índice, no mesmo envio, da foto original (que será descrita pelo modelo)
+    batch_original: Optional[int] = None
+    distance: Optional[int] = None
+
+    @property
+    def needs_model(self) -> bool:
+        return self.existing_id is None and self.batch_original is None
+
+
+def compute_phash(path: str) -> Optional[str]:
+    """dHash: imagem em cinza 9x8, um bit por comparação de pixels vizinhos na linha."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as img:
+            small = img.convert("L").resize((9, 8), Image.LANCZOS)
+            pixels = list(small.getdata())
+    except Exception as e:
+        log.warning("Não foi possível calcular hash perceptual", extra={"photo": os.path.basename(path), "error": str(e)})
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def _known_hashes(process_id: int, zone_id: Optional[int]) -> List[Tuple[int, str, str]]:
+    """(id, phash, descrição) das fotos originais já descritas no escopo configurado."""
+    db = SessionLocal()
+    try:
+        query = db.query(ProcessPhoto.id, ProcessPhoto.phash, ProcessPhoto.description_ai).filter(
+            ProcessPhoto.phash.isnot(None),
+            ProcessPhoto.description_ai.isnot(None),
+            ProcessPhoto.duplicate_of_id.is_(None),
+        )
+        if SCOPE == "zone" and zone_id is not None:
+            query = query.join(PreventionProcess, PreventionProcess.id == ProcessPhoto.process_id).filter(
+                PreventionProcess.zone_id == zone_id
+            )
+        else:
+            query = query.filter(ProcessPhoto.process_id == process_id)
+        # Fotos gravadas com texto de fallback não servem de referência
+        return [(row[0], row[1], row[2]) for row in query.all() if is_model_description(row[2])]
+    finally:
+        db.close()
+
+
+def _closest(phash: str, candidates: List[Tuple[object, str]]) -> Tuple[Optional[object], Optional[int]]:
+    best, best_distance = None, None
+    for ref, other in candidates:
+        distance = hamming(phash, other)
+        if distance <= MAX_DISTANCE and (best_distance is None or distance < best_distance):
+            best, best_distance = ref, distance
+    return best, best_distance
+
+
+def plan(process_id: int, zone_id: Optional[int], paths: List[str]) -> List[PhotoMatch]:
+    """Classifica cada foto do envio: reaproveita uma existente, repete outra do próprio envio
+    ou precisa do modelo."""
+    if not ENABLED:
+        return [PhotoMatch() for _ in paths]
+    known = _known_hashes(process_id, zone_id)
+    existing = [((photo_id, description), phash) for photo_id, phash, description in known]
+    batch: List[Tuple[int, str]] = []
+    matches: List[PhotoMatch] = []
+    for index, path in enumerate(paths):
+        phash = compute_phash(path)
+        match = PhotoMatch(phash=phash)
+        if phash is not None:
+            ref, distance = _closest(phash, existing)
+            if ref is not None:
+                match.existing_id, match.existing_description = ref
+                match.distance = distance
+            else:
+                original, distance = _closest(phash, batch)
+                if original is not None:
+                    match.batch_original, match.distance = original, distance
+                else:
+                    batch.append((index, phash))
+        matches.append(match)
+    saved = sum(1 for m in matches if not m.needs_model)
+    if saved:
+        log.info("Fotos quase idênticas reaproveitadas", extra={"photos": len(paths), "saved_calls": saved, "scope": SCOPE})
+    return matches
+
+
+def followers(matches: List[PhotoMatch], original: int) -> List[int]:
+    """Índices do envio que repetem a foto `original`."""
+    return [i for i, m in enumerate(matches) if m.batch_original == original]
+
+
+def detach(matches: List[PhotoMatch], original: int) -> List[int]:
+    """A foto `original` não recebeu descrição do modelo: sua hash não é gravada (não vira
+    referência) e as fotos do envio que a repetiam passam a precisar do modelo. Retorna os
+    índices liberados."""
+    matches[original].phash = None
+    freed = followers(matches, original)
+    for index in freed:
+        matches[index].batch_original = None
+        matches[index].distance = None
+    return freed
+
+
+def summary(matches: List[PhotoMatch]) -> Dict[str, int]:
+    """Resumo do envio, já com as fotos liberadas por `detach`; registra a economia."""
+    saved = sum(1 for m in matches if not m.needs_model)
+    if saved:
+        PHOTO_DEDUP_SAVED_CALLS.inc(saved, scope=SCOPE)
+    return {
+        "photos": len(matches),
+        "modelCalls": len(matches) - saved,
+        "modelCallsSaved": saved,
+    }
@@ -0,0 +1,264 @@
+"""Exportação dos processos de prevenção com fotos e documentos, em uma tabela achatada.
+
+Cada processo gera uma linha record_type=process seguida de uma linha por foto (photo) e
+por documento gerado (document); todas repetem as colunas do processo, então o arquivo
+pode ser filtrado por tipo sem junções. Formatos: CSV e Parquet (requer pyarrow).
+
+Os processos são lidos em lotes de EXPORT_BATCH_SIZE por chave (id), e fotos/documentos de
+cada lote chegam por cursores no servidor (stream_results), intercalados por processo. A
+memória usada não depende do tamanho do banco: no máximo um lote de processos e um grupo
+de linhas do Parquet (EXPORT_ROW_GROUP_SIZE) por vez.
+"""
+
+import csv
+import datetime as dt
+import io
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from backend import logs
+from backend.database import engine
+from backend.funds.matching import level_key
+from backend.models import GeneratedDocument, PreventionProcess, ProcessPhoto
+
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "10000"))
+# Tamanho aproximado de cada bloco enviado ao cliente no CSV
+CSV_CHUNK_BYTES = 256 * 1024
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# (coluna, tipo); tipos: int, float, str, datetime
+COLUMNS: List[Tuple[str, str]] = [
+    ("record_type", "str"),
+    ("process_id", "int"),
+    ("zone_id", "int"),
+    ("status", "str"),
+    ("risk_level", "str"),
+    ("process_created_at", "datetime"),
+    ("process_updated_at", "datetime"),
+    ("zone_lat", "float"),
+    ("zone_lon", "float"),
+    ("prevention_cost_total", "float"),
+    ("context_json", "str"),
+    ("photo_id", "int"),
+    ("photo_path", "str"),
+    ("photo_description", "str"),
+    ("photo_duplicate_of_id", "int"),
+    ("photo_created_at", "datetime"),
+    ("document_id", "int"),
+    ("document_fund_code", "str"),
+    ("document_type", "str"),
+    ("document_path", "str"),
+    ("document_mime_type", "str"),
+    ("document_size_bytes", "int"),
+    ("document_prompt_version", "str"),
+    ("document_created_at", "datetime"),
+]
+_PHOTO_WIDTH = 5
+_DOCUMENT_WIDTH = 8
+
+log = logs.get_logger("process_export")
+
+
+class ExportUnavailable(Exception):
+    """Formato pedido depende de um pacote não instalado."""
+
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _process_cells(row) -> tuple:
+    try:
+        ctx = json.loads(row.context_json or "{}")
+    except ValueError:
+        ctx = {}
+    if not isinstance(ctx, dict):
+        ctx = {}
+    zone = ctx.get("zone") if isinstance(ctx.get("zone"), dict) else {}
+    coords = zone.get("coordinates") if isinstance(zone.get("coordinates"), dict) else {}
+    financials = ctx.get("financials") if isinstance(ctx.get("financials"), dict) else {}
+    return (
+        row.id, row.zone_id, row.status, row.risk_level, row.created_at, row.updated_at,
+        _float(coords.get("lat")), _float(coords.get("lon")),
+        _float(financials.get("custo_prevencao_total")), row.context_json,
+    )
+
+
+def _children(conn, columns, model, ids: List[int]):
+    stmt = select(model.process_id, *columns).where(model.process_id.in_(ids)).order_by(model.process_id, model.id)
+    return conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(stmt)
+
+
+def iter_rows(
+    status: Optional[str] = None,
+    zone_id: Optional[int] = None,
+    risk_level: Optional[str] = None,
+    created_from: Optional[dt.datetime] = None,
+    created_to: Optional[dt.datetime] = None,
+) -> Iterator[tuple]:
+    """Linhas na ordem de COLUMNS, por processo (id crescente)."""
+    process_stmt = select(
+        PreventionProcess.id, PreventionProcess.zone_id, PreventionProcess.status, PreventionProcess.risk_level,
+        PreventionProcess.created_at, PreventionProcess.updated_at, PreventionProcess.context_json,
+    )
+    if status is not None:
+        process_stmt = process_stmt.where(PreventionProcess.status == status)
+    if zone_id is not None:
+        process_stmt = process_stmt.where(PreventionProcess.zone_id == zone_id)
+    if risk_level is not None:
+        process_stmt = process_stmt.where(PreventionProcess.risk_level == level_key(risk_level))
+    if created_from is not None:
+        process_stmt = process_stmt.where(PreventionProcess.created_at >= created_from)
+    if created_to is not None:
+        process_stmt = process_stmt.where(PreventionProcess.created_at < created_to)
+
+    photo_columns = (ProcessPhoto.id, ProcessPhoto.file_path, ProcessPhoto.description_ai, ProcessPhoto.duplicate_of_id, ProcessPhoto.created_at)
+    document_columns = (
+        GeneratedDocument.id, GeneratedDocument.fund_code, GeneratedDocument.document_type, GeneratedDocument.file_path,
+        GeneratedDocument.mime_type, GeneratedDocument.size_bytes, GeneratedDocument.prompt_version, GeneratedDocument.created_at,
+    )
+    no_photo = (None,) * _PHOTO_WIDTH
+    no_document = (None,) * _DOCUMENT_WIDTH
+
+    after = 0
+    while True:
+        # Uma conexão por lote, devolvida ao pool antes do lote seguinte
+        with engine.connect() as conn:
+            processes = conn.execute(
+                process_stmt.where(PreventionProcess.id > after).order_by(PreventionProcess.id).limit(EXPORT_BATCH_SIZE)
+            ).all()
+            if not processes:
+                return
+            ids = [p.id for p in processes]
+            photos = iter(_children(conn, photo_columns, ProcessPhoto, ids))
+            documents = iter(_children(conn, document_columns, GeneratedDocument, ids))
+            photo = next(photos, None)
+            document = next(documents, None)
+            for process in processes:
+                base = _process_cells(process)
+                yield ("process",) + base + no_photo + no_document
+                while photo is not None and photo[0] == process.id:
+                    yield ("photo",) + base + tuple(photo[1:]) + no_document
+                    photo = next(photos, None)
+                while document is not None and document[0] == process.id:
+                    yield ("document",) + base + no_photo + tuple(document[1:])
+                    document = next(documents, None)
+        after = ids[-1]
+        if len(processes) < EXPORT_BATCH_SIZE:
+            return
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, dt.datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def stream_csv(rows: Iterator[tuple]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM: o Excel reconhece o UTF-8 (acentos) ao abrir o arquivo
+    buffer.write("\ufeff")
+    writer.writerow([name for name, _ in COLUMNS])
+    for row in rows:
+        writer.writerow([_csv_value(v) for v in row])
+        if buffer.tell() >= CSV_CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+class _Drain:
+    """Arquivo em que o ParquetWriter escreve; o que já foi escrito sai por `take()`."""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ExportUnavailable("Exportação em Parquet requer o pacote pyarrow")
+    types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string(), "datetime": pa.timestamp("us")}
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+def stream_parquet(rows: Iterator[tuple]) -> Iterator[bytes]:
+    """Um row group a cada EXPORT_ROW_GROUP_SIZE linhas, enviado assim que é escrito."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def flush(columns: List[list]) -> bytes:
+        table = pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema)
+        writer.write_table(table, row_group_size=len(table))
+        return sink.take()
+
+    columns: List[list] = [[] for _ in COLUMNS]
+    count = 0
+    try:
+        for row in rows:
+            for col, value in zip(columns, row):
+                col.append(value)
+            count += 1
+            if count == EXPORT_ROW_GROUP_SIZE:
+                yield flush(columns)
+                columns = [[] for _ in COLUMNS]
+                count = 0
+        if count:
+            yield flush(columns)
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export(fmt: str, filters: Dict[str, Any]) -> Tuple[Iterator[bytes], str, str]:
+    """(blocos do arquivo, media type, nome do arquivo) para o formato `fmt`."""
+    media_type, extension = FORMATS[fmt]
+    if fmt == "parquet":
+        # Falha antes de a resposta começar, se pyarrow não estiver instalado
+        _arrow_schema()
+    rows = iter_rows(**filters)
+    chunks = stream_parquet(rows) if fmt == "parquet" else stream_csv(rows)
+    filename = f"processos_{dt.datetime.utcnow():%Y%m%d_%H%M%S}.{extension}"
+    log.info("Exportação iniciada", extra={"export_format": fmt, **{k: str(v) for k, v in filters.items() if v is not None}})
+    return chunks, media_type, filename
@@ -0,0 +1,183 @@
+"""Importação em lote de zonas de risco como processos de prevenção.
+
+Aceita JSON lines (um objeto por linha: {"zone_id": 12, "context": {...}}) ou CSV com a
+coluna zone_id e, opcionalmente, context (JSON), level, lat e lon. As zonas que já têm
+processo em aberto (ou que se repetem no próprio arquivo) são ignoradas; as demais são
+inseridas em transações de IMPORT_BATCH_SIZE linhas.
+
+O arquivo é lido linha a linha de um arquivo temporário (ver `spool`), limitado a
+IMPORT_MAX_MB bytes e IMPORT_MAX_ROWS zonas.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Tuple
+
+from backend import logs
+from backend.database import SessionLocal
+from backend.metrics import timed
+from backend.models import PreventionProcess
+
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "20000"))
+IMPORT_MAX_BYTES = int(float(os.getenv("IMPORT_MAX_MB", "10")) * 1024 * 1024)
+# Acima disso o corpo recebido vai para disco em vez de ficar em memória
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Status que encerram um processo; qualquer outro conta como processo em aberto para a zona
+CLOSED_STATUSES = ("closed", "cancelled", "archived")
+
+log = logs.get_logger("process_import")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class ImportTooLarge(ImportFormatError):
+    """Corpo acima de IMPORT_MAX_MB (413)."""
+
+
+class ImportTooManyRows(ImportFormatError):
+    """Mais de IMPORT_MAX_ROWS zonas no arquivo (422)."""
+
+
+def check_declared_size(content_length: str | None) -> None:
+    """Recusa pelo Content-Length, antes de ler o corpo."""
+    if content_length and content_length.isdigit() and int(content_length) > IMPORT_MAX_BYTES:
+        raise ImportTooLarge(f"Arquivo maior que {IMPORT_MAX_BYTES / (1024 * 1024):g} MB")
+
+
+async def spool(chunks: AsyncIterator[bytes]) -> BinaryIO:
+    """Copia o corpo recebido para um arquivo temporário, interrompendo ao passar de
+    IMPORT_MAX_BYTES (vale também para uploads sem Content-Length)."""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    received = 0
+    try:
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > IMPORT_MAX_BYTES:
+                raise ImportTooLarge(f"Arquivo maior que {IMPORT_MAX_BYTES / (1024 * 1024):g} MB")
+            out.write(chunk)
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+@dataclass
+class ImportResult:
+    created: List[Dict[str, int]] = field(default_factory=list)
+    skipped: List[Dict[str, Any]] = field(default_factory=list)
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def dict(self) -> Dict[str, Any]:
+        return {
+            "created": self.created,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "summary": {"created": len(self.created), "skipped": len(self.skipped), "errors": len(self.errors)},
+        }
+
+
+def _zone_context(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Contexto inicial do processo; level/lat/lon soltos (CSV) completam context.zone."""
+    ctx = record.get("context") or {}
+    if isinstance(ctx, str):
+        ctx = json.loads(ctx) if ctx.strip() else {}
+    if not isinstance(ctx, dict):
+        raise ValueError("context deve ser um objeto JSON")
+    zone = dict(ctx.get("zone") or {})
+    zone.setdefault("id", record["zone_id"])
+    if record.get("level") and "level" not in zone:
+        zone["level"] = record["level"]
+    if record.get("lat") not in (None, "") and record.get("lon") not in (None, "") and "coordinates" not in zone:
+        zone["coordinates"] = {"lat": float(record["lat"]), "lon": float(record["lon"])}
+    ctx["zone"] = zone
+    return ctx
+
+
+def parse_records(body: BinaryIO, content_type: str) -> Tuple[List[Tuple[int, int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Converte o arquivo em [(linha, zone_id, contexto)] e a lista de erros por linha, lendo
+    uma linha por vez."""
+    text = io.TextIOWrapper(body, encoding="utf-8-sig", newline="")
+    if "csv" in (content_type or ""):
+        rows = ((number, row) for number, row in enumerate(csv.DictReader(text), start=2))
+    else:
+        def json_lines():
+            for number, line in enumerate(text, start=1):
+                if line.strip():
+                    yield number, line
+        rows = json_lines()
+
+    records: List[Tuple[int, int, Dict[str, Any]]] = []
+    errors: List[Dict[str, Any]] = []
+    for number, raw in rows:
+        if len(records) + len(errors) >= IMPORT_MAX_ROWS:
+            raise ImportTooManyRows(f"Máximo de {IMPORT_MAX_ROWS} zonas por importação")
+        try:
+            record = json.loads(raw) if isinstance(raw, str) else raw
+            if not isinstance(record, dict):
+                raise ValueError("linha deve ser um objeto JSON")
+            zone_id = int(record.get("zone_id"))
+            record["zone_id"] = zone_id
+            records.append((number, zone_id, _zone_context(record)))
+        except (TypeError, ValueError) as e:
+            errors.append({"line": number, "detail": str(e) or "zone_id inválido"})
+    return records, errors
+
+
+def _open_processes(db, zone_ids: List[int]) -> Dict[int, int]:
+    """{zone_id: id do processo em aberto} para as zonas informadas."""
+    found: Dict[int, int] = {}
+    for start in range(0, len(zone_ids), IMPORT_BATCH_SIZE):
+        chunk = zone_ids[start:start + IMPORT_BATCH_SIZE]
+        rows = (
+            db.query(PreventionProcess.zone_id, PreventionProcess.id)
+            .filter(PreventionProcess.zone_id.in_(chunk), PreventionProcess.status.notin_(CLOSED_STATUSES))
+            .all()
+        )
+        for zone_id, process_id in rows:
+            found.setdefault(zone_id, process_id)
+    return found
+
+
+def import_zones(body: BinaryIO, content_type: str) -> ImportResult:
+    records, errors = parse_records(body, content_type)
+    result = ImportResult(errors=errors)
+    db = SessionLocal()
+    try:
+        with timed("process_import"):
+            existing = _open_processes(db, sorted({zone_id for _, zone_id, _ in records}))
+            pending: List[Tuple[int, Dict[str, Any]]] = []
+            seen: Dict[int, int] = {}
+            for number, zone_id, ctx in records:
+                if zone_id in existing:
+                    result.skipped.append({"line": number, "zoneId": zone_id, "reason": "open_process", "processId": existing[zone_id]})
+                elif zone_id in seen:
+                    result.skipped.append({"line": number, "zoneId": zone_id, "reason": "duplicate_in_file", "firstLine": seen[zone_id]})
+                else:
+                    seen[zone_id] = number
+                    pending.append((zone_id, ctx))
+
+            # Uma transação por lote: um INSERT multi-linha por flush, ids devolvidos pelo banco
+            for start in range(0, len(pending), IMPORT_BATCH_SIZE):
+                processes = []
+                for zone_id, ctx in pending[start:start + IMPORT_BATCH_SIZE]:
+                    process = PreventionProcess(zone_id=zone_id, status="draft")
+                    process.set_context(ctx)
+                    processes.append(process)
+                db.add_all(processes)
+                db.flush()
+                created = [{"zoneId": p.zone_id, "processId": p.id} for p in processes]
+                db.commit()
+                result.created.extend(created)
+    finally:
+        db.close()
+    log.info("Zonas importadas", extra={"imported": len(result.created), "skipped": len(result.skipped), "invalid": len(result.errors)})
+    return result
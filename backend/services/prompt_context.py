@@ -0,0 +1,144 @@
+import json
+import os
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Orçamento padrão (em tokens estimados) para o bloco de contexto do prompt
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1200"))
+
+# Limites do resumo de fotos
+_PHOTO_CHARS_START = 600
+_PHOTO_CHARS_MIN = 80
+
+# Campos do contexto relevantes para cada tipo de documento. "photos" entra resumido.
+_FIELDS_BY_DOC_TYPE: Dict[str, Tuple[str, ...]] = {
+    "OficioNotificacao": ("zone", "demographics", "form", "notification"),
+    "RelatorioTecnicoRisco": ("zone", "demographics", "financials", "form", "photos"),
+    "PlanoAcaoEmergencial": ("zone", "demographics", "form"),
+    "OrcamentoIntervencoes": ("zone", "demographics", "financials"),
+    "PlanoTrabalhoPrevencao": ("zone", "demographics", "financials", "form", "photos"),
+    "RelatorioFotografico": ("zone", "form", "photos"),
+    "TermoResponsabilidadeTecnica": ("zone", "form"),
+    "PlanoAcaoMunicipal": ("zone", "demographics", "financials"),
+}
+_DEFAULT_FIELDS = ("zone", "demographics", "financials", "form", "photos")
+
+# Subcampos do formulário usados por cada documento (os demais são descartados)
+_FORM_FIELDS_BY_DOC_TYPE: Dict[str, Tuple[str, ...]] = {
+    "OficioNotificacao": ("responsavel", "data_vistoria", "acao_imediata"),
+    "PlanoAcaoEmergencial": ("data_vistoria", "observacoes", "acao_imediata"),
+    "TermoResponsabilidadeTecnica": ("responsavel", "data_vistoria"),
+}
+
+
+@dataclass
+class PromptStats:
+    doc_type: str
+    budget_tokens: int
+    context_tokens_raw: int
+    context_tokens: int
+    prompt_tokens: int = 0
+    photos_total: int = 0
+    photos_included: int = 0
+
+    def dict(self):
+        return asdict(self)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token em PT-BR)."""
+    return (len(text) + 3) // 4
+
+
+def _dump(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+def _summarize_photos(photos: List[Dict[str, Any]], budget_tokens: int) -> Tuple[Dict[str, Any], int]:
+    """Resumo das descrições de fotos dentro do orçamento: sem caminhos, sem duplicatas e
+    encurtando cada descrição (e, se preciso, a quantidade de fotos) até caber."""
+    descriptions: List[str] = []
+    seen = set()
+    for p in photos or []:
+        desc = " ".join(str((p or {}).get("description") or "").split())
+        if desc and desc not in seen:
+            seen.add(desc)
+            descriptions.append(desc)
+
+    limit = _PHOTO_CHARS_START
+    while True:
+        items = [_shorten(d, limit) for d in descriptions]
+        summary = {"total": len(photos or []), "descricoes": items}
+        if estimate_tokens(_dump(summary)) <= budget_tokens or limit <= _PHOTO_CHARS_MIN:
+            break
+        limit //= 2
+
+    # Ainda acima do orçamento com o menor corte: mantém as primeiras e informa o restante
+    while len(items) > 1 and estimate_tokens(_dump(summary)) > budget_tokens:
+        items = items[:-1]
+        summary = {
+            "total": len(photos or []),
+            "descricoes": items,
+            "omitidas": len(descriptions) - len(items),
+        }
+    return summary, len(items)
+
+
+def compact_context(
+    doc_type: str,
+    context: Optional[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+) -> Tuple[Dict[str, Any], PromptStats]:
+    """Seleciona os campos do contexto usados por `doc_type` e resume as fotos para caber
+    em `token_budget` tokens estimados."""
+    context = dict(context or {})
+    # doc_gen pode passar o payload base com o contexto aninhado
+    if isinstance(context.get("context"), dict):
+        nested = dict(context.pop("context"))
+        for key, value in context.items():
+            nested.setdefault(key, value)
+        context = nested
+
+    budget = token_budget or DEFAULT_CONTEXT_TOKEN_BUDGET
+    fields = _FIELDS_BY_DOC_TYPE.get(doc_type, _DEFAULT_FIELDS)
+    form_fields = _FORM_FIELDS_BY_DOC_TYPE.get(doc_type)
+
+    compact: Dict[str, Any] = {}
+    for key in fields:
+        if key == "photos":
+            continue
+        value = context.get(key)
+        if not value:
+            continue
+        if key == "form" and form_fields and isinstance(value, dict):
+            value = {k: v for k, v in value.items() if k in form_fields and v}
+        compact[key] = value
+
+    photos = context.get("photos") or []
+    photos_included = 0
+    if "photos" in fields and photos:
+        remaining = max(budget - estimate_tokens(_dump(compact)), budget // 4)
+        compact["fotos"], photos_included = _summarize_photos(photos, remaining)
+
+    stats = PromptStats(
+        doc_type=doc_type,
+        budget_tokens=budget,
+        context_tokens_raw=estimate_tokens(str(context)),
+        context_tokens=estimate_tokens(_dump(compact)),
+        photos_total=len(photos),
+        photos_included=photos_included,
+    )
+    return compact, stats
+
+
+def render_context(compact: Dict[str, Any]) -> str:
+    return _dump(compact)
@@ -0,0 +1,208 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from backend import logs
+
+T = TypeVar("T")
+
+
+# Orçamento total de tempo de uma requisição HTTP para chamadas ao modelo
+REQUEST_BUDGET_S = float(os.getenv("GEMINI_REQUEST_BUDGET_S", "90"))
+# Orçamento de uma chamada isolada quando não há orçamento de requisição ativo
+CALL_BUDGET_S = float(os.getenv("GEMINI_CALL_BUDGET_S", "45"))
+ATTEMPT_TIMEOUT_S = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT_S", "30"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY_S = float(os.getenv("GEMINI_RETRY_BASE_DELAY_S", "0.5"))
+RETRY_MAX_DELAY_S = float(os.getenv("GEMINI_RETRY_MAX_DELAY_S", "8"))
+BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("GEMINI_BREAKER_RESET_S", "30"))
+
+log = logs.get_logger("resilience")
+
+
+class DeadlineExceeded(TimeoutError):
+    """O orçamento de tempo da requisição acabou antes de obter resposta do modelo."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Circuito aberto: o provedor falhou repetidamente e as chamadas vão direto ao fallback."""
+
+
+class Deadline:
+    def __init__(self, seconds: float) -> None:
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float = REQUEST_BUDGET_S) -> Iterator[Deadline]:
+    """Define o orçamento de tempo para as chamadas ao modelo feitas dentro do bloco.
+    Um escopo aninhado nunca estende o prazo de um escopo externo."""
+    outer = _current_deadline.get()
+    deadline = Deadline(seconds)
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Deadline:
+    return _current_deadline.get() or Deadline(CALL_BUDGET_S)
+
+
+class CircuitBreaker:
+    """Abre após `failure_threshold` falhas seguidas; após `reset_timeout_s` deixa passar uma
+    chamada de teste (meio-aberto) e fecha de novo se ela funcionar."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_timeout_s: float = BREAKER_RESET_S) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Libera a chamada de teste sem alterar o estado (falha local, não do provedor)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probe_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probe_in_flight:
+                    log.warning("Circuito aberto", extra={"circuit": self.name, "failures": self.failures})
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        b = _breakers.get(name)
+        if b is None:
+            b = _breakers[name] = CircuitBreaker(name)
+        return b
+
+
+def is_open(name: str) -> bool:
+    b = _breakers.get(name)
+    return b is not None and b.state == "open"
+
+
+# Erros transitórios do provedor (nomes das exceções do google.api_core e afins)
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+    "TooManyRequests", "GatewayTimeout", "BadGateway", "Aborted", "Unknown",
+    "TimeoutError", "ConnectionError", "ConnectionResetError", "RemoteDisconnected",
+}
+_RETRYABLE_MARKERS = ("429", "500", "502", "503", "504", "timeout", "timed out", "unavailable", "overloaded")
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if type(error).__name__ in _RETRYABLE_NAMES or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _RETRYABLE_MARKERS)
+
+
+def is_provider_rejection(error: BaseException) -> bool:
+    """Resposta 4xx do provedor (requisição inválida, permissão, conteúdo bloqueado): o
+    provedor está respondendo, então o erro não indica indisponibilidade."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return True
+    return any(cls.__name__ == "ClientError" for cls in type(error).__mro__)
+
+
+def call_with_retries(
+    fn: Callable[[float], T],
+    circuit: CircuitBreaker,
+    deadline: Optional[Deadline] = None,
+    max_retries: int = MAX_RETRIES,
+) -> T:
+    """Executa `fn(timeout)` com retentativas limitadas (backoff exponencial com jitter total),
+    respeitando o prazo e o circuito. `timeout` é o tempo restante, limitado por tentativa."""
+    deadline = deadline or current_deadline()
+    attempt = 0
+    while True:
+        if not circuit.allow():
+            raise CircuitOpenError(f"Circuito '{circuit.name}' aberto")
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Orçamento de tempo esgotado antes de chamar '{circuit.name}'")
+        try:
+            result = fn(min(ATTEMPT_TIMEOUT_S, remaining))
+        except (DeadlineExceeded, CircuitOpenError):
+            # Prazo esgotado na fila local: nada a concluir sobre o provedor
+            circuit.release_probe()
+            raise
+        except BaseException as e:
+            if not is_retryable(e):
+                if is_provider_rejection(e):
+                    # O provedor respondeu; o erro é da própria requisição e não conta para o circuito
+                    circuit.record_success()
+                else:
+                    # Erro local (ex.: bug ou cancelamento): nada a concluir sobre o provedor
+                    circuit.release_probe()
+                raise
+            circuit.record_failure()
+            if attempt >= max_retries or circuit.state == "open":
+                raise
+            delay = random.uniform(0, min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * (2 ** attempt)))
+            if delay >= deadline.remaining():
+                raise
+            log.warning("Falha transitória; nova tentativa", extra={"circuit": circuit.name, "error": str(e), "delay_s": round(delay, 2)})
+            time.sleep(delay)
+            attempt += 1
+            continue
+        circuit.record_success()
+        return result
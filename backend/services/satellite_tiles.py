@@ -0,0 +1,134 @@
+"""Divisão de imagens de satélite em blocos sobrepostos e combinação das contagens.
+
+A sobreposição garante que toda residência apareça inteira em pelo menos um bloco. Para
+não contar duas vezes o que está na faixa comum, cada bloco "possui" só o seu núcleo: a
+fronteira entre dois vizinhos fica no meio da sobreposição, e os núcleos particionam a
+imagem. Como o modelo devolve só o total do bloco, a parte do núcleo é estimada supondo
+densidade uniforme no bloco: contribuição = contagem × área do núcleo / área do bloco.
+"""
+
+import io
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+TILE_SIZE_PX = int(os.getenv("SATELLITE_TILE_SIZE_PX", "512"))
+TILE_OVERLAP_PX = int(os.getenv("SATELLITE_TILE_OVERLAP_PX", "64"))
+TILE_CONCURRENCY = int(os.getenv("SATELLITE_TILE_CONCURRENCY", "4"))
+# Limites para valores vindos da requisição
+MIN_TILE_SIZE_PX = 128
+MAX_TILES = int(os.getenv("SATELLITE_MAX_TILES", "64"))
+MAX_CONCURRENCY = int(os.getenv("SATELLITE_TILE_MAX_CONCURRENCY", "8"))
+
+
+@dataclass
+class Tile:
+    index: int
+    row: int
+    col: int
+    # Recorte enviado ao modelo (x0, y0, x1, y1), em pixels
+    box: Tuple[int, int, int, int]
+    # Parte da imagem atribuída a este bloco
+    core: Tuple[float, float, float, float]
+
+    @property
+    def weight(self) -> float:
+        x0, y0, x1, y1 = self.box
+        cx0, cy0, cx1, cy1 = self.core
+        return ((cx1 - cx0) * (cy1 - cy0)) / float((x1 - x0) * (y1 - y0))
+
+
+def _spans(length: int, size: int, overlap: int) -> List[Tuple[int, int, float, float]]:
+    """[(início, fim, início do núcleo, fim do núcleo)] ao longo de um eixo."""
+    if length <= size:
+        return [(0, length, 0.0, float(length))]
+    stride = size - overlap
+    starts = list(range(0, length - size, stride)) + [length - size]
+    spans = [(start, start + size) for start in starts]
+    # Fronteira entre vizinhos no meio da faixa comum
+    bounds = [0.0] + [(spans[i + 1][0] + spans[i][1]) / 2.0 for i in range(len(spans) - 1)] + [float(length)]
+    return [(start, end, bounds[i], bounds[i + 1]) for i, (start, end) in enumerate(spans)]
+
+
+def tile_size_px(size: Optional[int] = None) -> int:
+    return max(MIN_TILE_SIZE_PX, size or TILE_SIZE_PX)
+
+
+def overlap_px(size: int, overlap: Optional[int] = None) -> int:
+    overlap = TILE_OVERLAP_PX if overlap is None else overlap
+    return max(0, min(overlap, size // 2 - 1))
+
+
+def plan_tiles(width: int, height: int, size: Optional[int] = None, overlap: Optional[int] = None) -> List[Tile]:
+    size = tile_size_px(size)
+    overlap = overlap_px(size, overlap)
+    rows = _spans(height, size, overlap)
+    cols = _spans(width, size, overlap)
+    if len(rows) * len(cols) > MAX_TILES:
+        raise ValueError(
+            f"Imagem {width}x{height} geraria {len(rows) * len(cols)} blocos de {size}px (máximo {MAX_TILES}); aumente tile_size"
+        )
+    tiles: List[Tile] = []
+    for r, (y0, y1, cy0, cy1) in enumerate(rows):
+        for c, (x0, x1, cx0, cx1) in enumerate(cols):
+            tiles.append(Tile(len(tiles), r, c, (x0, y0, x1, y1), (cx0, cy0, cx1, cy1)))
+    return tiles
+
+
+def split_image(image_data: bytes, size: Optional[int] = None, overlap: Optional[int] = None) -> Tuple[List[Tile], List[bytes], Tuple[int, int]]:
+    """(blocos, PNG de cada bloco, (largura, altura) da imagem)."""
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.load()
+    except Exception as e:
+        raise ValueError(f"Imagem inválida: {e}")
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGB")
+    tiles = plan_tiles(image.width, image.height, size, overlap)
+    crops: List[bytes] = []
+    for tile in tiles:
+        buffer = io.BytesIO()
+        image.crop(tile.box).save(buffer, "PNG")
+        crops.append(buffer.getvalue())
+    return tiles, crops, (image.width, image.height)
+
+
+def merge_counts(tiles: List[Tile], results: List[Optional[Dict]]) -> Dict:
+    """Combina {residence_count, confidence} por bloco (None = bloco sem resultado).
+
+    Blocos que falharam têm a área do núcleo coberta pela densidade dos demais."""
+    per_tile = []
+    covered = total_core = contribution = confidence = 0.0
+    for tile, result in zip(tiles, results):
+        cx0, cy0, cx1, cy1 = tile.core
+        core_area = (cx1 - cx0) * (cy1 - cy0)
+        total_core += core_area
+        item = {
+            "index": tile.index,
+            "row": tile.row,
+            "col": tile.col,
+            "box": list(tile.box),
+            "weight": round(tile.weight, 4),
+            "residence_count": None,
+            "contribution": None,
+            "confidence": 0.0,
+        }
+        if result is not None:
+            part = result["residence_count"] * tile.weight
+            item.update(residence_count=result["residence_count"], contribution=round(part, 2), confidence=result["confidence"])
+            contribution += part
+            covered += core_area
+            confidence += result["confidence"] * core_area
+        per_tile.append(item)
+    coverage = covered / total_core if total_core else 0.0
+    return {
+        "residence_count": int(round(contribution / coverage)) if coverage else 0,
+        # Confiança média ponderada pela área, reduzida pela fração não analisada
+        "confidence": round(confidence / total_core, 2) if total_core else 0.0,
+        "coverage": round(coverage, 4),
+        "naive_sum": sum(item["residence_count"] or 0 for item in per_tile),
+        "tiles": per_tile,
+    }
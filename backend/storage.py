@@ -1,58 +1,239 @@
+"""Armazenamento de fotos e documentos.
+
+O banco guarda a *localização* de cada arquivo: um caminho local (STORAGE_BACKEND=local,
+o padrão) ou `s3://bucket/chave` (STORAGE_BACKEND=s3, ver backend/storage_s3.py). Com S3
+vários nós da API compartilham os arquivos; cada nó mantém cópias em STORAGE_DIR/cache do
+que precisa ler do disco (Gemini, hash perceptual, PDFs). Localizações locais antigas
+continuam legíveis com qualquer backend.
+"""
+
+import abc
+import hashlib
 import os
-from io import BytesIO
-from typing import List
+import shutil
+import uuid
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 import mimetypes
 
 from fastapi import UploadFile
 
+from backend.metrics import timed
+
 
 STORAGE_DIR = os.path.abspath(os.getenv("STORAGE_DIR", "./storage"))
 IMAGES_DIR = os.path.join(STORAGE_DIR, "images")
 DOCS_DIR = os.path.join(STORAGE_DIR, "documents")
+# Variantes reduzidas (JPEG) das fotos, usadas em relatórios; recriáveis a qualquer momento
+VARIANTS_DIR = os.path.join(STORAGE_DIR, "variants")
+# Cópias locais de objetos remotos; recriáveis a qualquer momento
+CACHE_DIR = os.path.join(STORAGE_DIR, "cache")
+
+# local | s3
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").strip().lower()
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class StorageBackend(abc.ABC):
+    """Driver de armazenamento. `key` é relativo à raiz (ex.: documents/12/Oficio_12.pdf)."""
+
+    @abc.abstractmethod
+    def handles(self, location: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def put_stream(self, fileobj: BinaryIO, key: str, content_type: Optional[str] = None) -> Tuple[str, str]:
+        """Grava o conteúdo de `fileobj` sem carregá-lo inteiro em memória.
+        Retorna (localização, caminho local com o mesmo conteúdo)."""
+
+    @abc.abstractmethod
+    def put_file(self, path: str, key: str, content_type: Optional[str] = None) -> str:
+        """Publica um arquivo local; retorna a localização."""
+
+    @abc.abstractmethod
+    def local_path(self, location: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    def size(self, location: str) -> Optional[int]:
+        ...
+
+    @abc.abstractmethod
+    def read(self, location: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Bytes de `start` a `end` (inclusive; None = até o fim), em blocos."""
+
+    def presigned_url(self, location: str, filename: str, mime: str) -> Optional[str]:
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def _path(self, key: str) -> str:
+        return os.path.join(STORAGE_DIR, *key.split("/"))
+
+    def handles(self, location: str) -> bool:
+        return "://" not in location
+
+    def put_stream(self, fileobj: BinaryIO, key: str, content_type: Optional[str] = None) -> Tuple[str, str]:
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as out:
+            shutil.copyfileobj(fileobj, out, READ_CHUNK_SIZE)
+        return dest, dest
+
+    def put_file(self, path: str, key: str, content_type: Optional[str] = None) -> str:
+        dest = self._path(key)
+        if os.path.abspath(path) != os.path.abspath(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(path, dest)
+        return dest
+
+    def local_path(self, location: str) -> Optional[str]:
+        return location if os.path.exists(location) else None
+
+    def size(self, location: str) -> Optional[int]:
+        try:
+            return os.path.getsize(location)
+        except OSError:
+            return None
+
+    def read(self, location: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with open(location, "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+
+_local = LocalStorage()
+_active: Optional[StorageBackend] = None
+
+
+def get_backend() -> StorageBackend:
+    global _active
+    if _active is None:
+        if STORAGE_BACKEND == "s3":
+            from backend.storage_s3 import S3Storage
+
+            _active = S3Storage()
+        elif STORAGE_BACKEND == "local":
+            _active = _local
+        else:
+            raise ValueError(f"STORAGE_BACKEND inválido: {STORAGE_BACKEND}")
+    return _active
+
+
+def backend_for(location: str) -> StorageBackend:
+    active = get_backend()
+    return active if active.handles(location) else _local
 
 
 def init_storage() -> None:
     os.makedirs(IMAGES_DIR, exist_ok=True)
     os.makedirs(DOCS_DIR, exist_ok=True)
+    get_backend()
 
 
 class SavedPath:
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, local_path: Optional[str] = None) -> None:
+        # Localização gravada no banco
         self.path = path
+        # Cópia local usada no processamento (igual a `path` no backend local)
+        self.local_path = local_path or path
 
 
 def save_upload_files(process_id: int, files: List[UploadFile]) -> List[SavedPath]:
     saved: List[SavedPath] = []
-    proc_dir = os.path.join(IMAGES_DIR, str(process_id))
-    os.makedirs(proc_dir, exist_ok=True)
-    for idx, f in enumerate(files):
-        ext = os.path.splitext(f.filename or "image")[1] or ".jpg"
-        dest = os.path.join(proc_dir, f"{idx}_{os.path.basename(f.filename or 'image')}")
-        with open(dest, "wb") as out:
-            out.write(f.file.read())
-        saved.append(SavedPath(dest))
+    backend = get_backend()
+    with timed("upload_write"):
+        for idx, f in enumerate(files):
+            key = f"images/{process_id}/{idx}_{os.path.basename(f.filename or 'image')}"
+            location, local = backend.put_stream(f.file, key, f.content_type)
+            saved.append(SavedPath(location, local))
     return saved
 
 
-def save_document(process_id: int, filename: str, content: bytes) -> str:
+def document_path(process_id: int, filename: str) -> str:
+    """Caminho local onde o documento é montado antes de `publish_document`."""
     proc_dir = os.path.join(DOCS_DIR, str(process_id))
     os.makedirs(proc_dir, exist_ok=True)
-    path = os.path.join(proc_dir, filename)
+    return os.path.join(proc_dir, filename)
+
+
+def publish_document(process_id: int, path: str) -> str:
+    filename = os.path.basename(path)
+    return get_backend().put_file(path, f"documents/{process_id}/{filename}", guess_mime(filename))
+
+
+def save_document(process_id: int, filename: str, content: bytes) -> str:
+    path = document_path(process_id, filename)
     with open(path, "wb") as f:
         f.write(content)
-    return path
+    return publish_document(process_id, path)
 
 
-def open_document_stream(path: str):
-    filename = os.path.basename(path)
-    mime, _ = mimetypes.guess_type(path)
+def local_path(location: str) -> Optional[str]:
+    """Arquivo local com o conteúdo de `location` (baixado para o cache se remoto)."""
+    if not location:
+        return None
+    return backend_for(location).local_path(location)
+
+
+def file_size(location: str) -> Optional[int]:
+    return backend_for(location).size(location)
+
+
+def guess_mime(location: str) -> str:
+    mime, _ = mimetypes.guess_type(location)
     if not mime:
         # heurística simples para PDF; senão, binário genérico
-        if path.lower().endswith(".pdf"):
+        if location.lower().endswith(".pdf"):
             mime = "application/pdf"
         else:
             mime = "application/octet-stream"
-    stream = open(path, "rb")
-    return stream, mime, filename
+    return mime
+
+
+def presigned_url(location: str) -> Optional[str]:
+    """URL temporária de download direto do storage, ou None se o backend não tiver."""
+    return backend_for(location).presigned_url(location, os.path.basename(location), guess_mime(location))
+
+
+def open_document_stream(location: str, start: int = 0, end: Optional[int] = None):
+    backend = backend_for(location)
+    if backend.size(location) is None:
+        raise FileNotFoundError(location)
+    return backend.read(location, start, end), guess_mime(location), os.path.basename(location)
 
 
+def image_variant(path: str, max_px: int, quality: int) -> Optional[Tuple[str, int, int]]:
+    """JPEG com o maior lado limitado a `max_px`, gerado uma vez e reaproveitado enquanto o
+    original não mudar. Retorna (caminho, largura, altura) ou None se a imagem não abrir."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    digest = hashlib.sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8")).hexdigest()[:20]
+    dest = os.path.join(VARIANTS_DIR, digest[:2], f"{digest}_{max_px}_{quality}.jpg")
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    if os.path.exists(dest):
+        with Image.open(dest) as cached:
+            return dest, cached.width, cached.height
+    try:
+        with timed("image_variant"):
+            with Image.open(path) as img:
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                img.thumbnail((max_px, max_px))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+                img.save(tmp, "JPEG", quality=quality, optimize=True, progressive=False)
+                os.replace(tmp, dest)
+                return dest, img.width, img.height
+    except Exception:
+        return None
@@ -0,0 +1,193 @@
+"""Driver S3 do armazenamento (AWS S3, MinIO ou qualquer serviço compatível).
+
+    STORAGE_BACKEND=s3 S3_BUCKET=climaseguro S3_ENDPOINT_URL=http://minio:9000 \\
+    S3_ACCESS_KEY_ID=... S3_SECRET_ACCESS_KEY=...
+
+Uploads vão em partes (multipart) direto do arquivo recebido, sem carregar a foto inteira
+em memória; leituras parciais usam o cabeçalho Range do S3. O cliente boto3 é criado uma
+vez por processo e reaproveita as conexões (pool de S3_MAX_POOL_CONNECTIONS).
+
+Para verificar contra um MinIO (ou o servidor simulado do moto): `python -m backend.bench.s3_check`.
+"""
+
+import functools
+import os
+import uuid
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from backend import logs
+from backend.metrics import timed
+from backend.storage import CACHE_DIR, READ_CHUNK_SIZE, StorageBackend
+
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+# Vazio = AWS; para MinIO e afins, a URL do serviço (endereçamento por caminho)
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "") or None
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "") or None
+# Prefixo das chaves dentro do bucket (ex.: "prod/")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_MULTIPART_THRESHOLD_MB = float(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))
+S3_MULTIPART_CHUNK_MB = float(os.getenv("S3_MULTIPART_CHUNK_MB", "8"))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+S3_PRESIGN_TTL_S = int(os.getenv("S3_PRESIGN_TTL_S", "900"))
+
+log = logs.get_logger("storage_s3")
+
+
+@functools.lru_cache(maxsize=None)
+def _client():
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={"max_attempts": 5, "mode": "standard"},
+        s3={"addressing_style": "path" if S3_ENDPOINT_URL else "auto"},
+    )
+    return boto3.client(
+        "s3",
+        endpoint_url=S3_ENDPOINT_URL,
+        region_name=S3_REGION,
+        aws_access_key_id=S3_ACCESS_KEY_ID,
+        aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+        config=config,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=int(S3_MULTIPART_THRESHOLD_MB * 1024 * 1024),
+        multipart_chunksize=int(S3_MULTIPART_CHUNK_MB * 1024 * 1024),
+        max_concurrency=max(1, S3_UPLOAD_CONCURRENCY),
+    )
+
+
+def _is_not_found(error) -> bool:
+    code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class _Tee:
+    """Leitor que copia para `sink` tudo o que o upload consome de `source`."""
+
+    def __init__(self, source: BinaryIO, sink: BinaryIO) -> None:
+        self._source = source
+        self._sink = sink
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._source.read(size)
+        if data:
+            self._sink.write(data)
+        return data
+
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX) -> None:
+        if not bucket:
+            raise ValueError("S3_BUCKET é obrigatório com STORAGE_BACKEND=s3")
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+    @staticmethod
+    def _split(location: str) -> Tuple[str, str]:
+        bucket, _, key = location[len("s3://"):].partition("/")
+        return bucket, key
+
+    @staticmethod
+    def _cache_path(bucket: str, key: str) -> str:
+        return os.path.join(CACHE_DIR, bucket, *key.split("/"))
+
+    def handles(self, location: str) -> bool:
+        return location.startswith("s3://")
+
+    def put_stream(self, fileobj: BinaryIO, key: str, content_type: Optional[str] = None) -> Tuple[str, str]:
+        location = self._location(key)
+        bucket, full_key = self._split(location)
+        cached = self._cache_path(bucket, full_key)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp = f"{cached}.{uuid.uuid4().hex}.tmp"
+        extra = {"ContentType": content_type} if content_type else None
+        try:
+            with timed("s3_upload"), open(tmp, "wb") as sink:
+                # Com max_concurrency > 1 o boto3 lê as partes em sequência e só envia em
+                # paralelo, então a cópia local sai na ordem certa
+                _client().upload_fileobj(_Tee(fileobj, sink), bucket, full_key, ExtraArgs=extra, Config=_transfer_config())
+            os.replace(tmp, cached)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return location, cached
+
+    def put_file(self, path: str, key: str, content_type: Optional[str] = None) -> str:
+        location = self._location(key)
+        bucket, full_key = self._split(location)
+        extra = {"ContentType": content_type} if content_type else None
+        with timed("s3_upload"):
+            _client().upload_file(path, bucket, full_key, ExtraArgs=extra, Config=_transfer_config())
+        cached = self._cache_path(bucket, full_key)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        os.replace(path, cached)
+        return location
+
+    def local_path(self, location: str) -> Optional[str]:
+        bucket, key = self._split(location)
+        cached = self._cache_path(bucket, key)
+        if os.path.exists(cached):
+            return cached
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp = f"{cached}.{uuid.uuid4().hex}.tmp"
+        try:
+            with timed("s3_download"):
+                _client().download_file(bucket, key, tmp, Config=_transfer_config())
+            os.replace(tmp, cached)
+        except Exception as e:
+            if not _is_not_found(e):
+                log.warning("Falha ao baixar objeto do S3", extra={"location": location, "error": str(e)})
+            return None
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return cached
+
+    def size(self, location: str) -> Optional[int]:
+        bucket, key = self._split(location)
+        try:
+            return int(_client().head_object(Bucket=bucket, Key=key)["ContentLength"])
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+
+    def read(self, location: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        bucket, key = self._split(location)
+        params = {"Bucket": bucket, "Key": key}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = _client().get_object(**params)["Body"]
+        try:
+            for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    def presigned_url(self, location: str, filename: str, mime: str) -> Optional[str]:
+        bucket, key = self._split(location)
+        return _client().generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": bucket,
+                "Key": key,
+                "ResponseContentType": mime,
+                "ResponseContentDisposition": f'inline; filename="{filename}"',
+            },
+            ExpiresIn=S3_PRESIGN_TTL_S,
+        )
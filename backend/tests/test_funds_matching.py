@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+from backend.funds.matching import _level_from_zone, level_key
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_level_key_spellings():
+    assert level_key("Muito Alto") == "muitoalto"
+    assert level_key("MUITO_ALTO") == "muitoalto"
+    assert level_key("Risco Alto") == "alto"
+    assert level_key("MODERADO") == "medio"
+    assert level_key(None) == ""
+
+
+def test_level_from_zone_uses_level_before_score():
+    assert _level_from_zone({"level": "Muito Alto", "score": 10}) == "muitoalto"
+    assert _level_from_zone({"risk_level": "MUITO_ALTO"}) == "muitoalto"
+    assert _level_from_zone({"level": "Risco Alto"}) == "alto"
+    assert _level_from_zone({"score": 0.8}) == "muitoalto"
+
+
+def test_level_key_independent_of_hash_seed():
+    code = (
+        "from backend.funds.matching import level_key;"
+        "print(level_key('Muito Alto'), level_key('MUITO_ALTO'), level_key('Risco Alto'))"
+    )
+    for seed in range(1, 7):
+        env = dict(os.environ, PYTHONHASHSEED=str(seed))
+        out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+        assert out.stdout.split() == ["muitoalto", "muitoalto", "alto"], f"PYTHONHASHSEED={seed}"
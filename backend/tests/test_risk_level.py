@@ -0,0 +1,14 @@
+from backend.models import PreventionProcess
+
+
+def test_risk_level_of_stores_canonical_form():
+    for level in ("Muito Alto", "MUITO_ALTO", "Risco Muito Alto", "muito-alto"):
+        assert PreventionProcess.risk_level_of({"zone": {"level": level}}) == "muitoalto"
+    assert PreventionProcess.risk_level_of({"zone": {"level": "MODERADO"}}) == "medio"
+
+
+def test_risk_level_of_without_level():
+    assert PreventionProcess.risk_level_of({}) is None
+    assert PreventionProcess.risk_level_of({"zone": {}}) is None
+    assert PreventionProcess.risk_level_of({"zone": {"level": "Risco"}}) is None
+    assert PreventionProcess.risk_level_of(None) is None
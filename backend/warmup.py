@@ -0,0 +1,151 @@
+"""Aquecimento do servidor em segundo plano e diagnóstico do tempo de import.
+
+Os pacotes pesados (google.generativeai, fpdf, jinja2) são importados sob demanda. Com
+WARMUP_ON_STARTUP habilitado (padrão), uma thread os carrega logo após a inicialização,
+junto com templates, catálogo de fundos, fontes do PDF e lista de modelos, sem atrasar
+o momento em que o servidor passa a aceitar requisições.
+
+    python -m backend.warmup            # tempo de import por pacote (python -X importtime)
+    python -m backend.warmup --tasks    # duração de cada etapa do aquecimento
+"""
+
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+from backend import logs
+
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in {"1", "true", "yes"}
+
+_status: Dict[str, object] = {"state": "idle", "tasks": {}}
+_lock = threading.Lock()
+
+log = logs.get_logger("warmup")
+
+
+def _templates() -> None:
+    from backend.services.doc_gen import TEMPLATES_ROOT, template_env
+
+    env = template_env()
+    for dirpath, _, filenames in os.walk(TEMPLATES_ROOT):
+        for name in filenames:
+            if name.endswith(".j2"):
+                rel = os.path.relpath(os.path.join(dirpath, name), TEMPLATES_ROOT).replace(os.sep, "/")
+                env.get_template(rel)
+
+
+def _fund_catalogue() -> None:
+    from backend.funds import loader
+
+    loader.get_catalog()
+    loader.get_match_index()
+
+
+def _pdf_fonts() -> None:
+    from backend.pdf_renderer import build_pdf_bytes
+
+    # Um PDF mínimo carrega fpdf e as métricas das fontes core usadas nos documentos
+    build_pdf_bytes("aquecimento", ["ok"])
+
+
+def _model_registry() -> None:
+    from backend.services import gemini
+
+    gemini._genai()
+    if os.getenv("GEMINI_API_KEY"):
+        gemini._pick_text_model()
+
+
+TASKS: List[Tuple[str, Callable[[], None]]] = [
+    ("templates", _templates),
+    ("fund_catalogue", _fund_catalogue),
+    ("pdf_fonts", _pdf_fonts),
+    ("model_registry", _model_registry),
+]
+
+
+def run() -> Dict[str, object]:
+    """Executa as etapas em sequência; falhas são registradas e não interrompem as demais."""
+    with _lock:
+        _status["state"] = "running"
+    started = time.perf_counter()
+    for name, task in TASKS:
+        start = time.perf_counter()
+        try:
+            task()
+            result = {"ok": True}
+        except Exception as e:
+            log.warning("Falha no aquecimento", extra={"task": name, "error": str(e)})
+            result = {"ok": False, "error": str(e)}
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        with _lock:
+            _status["tasks"][name] = result
+    with _lock:
+        _status["state"] = "done"
+        _status["seconds"] = round(time.perf_counter() - started, 4)
+    log.info("Aquecimento concluído", extra={"seconds": _status["seconds"]})
+    return status()
+
+
+def start_background() -> None:
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=run, name="warmup", daemon=True).start()
+
+
+def status() -> Dict[str, object]:
+    with _lock:
+        return {**_status, "tasks": dict(_status["tasks"])}
+
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+def import_breakdown(module: str = "backend.main") -> List[Tuple[str, float, float]]:
+    """Roda `python -X importtime -c "import <module>"` e agrega por pacote de topo:
+    [(pacote, tempo próprio em ms, tempo cumulativo em ms)], do mais lento para o mais rápido."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    self_us: Dict[str, int] = defaultdict(int)
+    cumulative_us: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        own, cumulative, name = int(match.group(1)), int(match.group(2)), match.group(3)
+        top = name.split(".")[0] if not name.startswith("backend") else ".".join(name.split(".")[:3])
+        self_us[top] += own
+        # O cumulativo da linha do próprio pacote já inclui submódulos e dependências
+        if name == top:
+            cumulative_us[top] = cumulative
+    if proc.returncode != 0:
+        print(proc.stderr.splitlines()[-1] if proc.stderr else f"import {module} falhou")
+    rows = [(name, self_us[name] / 1000.0, cumulative_us.get(name, 0) / 1000.0) for name in self_us]
+    return sorted(rows, key=lambda r: r[1], reverse=True)
+
+
+def main(argv: List[str]) -> int:
+    if "--tasks" in argv:
+        result = run()
+        for name, item in result["tasks"].items():
+            print(f"{name:<18}{item['seconds'] * 1000:>10.1f} ms  {'ok' if item['ok'] else item['error']}")
+        return 0
+    module = next((a for a in argv if not a.startswith("-")), "backend.main")
+    rows = import_breakdown(module)
+    total = sum(r[1] for r in rows)
+    print(f"Import de {module}: {total:.1f} ms\n")
+    print(f"{'pacote':<40}{'próprio ms':>12}{'cumulativo ms':>15}")
+    for name, own, cumulative in rows[:25]:
+        print(f"{name:<40}{own:>12.1f}{cumulative:>15.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))